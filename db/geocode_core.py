@@ -0,0 +1,511 @@
+"""
+Shared facility geocoding code for geocode_facilities.py and
+geocode_facilities_test.py
+
+- Fills defaulted facilities from located peers in the same city/state
+- Streams the rest from a server-side cursor
+- Geocodes full address and city/state concurrently via Nominatim (aiohttp),
+  rate limited, de-duplicated and cached on disk
+- Writes coordinates back in batched UPDATEs on a connection pool
+- Geometry (geom) automatically updates via trigger
+
+Requests run concurrently (GEOCODE_CONCURRENCY) but are spaced
+NOMINATIM_RATE_LIMIT seconds apart, so the public endpoint still sees
+~1 req/s. Point NOMINATIM_URL at a self-hosted instance and lower the
+rate limit to go faster.
+"""
+
+import asyncio
+import logging
+import logging.handlers
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+import time
+import aiohttp
+import sqlite3
+import sys
+import os
+
+# Database connection parameters
+DB_HOST = os.getenv('POSTGRES_HOST', '172.28.0.10')
+DB_PORT = os.getenv('POSTGRES_PORT', '5432')
+DB_NAME = os.getenv('POSTGRES_DB', 'aginfo')
+DB_USER = os.getenv('POSTGRES_USER', 'agadmin')
+DB_PASSWORD = os.getenv('POSTGRES_PASSWORD', 'changeme')
+
+NOMINATIM_URL = os.getenv('NOMINATIM_URL', "https://nominatim.openstreetmap.org/search")
+NOMINATIM_RATE_LIMIT = float(os.getenv('NOMINATIM_RATE_LIMIT', '1.0'))  # Seconds between requests
+NOMINATIM_MAX_ATTEMPTS = 3  # Tries per query when the server answers 429
+GEOCODE_CONCURRENCY = int(os.getenv('GEOCODE_CONCURRENCY', '4'))  # Requests in flight at once
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))  # Connections available for concurrent updates
+DB_BATCH_SIZE = int(os.getenv('DB_BATCH_SIZE', '100'))  # Facilities per batched UPDATE
+FETCH_SIZE = 200  # Facilities per round-trip from the server-side cursor
+GEOCODE_CACHE_PATH = os.getenv(
+    'GEOCODE_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'geocode_cache.sqlite')
+)
+
+# Default coordinates (center of Kansas) - facilities with these need geocoding
+DEFAULT_LAT = 38.5000
+DEFAULT_LON = -98.0000
+
+LOG_BUFFER_SIZE = 100  # Progress lines held before a write
+LOG_FLUSH_INTERVAL = 2.0  # ...or seconds since the last write, whichever comes first
+
+logger = logging.getLogger('geocode_facilities')
+
+
+class TimedMemoryHandler(logging.handlers.MemoryHandler):
+    """MemoryHandler that also flushes once `interval` seconds have passed"""
+
+    def __init__(self, capacity, interval, **kwargs):
+        super().__init__(capacity, **kwargs)
+        self.interval = interval
+        self._last_flush = time.monotonic()
+
+    def shouldFlush(self, record):
+        return (super().shouldFlush(record)
+                or time.monotonic() - self._last_flush >= self.interval)
+
+    def flush(self):
+        super().flush()
+        self._last_flush = time.monotonic()
+
+
+def setup_logging():
+    """Send log output to stdout through a buffer
+
+    Concurrent geocode tasks emit a progress line each; buffering turns
+    those into one write() per batch. Errors flush the buffer immediately.
+    """
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(TimedMemoryHandler(
+        LOG_BUFFER_SIZE, LOG_FLUSH_INTERVAL, flushLevel=logging.ERROR, target=stream
+    ))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class RateLimiter:
+    """Space request starts at least `interval` seconds apart across all tasks
+
+    Only call wait() right before a real HTTP request. After an HTTP 429,
+    backoff() doubles the spacing; it drops back to the base interval once
+    `cooldown` seconds pass without another 429.
+    """
+
+    def __init__(self, interval, cooldown=60.0, max_interval=30.0):
+        self.base_interval = interval
+        self.interval = interval
+        self.cooldown = cooldown
+        self.max_interval = max_interval
+        self._next = 0.0
+        self._cooldown_until = 0.0
+
+    def backoff(self):
+        now = time.monotonic()
+        self.interval = min(max(self.interval * 2, 1.0), self.max_interval)
+        self._cooldown_until = now + self.cooldown
+        self._next = max(self._next, now + self.interval)
+
+    async def wait(self):
+        now = time.monotonic()
+        if self.interval != self.base_interval and now >= self._cooldown_until:
+            self.interval = self.base_interval
+        delay = self._next - now
+        self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class GeocodeCache:
+    """Query -> (lat, lon) cache kept in memory and persisted to SQLite
+
+    Queries Nominatim had no match for are stored as (None, None) so reruns
+    skip them too. Request errors are never cached.
+    """
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS geocode (query TEXT PRIMARY KEY, lat REAL, lon REAL)"
+        )
+        self._memory = {}
+
+    @staticmethod
+    def normalize(query):
+        return " ".join(query.lower().split())
+
+    def get(self, query):
+        """Return (found, coords) for a query"""
+        key = self.normalize(query)
+        if key not in self._memory:
+            row = self._db.execute(
+                "SELECT lat, lon FROM geocode WHERE query = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return False, None
+            self._memory[key] = (row[0], row[1]) if row[0] is not None else None
+        return True, self._memory[key]
+
+    def put(self, query, coords):
+        key = self.normalize(query)
+        self._memory[key] = coords
+        lat, lon = coords if coords else (None, None)
+        self._db.execute(
+            "INSERT OR REPLACE INTO geocode (query, lat, lon) VALUES (?, ?, ?)", (key, lat, lon)
+        )
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+def build_query(address=None, city=None, state=None, zip_code=None):
+    """Join the non-empty address parts into a single Nominatim query"""
+    query_parts = []
+    if address and address.strip():
+        query_parts.append(address.strip())
+    if city and city.strip():
+        query_parts.append(city.strip())
+    if state and state.strip():
+        query_parts.append(state.strip())
+    if zip_code and zip_code.strip():
+        query_parts.append(zip_code.strip())
+    return ", ".join(query_parts)
+
+
+async def geocode_address_async(session, limiter, cache, address=None, city=None, state=None,
+                                zip_code=None):
+    """Geocode an address using Nominatim API, consulting the cache first"""
+    query = build_query(address, city, state, zip_code)
+    if not query:
+        return None
+    
+    found, coords = cache.get(query)
+    if found:
+        return coords
+    
+    try:
+        params = {
+            'q': query,
+            'format': 'json',
+            'limit': 1,
+            'countrycodes': 'us',
+            'addressdetails': 1
+        }
+        for attempt in range(NOMINATIM_MAX_ATTEMPTS):
+            await limiter.wait()
+            async with session.get(NOMINATIM_URL, params=params) as response:
+                if response.status == 429 and attempt + 1 < NOMINATIM_MAX_ATTEMPTS:
+                    limiter.backoff()
+                    continue
+                response.raise_for_status()
+                data = await response.json()
+                break
+        coords = (float(data[0]['lat']), float(data[0]['lon'])) if data else None
+        cache.put(query, coords)
+        return coords
+    except Exception as e:
+        logger.error(f"  Error geocoding '{query}': {e}")
+    return None
+
+
+async def geocode_all(facilities, total, pool):
+    """Geocode all facilities concurrently and write results back in batches
+
+    facilities is an async iterable of facility dicts (see
+    iter_pending_facilities); total is only used for progress output.
+
+    Each facility's full address and its city/state fallback are requested
+    at the same time, and every distinct query is requested at most once,
+    so a town's fallback is shared by all facilities in it.
+
+    Every DB_BATCH_SIZE successful geocodes are flushed as one UPDATE on a
+    small thread pool sized to the connection pool, so commits overlap with
+    the remaining HTTP requests.
+    Returns (success_count, fail_count).
+    """
+    semaphore = asyncio.Semaphore(GEOCODE_CONCURRENCY)
+    limiter = RateLimiter(NOMINATIM_RATE_LIMIT)
+    headers = {'User-Agent': 'AgInfo Geocoding Script'}
+    timeout = aiohttp.ClientTimeout(total=10)
+    loop = asyncio.get_running_loop()
+    done = 0
+    success_count = 0
+    fail_count = 0
+    writes = []
+    pending = []
+
+    def record(facility, coords, method):
+        nonlocal done, fail_count, pending
+        done += 1
+        city = facility['city'] or 'Unknown'
+        state = facility['state'] or 'Unknown'
+        if not coords:
+            logger.info(f"[{done}/{total}] {facility['name']}, {city}, {state}: ✗ Failed")
+            fail_count += 1
+            return
+        lat, lon = coords
+        logger.info(f"[{done}/{total}] {facility['name']}, {city}, {state}: "
+              f"✓ {method} ({lat:.6f}, {lon:.6f})")
+        pending.append((facility['facility_id'], lat, lon))
+        if len(pending) >= DB_BATCH_SIZE:
+            writes.append(loop.run_in_executor(
+                writer, update_facility_coordinates_batch, pool, pending
+            ))
+            pending = []
+
+    with ThreadPoolExecutor(max_workers=DB_POOL_SIZE) as writer, \
+            closing(GeocodeCache(GEOCODE_CACHE_PATH)) as cache:
+        async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
+            lookups = {}
+
+            async def bound_geocode(address, city, state, zip_code):
+                async with semaphore:
+                    return await geocode_address_async(
+                        session, limiter, cache, address, city, state, zip_code
+                    )
+
+            def lookup(address, city, state, zip_code):
+                """Shared task per distinct query, so each is requested at most once"""
+                key = cache.normalize(build_query(address, city, state, zip_code))
+                if key not in lookups:
+                    lookups[key] = asyncio.create_task(
+                        bound_geocode(address, city, state, zip_code)
+                    )
+                return lookups[key]
+
+            async def geocode_facility(facility):
+                address = facility['address_line1']
+                city = facility['city']
+                state = facility['state']
+                # Start both attempts at once; the city/state one is shared
+                # with every other facility in the same town
+                full = None
+                if address and address.strip():
+                    full = lookup(address, city, state, facility['postal_code'])
+                fallback = lookup(None, city, state, None) if city and state else None
+                if full and await full:
+                    return facility, full.result(), "Full address"
+                if fallback and await fallback:
+                    return facility, fallback.result(), "City/state"
+                return facility, None, None
+
+            # Facilities are streamed in; the slots cap how many are held in
+            # memory, which also pauses the server-side cursor when we fall behind
+            slots = asyncio.Semaphore(FETCH_SIZE * 2)
+            tasks = set()
+
+            def finished(task):
+                tasks.discard(task)
+                slots.release()
+                record(*task.result())
+
+            async for facility in facilities:
+                await slots.acquire()
+                task = asyncio.create_task(geocode_facility(facility))
+                task.add_done_callback(finished)
+                tasks.add(task)
+            while tasks:
+                await asyncio.wait(tasks)
+
+        if pending:
+            writes.append(loop.run_in_executor(
+                writer, update_facility_coordinates_batch, pool, pending
+            ))
+        for updated, failed in await asyncio.gather(*writes):
+            success_count += updated
+            fail_count += failed
+
+    return success_count, fail_count
+
+
+PENDING_FACILITIES_SQL = """
+    FROM facility
+    WHERE notes LIKE '%%KGFA%%'
+      AND latitude = %s
+      AND longitude = %s
+"""
+
+
+def count_pending_facilities(pool, limit=None):
+    """Number of facilities still at the default location (capped at limit)"""
+    conn = pool.getconn()
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute("SELECT count(*) " + PENDING_FACILITIES_SQL, (DEFAULT_LAT, DEFAULT_LON))
+            count = cursor.fetchone()[0]
+    finally:
+        pool.putconn(conn)
+    return min(count, limit) if limit is not None else count
+
+
+async def iter_pending_facilities(pool, limit=None):
+    """Yield facilities still at the default location from a server-side cursor
+
+    Rows arrive FETCH_SIZE at a time as RealDictRows, fetched off the event
+    loop, so geocoding starts with the first batch and memory stays bounded.
+    """
+    loop = asyncio.get_running_loop()
+    sql = """
+        SELECT facility_id, name, address_line1, city, state, postal_code
+    """ + PENDING_FACILITIES_SQL + """
+        ORDER BY state, city, name
+    """
+    params = [DEFAULT_LAT, DEFAULT_LON]
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+
+    conn = pool.getconn()
+    try:
+        with conn, conn.cursor(name='pending_facilities', cursor_factory=RealDictCursor) as cursor:
+            cursor.itersize = FETCH_SIZE
+            cursor.execute(sql, params)
+            while True:
+                rows = await loop.run_in_executor(None, cursor.fetchmany, FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+    finally:
+        pool.putconn(conn)
+
+
+def update_facility_coordinates(conn, facility_id, lat, lon):
+    """Update a single facility's coordinates (commits on success)"""
+    with conn, conn.cursor() as cursor:
+        cursor.execute(
+            "UPDATE facility SET latitude = %s, longitude = %s WHERE facility_id = %s",
+            (lat, lon, facility_id)
+        )
+
+
+def update_facility_coordinates_batch(pool, rows):
+    """Update many facilities in one statement and one commit
+
+    rows is a list of (facility_id, lat, lon). If the batch fails, each row
+    is retried on its own so one bad row doesn't lose the rest.
+    Returns (updated_count, failed_count).
+    """
+    conn = pool.getconn()
+    try:
+        try:
+            # Commits on success, rolls back on exception
+            with conn, conn.cursor() as cursor:
+                execute_values(cursor, """
+                    UPDATE facility AS f
+                    SET latitude = v.lat, longitude = v.lon
+                    FROM (VALUES %s) AS v(facility_id, lat, lon)
+                    WHERE f.facility_id = v.facility_id
+                """, rows, template="(%s, %s::double precision, %s::double precision)",
+                    page_size=500)
+            return len(rows), 0
+        except Exception as e:
+            logger.error(f"  Batch update of {len(rows)} facilities failed ({e}), "
+                         f"retrying one by one")
+
+        updated = 0
+        for facility_id, lat, lon in rows:
+            try:
+                update_facility_coordinates(conn, facility_id, lat, lon)
+                updated += 1
+            except Exception as e:
+                logger.error(f"  Error updating facility {facility_id}: {e}")
+        return updated, len(rows) - updated
+    finally:
+        pool.putconn(conn)
+
+
+def fill_from_located_peers(pool):
+    """Give defaulted facilities the centroid of located peers in the same city/state
+
+    One set-based UPDATE inside Postgres, run before any HTTP request, so only
+    facilities in towns with no located peer are left for Nominatim.
+    Returns the number of facilities filled.
+    """
+    conn = pool.getconn()
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE facility AS d
+                SET latitude = s.latitude, longitude = s.longitude
+                FROM (
+                    SELECT upper(trim(city)) AS city, upper(trim(state)) AS state,
+                           round(avg(latitude), 6) AS latitude,
+                           round(avg(longitude), 6) AS longitude
+                    FROM facility
+                    WHERE city IS NOT NULL AND state IS NOT NULL
+                      AND NOT (latitude = %(lat)s AND longitude = %(lon)s)
+                    GROUP BY 1, 2
+                ) AS s
+                WHERE d.notes LIKE '%%KGFA%%'
+                  AND d.latitude = %(lat)s
+                  AND d.longitude = %(lon)s
+                  AND upper(trim(d.city)) = s.city
+                  AND upper(trim(d.state)) = s.state
+            """, {'lat': DEFAULT_LAT, 'lon': DEFAULT_LON})
+            return cursor.rowcount
+    finally:
+        pool.putconn(conn)
+
+
+def connect_pool():
+    """Connection pool sized for the batch writers plus the streaming read cursor"""
+    return ThreadedConnectionPool(
+        1,
+        DB_POOL_SIZE + 1,
+        host=DB_HOST,
+        port=DB_PORT,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD
+    )
+
+
+async def run(limit=None, fill_from_peers=True):
+    """Geocode facilities still at the default location (at most `limit`)
+
+    Returns (total, success_count, fail_count).
+    """
+    try:
+        pool = connect_pool()
+    except Exception as e:
+        logger.error(f"Error connecting to database: {e}")
+        raise
+    
+    try:
+        if fill_from_peers:
+            filled = fill_from_located_peers(pool)
+            logger.info(f"Filled {filled} facilities from located facilities in the same city/state")
+        
+        total = count_pending_facilities(pool, limit)
+        logger.info(f"Found {total} facilities needing geocoding")
+        logger.info("")
+        
+        if total == 0:
+            logger.info("No facilities need geocoding!")
+            return 0, 0, 0
+        
+        logger.info(f"Geocoding with up to {GEOCODE_CONCURRENCY} concurrent requests "
+                    f"({NOMINATIM_RATE_LIMIT:g}s between requests)")
+        logger.info("")
+        success_count, fail_count = await geocode_all(
+            iter_pending_facilities(pool, limit), total, pool
+        )
+        logger.info("")
+        
+        # Summary
+        logger.info("=" * 60)
+        logger.info("Geocoding Summary:")
+        logger.info(f"  Total processed: {total}")
+        logger.info(f"  Successfully geocoded: {success_count}")
+        logger.info(f"  Failed: {fail_count}")
+        logger.info("=" * 60)
+        return total, success_count, fail_count
+    finally:
+        pool.closeall()
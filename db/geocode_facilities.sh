@@ -41,9 +41,14 @@ docker run --rm \
     -e POSTGRES_DB="${DB_NAME}" \
     -e POSTGRES_USER="${DB_USER}" \
     -e POSTGRES_PASSWORD="${DB_PASSWORD}" \
+    -e NOMINATIM_URL \
+    -e NOMINATIM_RATE_LIMIT \
+    -e GEOCODE_CONCURRENCY \
+    -e DB_POOL_SIZE \
+    -e DB_BATCH_SIZE \
     python:3.11-slim \
     sh -c "
-        pip install -q psycopg2-binary requests && \
+        pip install -q psycopg2-binary aiohttp && \
         python3 geocode_facilities.py
     "
 
@@ -0,0 +1,13 @@
+-- Partial index for db/geocode_facilities.py: KGFA facilities still sitting at the
+-- default centre-of-Kansas coordinate (38.5, -98.0).
+-- The unanchored LIKE '%KGFA%' can't use a btree on notes, so the predicate lives in
+-- the index definition instead. Keyed on the script's ORDER BY so the streaming
+-- cursor reads rows in index order without a sort; rows drop out of the index as
+-- soon as they are geocoded, so it stays tiny.
+-- On a live database build it without blocking writes:
+--   CREATE INDEX CONCURRENTLY IF NOT EXISTS facility_kgfa_default_idx ...
+CREATE INDEX IF NOT EXISTS facility_kgfa_default_idx
+    ON facility (state, city, name)
+    WHERE notes LIKE '%KGFA%'
+      AND latitude = 38.500000
+      AND longitude = -98.000000;
@@ -0,0 +1,52 @@
+-- Pre-normalized match keys for db/tools/merg_duplicates.py.
+-- normalize_cr mirrors clean_street() and normalize_company_name_key mirrors
+-- normalize_company_name() in that script (and in merge_companies_only.py, which
+-- groups on company.name_norm too); keep them in step if either changes.
+-- Stored generated columns pay the regex cost once per write, so the merge script
+-- can GROUP BY them instead of normalizing every row in Python on every run.
+
+CREATE OR REPLACE FUNCTION normalize_cr(s TEXT)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE
+        WHEN lower(btrim(regexp_replace(COALESCE(s, ''), '\s+', ' ', 'g')))
+             IN ('', 'n/a', 'na', 'none', 'unknown', 'null', '-', '--') THEN ''
+        ELSE btrim(regexp_replace(
+            regexp_replace(
+            regexp_replace(
+            regexp_replace(
+            regexp_replace(btrim(regexp_replace(s, '\s+', ' ', 'g')),
+                '\yC\.?\s*R\.?\y', 'County Road', 'gi'),
+                '\yCo\.?\s*Rd\.?\y', 'County Road', 'gi'),
+                '\yCty\.?\s*Rd\.?\y', 'County Road', 'gi'),
+                '\yCounty\s+Rd\y', 'County Road', 'gi'),
+            '\s+', ' ', 'g'))
+    END
+$$;
+
+CREATE OR REPLACE FUNCTION normalize_company_name_key(s TEXT)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT COALESCE(string_agg(w, ' ' ORDER BY n), '')
+    FROM regexp_split_to_table(
+             regexp_replace(lower(btrim(regexp_replace(COALESCE(s, ''), '\s+', ' ', 'g'))),
+                            '[^\w\s&-]', '', 'g'),
+             '\s+') WITH ORDINALITY AS t(w, n)
+    WHERE w <> ''
+      AND w NOT IN ('inc', 'incorporated', 'corp', 'corporation', 'llc', 'ltd', 'co', 'company')
+$$;
+
+ALTER TABLE facility
+    ADD COLUMN IF NOT EXISTS address_line1_norm TEXT
+    GENERATED ALWAYS AS (normalize_cr(address_line1)) STORED;
+
+ALTER TABLE company
+    ADD COLUMN IF NOT EXISTS name_norm TEXT
+    GENERATED ALWAYS AS (normalize_company_name_key(name)) STORED;
+
+-- Matches the merge script's address key (company_id, street, city, state, postal_code)
+CREATE INDEX IF NOT EXISTS idx_facility_address_norm
+    ON facility (company_id, address_line1_norm, city, state, postal_code);
+
+CREATE INDEX IF NOT EXISTS idx_company_name_norm
+    ON company (name_norm);
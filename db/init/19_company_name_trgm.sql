@@ -0,0 +1,7 @@
+-- Trigram index for merg_duplicates.py --name-similarity: finds near-duplicate
+-- company names with an index-assisted self-join (a.name_norm % b.name_norm)
+-- instead of comparing every pair in Python. Requires name_norm from 18_*.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_company_name_norm_trgm
+    ON company USING gin (name_norm gin_trgm_ops);
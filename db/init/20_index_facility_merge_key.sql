@@ -0,0 +1,11 @@
+-- Lookup index for the (company_id, name, city, state) checks in
+-- db/tools/merg_duplicates.py: the NOT EXISTS anti-join in repoint_dependents and
+-- the existing-facility checks before a merged facility is inserted.
+-- The expressions match those queries exactly (COALESCE(city, ''),
+-- COALESCE(state, '')) so the planner can use the index; facility_id is
+-- INCLUDEd so the existence probes are index-only.
+-- On a live database build it without blocking writes:
+--   CREATE INDEX CONCURRENTLY IF NOT EXISTS facility_company_name_city_state_idx ...
+CREATE INDEX IF NOT EXISTS facility_company_name_city_state_idx
+    ON facility (company_id, name, (COALESCE(city, '')), (COALESCE(state, '')))
+    INCLUDE (facility_id);
@@ -16,6 +16,27 @@ Geocoder backends:
 - Default: Nominatim (OpenStreetMap) - no API key
 - Optional: Google Geocoding API if you set GOOGLE_API_KEY and use --use-google
 
+Self-hosted Nominatim:
+  The public instance allows ~1 req/s, which dominates runtime on anything
+  but small batches. A local mirror has no such limit; add a service to
+  docker-compose.yml seeded with the state extract(s) you need:
+
+    nominatim:
+      image: mediagis/nominatim:4.4
+      container_name: aginfo-nominatim
+      restart: unless-stopped
+      environment:
+        PBF_URL: https://download.geofabrik.de/north-america/us/kansas-latest.osm.pbf
+      volumes:
+        - ./nominatim/data:/var/lib/postgresql/14/main
+      shm_size: 1gb
+      networks:
+        aginfo-net:
+          ipv4_address: 172.28.0.50
+
+  then run with --nominatim-url http://172.28.0.50:8080 (--sleep defaults
+  to 0 for any non-public URL).
+
 DB config:
 - Loaded from .env via python-dotenv using:
     POSTGRES_DB
@@ -30,11 +51,18 @@ import os
 import re
 import csv
 import time
+import sqlite3
 import argparse
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
 from dataclasses import dataclass
-from typing import Optional, Tuple, Dict, Any, List
+from datetime import date
+from typing import Optional, Tuple, Dict, Any, List, Iterator, Sequence
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import psycopg2
 import psycopg2.extras
 from dotenv import load_dotenv
@@ -55,50 +83,40 @@ if not env_loaded and os.path.exists("/project/.env"):
 # Address cleaning / heuristics
 # ----------------------------
 
-CR_PATTERNS = [
-    # Whole-token "CR" or common punctuated variants
-    (re.compile(r"\bC\.?\s*R\.?\b", re.IGNORECASE), "County Road"),
-    # Sometimes "Co Rd" or "Cty Rd"
-    (re.compile(r"\bCo\.?\s*Rd\.?\b", re.IGNORECASE), "County Road"),
-    (re.compile(r"\bCty\.?\s*Rd\.?\b", re.IGNORECASE), "County Road"),
-]
+# Whole-token "CR" or common punctuated variants, plus "Co Rd", "Cty Rd" and
+# "County Rd", as one alternation so clean_street scans the string once
+CR_RE = re.compile(
+    r"\b(?:C\.?\s*R\.?|Co\.?\s*Rd\.?|Cty\.?\s*Rd\.?|County\s+Rd)\b",
+    re.IGNORECASE,
+)
+
+HAS_DIGIT = re.compile(r"\d").search
 
-BAD_STREET_MARKERS = {"", "n/a", "na", "none", "unknown", "null", "-", "--"}
+BAD_STREET_MARKERS = frozenset({"", "n/a", "na", "none", "unknown", "null", "-", "--"})
 
 
 def normalize_whitespace(s: str) -> str:
-    return re.sub(r"\s+", " ", s).strip()
+    return " ".join(s.split())
 
 
-def clean_street(street: Optional[str]) -> Optional[str]:
+def clean_street(street: Optional[str]) -> Tuple[Optional[str], bool]:
+    """
+    Returns (cleaned_street, is_usable). cleaned_street is None for missing or
+    placeholder values; is_usable is False when it doesn't look like a
+    deliverable street address.
+    """
     if street is None:
-        return None
+        return None, False
     s = normalize_whitespace(street)
     if s.lower() in BAD_STREET_MARKERS:
-        return None
+        return None, False
 
-    # Replace CR variants with County Road
-    for pat, repl in CR_PATTERNS:
-        s = pat.sub(repl, s)
-
-    # Extra safe normalization
-    s = re.sub(r"\bCounty\s+Rd\b", "County Road", s, flags=re.IGNORECASE)
-
-    return normalize_whitespace(s) if s else None
-
-
-def looks_like_no_street(street: Optional[str]) -> bool:
-    """Heuristic for missing/unusable street."""
-    s = (street or "").strip().lower()
-    if s in BAD_STREET_MARKERS:
-        return True
+    # Replace CR variants with County Road (can't introduce new whitespace runs)
+    s = CR_RE.sub("County Road", s)
 
     # If it has no digits and is very short, it's often not a deliverable street address
-    has_digit = any(ch.isdigit() for ch in s)
-    if (not has_digit) and len(s) < 6:
-        return True
-
-    return False
+    is_usable = len(s) >= 6 or HAS_DIGIT(s) is not None
+    return s, is_usable
 
 
 def build_queries(
@@ -107,34 +125,28 @@ def build_queries(
     city: Optional[str],
     state: Optional[str],
     postal_code: Optional[str],
-) -> List[Tuple[str, str]]:
+) -> Tuple[Tuple[str, str], ...]:
     """
-    Returns a list of (query, mode) where mode is 'address' or 'city_state'.
+    Returns a tuple of (query, mode) where mode is 'address' or 'city_state'.
     We try address-based first, then fallback to city/state (center of town).
     """
-    street1 = clean_street(address_line1)
-    street2 = clean_street(address_line2)
+    street1, street1_usable = clean_street(address_line1)
 
     city_n = normalize_whitespace(city) if city else ""
     state_n = (state or "").strip().upper()
     postal_n = normalize_whitespace(postal_code) if postal_code else ""
 
-    address_parts = [p for p in [street1, street2, city_n, state_n, postal_n] if p]
-    city_state_parts = [p for p in [city_n, state_n, postal_n] if p]
-
-    queries: List[Tuple[str, str]] = []
-
-    # Prefer full address if we have something street-like
-    if street1 and not looks_like_no_street(street1):
-        queries.append((", ".join(address_parts), "address"))
-        # Also include city_state as fallback
-        if city_n and state_n:
-            queries.append((", ".join(city_state_parts), "city_state"))
-    # If no street address, use city/state (will geocode to center of town)
-    elif city_n and state_n:
-        queries.append((", ".join(city_state_parts), "city_state"))
+    city_state: Tuple[Tuple[str, str], ...] = ()
+    if city_n and state_n:
+        city_state = ((", ".join(p for p in (city_n, state_n, postal_n) if p), "city_state"),)
 
-    return queries
+    # Prefer full address if we have something street-like, with city_state
+    # as fallback. If no street address, use city/state (center of town).
+    if street1_usable:
+        street2, _ = clean_street(address_line2)
+        address = ", ".join(p for p in (street1, street2, city_n, state_n, postal_n) if p)
+        return ((address, "address"),) + city_state
+    return city_state
 
 
 # ----------------------------
@@ -149,33 +161,59 @@ class GeoResult:
     raw: Optional[Dict[str, Any]] = None
 
 
+def make_session(pool_maxsize: int = 16) -> requests.Session:
+    """
+    Keep-alive session that retries transient failures (429/5xx) with
+    exponential backoff, honoring Retry-After.
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry))
+    return session
+
+
 class Geocoder:
     def geocode(self, query: str) -> Optional[GeoResult]:
         raise NotImplementedError
 
 
+PUBLIC_NOMINATIM_URL = "https://nominatim.openstreetmap.org"
+
+
+def is_public_nominatim(url: str) -> bool:
+    return urlsplit(url).hostname == urlsplit(PUBLIC_NOMINATIM_URL).hostname
+
+
 class NominatimGeocoder(Geocoder):
     """
     Free OSM geocoder. Requires a descriptive User-Agent.
-    Respect rate limits (1 req/sec is recommended).
+    Respect rate limits on the public instance (1 req/sec is recommended);
+    point base_url at a self-hosted mirror to lift them.
     """
-    def __init__(self, user_agent: str, country_codes: str = "us", timeout: int = 20):
-        self.session = requests.Session()
+    def __init__(self, user_agent: str, country_codes: str = "us", timeout: int = 20,
+                 base_url: str = PUBLIC_NOMINATIM_URL, pool_maxsize: int = 16):
+        self.session = make_session(pool_maxsize)
+        self.session.headers["User-Agent"] = user_agent
         self.user_agent = user_agent
         self.country_codes = country_codes
         self.timeout = timeout
+        self.url = base_url.rstrip("/") + "/search"
+        # Constant query params, built once; requests accepts a sequence of pairs
+        self._base_params = (
+            ("format", "json"),
+            ("limit", 1),
+            ("addressdetails", 1),
+            ("countrycodes", country_codes.lower()),
+        )
 
     def geocode(self, query: str) -> Optional[GeoResult]:
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            "q": query,
-            "format": "json",
-            "limit": 1,
-            "addressdetails": 1,
-            "countrycodes": self.country_codes,
-        }
-        headers = {"User-Agent": self.user_agent}
-        r = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+        r = self.session.get(self.url, params=self._base_params + (("q", query),), timeout=self.timeout)
         r.raise_for_status()
         data = r.json()
         if not data:
@@ -190,8 +228,8 @@ class NominatimGeocoder(Geocoder):
 
 
 class GoogleGeocoder(Geocoder):
-    def __init__(self, api_key: str, timeout: int = 20):
-        self.session = requests.Session()
+    def __init__(self, api_key: str, timeout: int = 20, pool_maxsize: int = 16):
+        self.session = make_session(pool_maxsize)
         self.api_key = api_key
         self.timeout = timeout
 
@@ -213,6 +251,137 @@ class GoogleGeocoder(Geocoder):
         )
 
 
+class RateLimitedGeocoder(Geocoder):
+    """
+    Spaces calls to the wrapped geocoder at least `interval` seconds apart,
+    shared across all worker threads (replaces the per-row time.sleep).
+    """
+    def __init__(self, inner: Geocoder, interval: float):
+        self.inner = inner
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def geocode(self, query: str) -> Optional[GeoResult]:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+        return self.inner.geocode(query)
+
+
+def normalize_query(query: str) -> str:
+    """Cache/dedup key: case-folded with whitespace collapsed."""
+    return " ".join(query.lower().split())
+
+
+class CachedGeocoder(Geocoder):
+    """
+    On-disk (SQLite) cache in front of another geocoder, keyed by
+    (backend, normalized query). Misses are cached too (lat/lon NULL), so
+    reruns never re-ask the provider for a string it already answered.
+    Hits skip the wrapped geocoder entirely, including its rate limit.
+    """
+    def __init__(self, inner: Geocoder, backend: str, path: str):
+        self.inner = inner
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                backend TEXT,
+                q TEXT,
+                lat REAL,
+                lon REAL,
+                name TEXT,
+                ts INTEGER,
+                PRIMARY KEY (backend, q)
+            )
+        """)
+
+    def geocode(self, query: str) -> Optional[GeoResult]:
+        key = normalize_query(query)
+        with self._lock:
+            hit = self._db.execute(
+                "SELECT lat, lon, name FROM cache WHERE backend = ? AND q = ?",
+                (self.backend, key),
+            ).fetchone()
+        if hit is not None:
+            lat, lon, name = hit
+            return None if lat is None else GeoResult(lat=lat, lon=lon, display_name=name or "")
+
+        r = self.inner.geocode(query)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (backend, q, lat, lon, name, ts) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.backend, key,
+                 r.lat if r else None, r.lon if r else None, r.display_name if r else None,
+                 int(time.time())),
+            )
+        return r
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class DedupGeocoder(Geocoder):
+    """
+    Geocodes each distinct (normalized) query at most once per run. Facilities
+    in the same town share their city_state fallback, so rows after the first
+    reuse its result; a thread asking for a query that is still in flight
+    waits on the first caller's Future instead of issuing its own request.
+    Failures are handed to the callers waiting at the time, then forgotten so
+    a later row may retry.
+    """
+    def __init__(self, inner: Geocoder):
+        self.inner = inner
+        self._lock = threading.Lock()
+        self._results: Dict[str, Future] = {}
+
+    def geocode(self, query: str) -> Optional[GeoResult]:
+        key = normalize_query(query)
+        with self._lock:
+            fut = self._results.get(key)
+            owner = fut is None
+            if owner:
+                fut = self._results[key] = Future()
+        if not owner:
+            return fut.result()
+
+        try:
+            r = self.inner.geocode(query)
+        except Exception as e:
+            with self._lock:
+                del self._results[key]
+            fut.set_exception(e)
+            raise
+        fut.set_result(r)
+        return r
+
+
+def try_queries(
+    geocoder: Geocoder, queries: Tuple[Tuple[str, str], ...]
+) -> Tuple[Optional[GeoResult], str, str, List[Tuple[str, str, Exception]]]:
+    """
+    Runs in a worker thread. Tries each (query, mode) in order and stops at the
+    first hit. Returns (result, used_query, used_mode, errors) where errors is a
+    list of (mode, query, exception) for the CSV log.
+    """
+    errors: List[Tuple[str, str, Exception]] = []
+    for q, mode in queries:
+        try:
+            r = geocoder.geocode(q)
+        except Exception as e:
+            errors.append((mode, q, e))
+            continue
+        if r is not None:
+            return r, q, mode, errors
+    return None, "", "", errors
+
+
 # ----------------------------
 # DB + processing
 # ----------------------------
@@ -242,49 +411,92 @@ def db_connect():
     )
 
 
-def fetch_facilities(conn, limit: int, where_sql: str) -> List[Dict[str, Any]]:
+FACILITY_COLUMNS = """
+    facility_id,
+    name,
+    address_line1, address_line2, city, state, postal_code,
+    latitude, longitude,
+    geom_from_address
+"""
+
+
+def count_facilities(conn, limit: int, where_sql: str, where_params: Sequence[Any] = ()) -> int:
+    """Number of rows fetch_facilities will yield (for progress output)."""
+    sql = f"""
+        SELECT count(*) FROM (
+            SELECT 1 FROM public.facility
+            WHERE {where_sql}
+            LIMIT %s
+        ) AS t
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql, (*where_params, limit))
+        return cur.fetchone()[0]
+
+
+def fetch_facilities(conn, limit: int, where_sql: str, where_params: Sequence[Any] = ()) -> Iterator[Tuple[Any, ...]]:
     """
-    Provide your own WHERE clause (without 'WHERE') to target 'bad' rows.
+    Provide your own WHERE clause (without 'WHERE') to target 'bad' rows;
+    where_params fill any %s placeholders in it.
+
+    Streams tuples in FACILITY_COLUMNS order from a server-side cursor. The
+    cursor is WITH HOLD so batch commits made while iterating don't close it;
+    the declaring transaction is committed straight away, since a WITH HOLD
+    cursor only outlives a rollback once that transaction has committed.
     """
     sql = f"""
-        SELECT
-            facility_id,
-            name,
-            address_line1, address_line2, city, state, postal_code,
-            latitude, longitude,
-            geom_from_address
+        SELECT {FACILITY_COLUMNS}
         FROM public.facility
         WHERE {where_sql}
         ORDER BY facility_id
         LIMIT %s
     """
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-        cur.execute(sql, (limit,))
-        return list(cur.fetchall())
+    with conn.cursor(name="facility_stream", withhold=True) as cur:
+        cur.itersize = 500
+        cur.execute(sql, (*where_params, limit))
+        conn.commit()
+        yield from cur
+
 
+UPDATE_BATCH_SIZE = 100
 
-def update_facility(conn, facility_id: int, lat: float, lon: float):
+
+def update_facilities(conn, rows: List[Tuple[int, float, float]]):
     """
+    Batch UPDATE of (facility_id, lat, lon) rows in a single statement.
     Mark geom_from_address = TRUE whenever we successfully geocode.
     """
     sql = """
-        UPDATE public.facility
-        SET latitude = %s,
-            longitude = %s,
+        UPDATE public.facility AS f
+        SET latitude = v.lat,
+            longitude = v.lon,
             geom_from_address = TRUE
-        WHERE facility_id = %s
+        FROM (VALUES %s) AS v(fid, lat, lon)
+        WHERE f.facility_id = v.fid
     """
     with conn.cursor() as cur:
-        cur.execute(sql, (lat, lon, facility_id))
+        psycopg2.extras.execute_values(
+            cur, sql, rows,
+            template="(%s, %s::double precision, %s::double precision)",
+            page_size=len(rows),
+        )
+
+
+def to_float(value: Any) -> Optional[float]:
+    """numeric columns arrive as Decimal; cast once, None if missing/unparseable."""
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
 
 
 def is_obviously_bad_latlon(lat: Optional[float], lon: Optional[float]) -> bool:
     if lat is None or lon is None:
         return True
-    if not (-90 <= float(lat) <= 90 and -180 <= float(lon) <= 180):
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
         return True
     # common "null island" / zeros
-    if abs(float(lat)) < 0.0001 and abs(float(lon)) < 0.0001:
+    if abs(lat) < 0.0001 and abs(lon) < 0.0001:
         return True
     return False
 
@@ -293,7 +505,9 @@ def main():
     p = argparse.ArgumentParser(description="Fix facility geolocations by re-geocoding addresses.")
     p.add_argument("--limit", type=int, default=500, help="Max facilities to process")
     p.add_argument("--dry-run", action="store_true", help="Do not write updates, only log")
-    p.add_argument("--sleep", type=float, default=1.1, help="Seconds to sleep between geocode calls")
+    p.add_argument("--sleep", type=float, default=None, help="Minimum seconds between geocode calls, shared across all workers (default: 1.1, or 0 with a custom --nominatim-url)")
+    p.add_argument("--cache", default="geocode_cache.sqlite", help="SQLite geocode cache file (empty string disables caching)")
+    p.add_argument("--concurrency", type=int, default=None, help="Geocode requests in flight at once (default: 1 for public Nominatim, where more is refused; 16 for Google or a --nominatim-url mirror)")
     p.add_argument("--log-csv", default="facility_geofix_log.csv", help="Output CSV log")
     p.add_argument("--where", default=None, help="Custom SQL WHERE (without 'WHERE') to pick records")
     p.add_argument("--overwrite", action="store_true", help="Overwrite existing lat/lon values (processes all facilities, not just missing/bad ones)")
@@ -302,8 +516,16 @@ def main():
     p.add_argument("--not-updated-after", type=str, metavar="DATE", help="Only process facilities not updated after this date (YYYY-MM-DD format). Note: requires updated_at column in facility table.")
     p.add_argument("--use-google", action="store_true", help="Use Google Geocoding API (requires GOOGLE_API_KEY)")
     p.add_argument("--country-codes", default="us", help="Nominatim countrycodes filter (default us)")
+    p.add_argument("--nominatim-url", default=PUBLIC_NOMINATIM_URL, help=f"Nominatim base URL, e.g. a self-hosted mirror (default {PUBLIC_NOMINATIM_URL})")
     args = p.parse_args()
 
+    not_updated_after: Optional[date] = None
+    if args.not_updated_after:
+        try:
+            not_updated_after = date.fromisoformat(args.not_updated_after)
+        except ValueError:
+            raise SystemExit(f"ERROR: --not-updated-after must be a YYYY-MM-DD date, got {args.not_updated_after!r}")
+
     # Check if updated_at column exists (for --not-updated-after flag)
     if args.not_updated_after:
         conn_check = db_connect()
@@ -320,8 +542,9 @@ def main():
                 raise SystemExit("ERROR: --not-updated-after requires an 'updated_at' column in the facility table, but it doesn't exist.")
         conn_check.close()
     
-    # Build WHERE clause from flags
+    # Build WHERE clause from flags (values go in where_params, not the SQL text)
     where_conditions = []
+    where_params: List[Any] = []
     
     # If custom WHERE provided, use it (but can combine with other flags)
     if args.where:
@@ -335,7 +558,8 @@ def main():
         where_conditions.append("marked = TRUE")
     
     if args.not_updated_after:
-        where_conditions.append(f"updated_at < '{args.not_updated_after}'")
+        where_conditions.append("updated_at < %s")
+        where_params.append(not_updated_after)
     
     # Default WHERE: missing or obviously bad lat/lon, unless --overwrite is set or other flags override
     if args.overwrite and not args.where and not args.geom_from_address_false and not args.marked and not args.not_updated_after:
@@ -345,7 +569,10 @@ def main():
         # Combine all conditions with AND
         where_sql = " AND ".join(where_conditions)
     else:
-        # Default: missing or obviously bad lat/lon
+        # Default: missing or obviously bad lat/lon, skipping rows this tool
+        # already geocoded so reruns don't reselect them. For big tables:
+        #   CREATE INDEX CONCURRENTLY ON public.facility (geom_from_address)
+        #     WHERE geom_from_address = FALSE;
         where_sql = """
             (
               latitude IS NULL OR longitude IS NULL
@@ -353,28 +580,46 @@ def main():
               OR latitude NOT BETWEEN -90 AND 90
               OR longitude NOT BETWEEN -180 AND 180
             )
+            AND COALESCE(geom_from_address, FALSE) = FALSE
         """
 
     google_key = os.environ.get("GOOGLE_API_KEY", "").strip()
     if args.use_google and not google_key:
         raise SystemExit("ERROR: --use-google set but GOOGLE_API_KEY env var is missing.")
 
+    # Only the public Nominatim instance needs 1 req/s pacing and a single worker
+    public_nominatim = not args.use_google and is_public_nominatim(args.nominatim_url)
+    if args.sleep is None:
+        args.sleep = 1.1 if args.use_google or public_nominatim else 0.0
+    if public_nominatim and args.concurrency and args.concurrency > 1:
+        raise SystemExit(
+            "ERROR: --concurrency > 1 is not allowed against the public Nominatim instance "
+            "(usage policy: single client, 1 req/s). Use --nominatim-url with a self-hosted mirror."
+        )
+    concurrency = args.concurrency or (1 if public_nominatim else 16)
+
     if args.use_google:
-        geocoder: Geocoder = GoogleGeocoder(api_key=google_key)
+        geocoder: Geocoder = GoogleGeocoder(api_key=google_key, pool_maxsize=concurrency)
         backend = "google"
     else:
         ua = os.environ.get(
             "NOMINATIM_USER_AGENT",
             "aginfo-geofix/1.0 (set NOMINATIM_USER_AGENT in env for production)"
         )
-        geocoder = NominatimGeocoder(user_agent=ua, country_codes=args.country_codes)
+        geocoder = NominatimGeocoder(user_agent=ua, country_codes=args.country_codes,
+                                     base_url=args.nominatim_url, pool_maxsize=concurrency)
         backend = "nominatim"
 
+    geocoder = RateLimitedGeocoder(geocoder, args.sleep)
+    cache: Optional[CachedGeocoder] = None
+    if args.cache:
+        geocoder = cache = CachedGeocoder(geocoder, backend, args.cache)
+    geocoder = DedupGeocoder(geocoder)
+
     conn = db_connect()
     conn.autocommit = False
 
-    facilities = fetch_facilities(conn, args.limit, where_sql)
-    total_facilities = len(facilities)
+    total_facilities = count_facilities(conn, args.limit, where_sql, where_params)
     
     if total_facilities == 0:
         print("No facilities found matching the criteria.")
@@ -383,7 +628,8 @@ def main():
     
     print(f"Processing {total_facilities} facilities...")
 
-    with open(args.log_csv, "w", newline="", encoding="utf-8") as f:
+    # Large write buffer: the log is only read after the run
+    with open(args.log_csv, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
         w = csv.writer(f)
         w.writerow([
             "facility_id", "name",
@@ -397,84 +643,112 @@ def main():
         skipped = 0
         processed = 0
 
-        for row in facilities:
-            processed += 1
-            
+        # Geocoded rows waiting for the next batch UPDATE:
+        # (fid, name, used_mode, used_query, old_lat, old_lon, new_lat, new_lon, old_gfa, display_name)
+        pending: List[Tuple[Any, ...]] = []
+
+        def flush_pending():
+            nonlocal updated, skipped
+            if not pending:
+                return
+            try:
+                update_facilities(conn, [(p[0], p[6], p[7]) for p in pending])
+                conn.commit()
+                for fid, name, used_mode, used_query, old_lat, old_lon, new_lat, new_lon, old_gfa, display_name in pending:
+                    w.writerow([fid, name, used_mode, used_query, backend, old_lat, old_lon, new_lat, new_lon, old_gfa, True, display_name, "UPDATED"])
+                updated += len(pending)
+            except Exception:
+                conn.rollback()
+                # Retry row by row so one bad row doesn't sink the whole batch
+                for fid, name, used_mode, used_query, old_lat, old_lon, new_lat, new_lon, old_gfa, display_name in pending:
+                    try:
+                        update_facilities(conn, [(fid, new_lat, new_lon)])
+                        conn.commit()
+                        w.writerow([fid, name, used_mode, used_query, backend, old_lat, old_lon, new_lat, new_lon, old_gfa, True, display_name, "UPDATED"])
+                        updated += 1
+                    except Exception as e:
+                        conn.rollback()
+                        w.writerow([fid, name, used_mode, used_query, backend, old_lat, old_lon, new_lat, new_lon, old_gfa, old_gfa, display_name, f"DB_ERROR: {e}"])
+                        skipped += 1
+            pending.clear()
+
+        def log_progress():
             # Print progress every 25 records
             if processed % 25 == 0:
                 print(f"Progress: {processed}/{total_facilities} ({100*processed//total_facilities}%) - Updated: {updated}, Skipped: {skipped}")
-            fid = row["facility_id"]
-            name = row.get("name") or ""
-            old_lat = row.get("latitude")
-            old_lon = row.get("longitude")
-            old_gfa = row.get("geom_from_address")
-
-            queries = build_queries(
-                row.get("address_line1"),
-                row.get("address_line2"),
-                row.get("city"),
-                row.get("state"),
-                row.get("postal_code"),
-            )
-
-            if not queries:
-                w.writerow([fid, name, "", "", backend, old_lat, old_lon, "", "", old_gfa, old_gfa, "", "NO_QUERY"])
-                skipped += 1
-                continue
-
-            result: Optional[GeoResult] = None
-            used_query = ""
-            used_mode = ""
 
-            for q, mode in queries:
-                try:
-                    r = geocoder.geocode(q)
-                except Exception as e:
-                    w.writerow([fid, name, mode, q, backend, old_lat, old_lon, "", "", old_gfa, old_gfa, "", f"ERROR: {e}"])
-                    r = None
+        def handle_result(row: Tuple[Any, ...], outcome) -> None:
+            nonlocal skipped
+            fid, name, _, _, _, _, _, old_lat, old_lon, old_gfa = row
+            name = name or ""
+            result, used_query, used_mode, errors = outcome
 
-                time.sleep(args.sleep)
-
-                if r is not None:
-                    result = r
-                    used_query = q
-                    used_mode = mode
-                    break
+            for mode, q, e in errors:
+                w.writerow([fid, name, mode, q, backend, old_lat, old_lon, "", "", old_gfa, old_gfa, "", f"ERROR: {e}"])
 
             if result is None:
                 w.writerow([fid, name, "", "", backend, old_lat, old_lon, "", "", old_gfa, old_gfa, "", "NO_RESULT"])
                 skipped += 1
-                continue
+                return
 
             new_lat, new_lon = result.lat, result.lon
-            new_gfa = True
+            old_lat_f, old_lon_f = to_float(old_lat), to_float(old_lon)
 
             # If it was already good and is extremely close, skip (safety) unless --overwrite is set
             # Exception: Always update if using city_state mode (center of town geocoding)
-            if (not args.overwrite) and (not is_obviously_bad_latlon(old_lat, old_lon)) and abs(float(old_lat) - new_lat) < 1e-6 and abs(float(old_lon) - new_lon) < 1e-6 and used_mode != "city_state":
+            if (not args.overwrite) and (not is_obviously_bad_latlon(old_lat_f, old_lon_f)) and abs(old_lat_f - new_lat) < 1e-6 and abs(old_lon_f - new_lon) < 1e-6 and used_mode != "city_state":
                 w.writerow([fid, name, used_mode, used_query, backend, old_lat, old_lon, new_lat, new_lon, old_gfa, old_gfa, result.display_name, "UNCHANGED"])
                 skipped += 1
-                continue
+                return
 
             if args.dry_run:
                 w.writerow([fid, name, used_mode, used_query, backend, old_lat, old_lon, new_lat, new_lon, old_gfa, old_gfa, result.display_name, "DRY_RUN"])
                 skipped += 1
-                continue
+                return
+
+            pending.append((fid, name, used_mode, used_query, old_lat, old_lon, new_lat, new_lon, old_gfa, result.display_name))
+            if len(pending) >= UPDATE_BATCH_SIZE:
+                flush_pending()
+
+        def drain(futures) -> None:
+            nonlocal processed
+            for fut in futures:
+                processed += 1
+                log_progress()
+                handle_result(in_flight.pop(fut), fut.result())
+
+        # Geocoding runs in worker threads; this (main) thread is the only one
+        # that touches the DB connection and the CSV writer. Rows are streamed
+        # from the DB with a bounded number in flight.
+        max_in_flight = concurrency * 4
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            in_flight: Dict[Future, Tuple[Any, ...]] = {}
+            for row in fetch_facilities(conn, args.limit, where_sql, where_params):
+                fid, name, a1, a2, city, state, zipc, old_lat, old_lon, old_gfa = row
+                queries = build_queries(a1, a2, city, state, zipc)
+
+                if not queries:
+                    w.writerow([fid, name or "", "", "", backend, old_lat, old_lon, "", "", old_gfa, old_gfa, "", "NO_QUERY"])
+                    skipped += 1
+                    processed += 1
+                    log_progress()
+                    continue
+
+                in_flight[pool.submit(try_queries, geocoder, queries)] = row
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    drain(done)
+
+            drain(as_completed(list(in_flight)))
+
+        flush_pending()
 
-            try:
-                update_facility(conn, fid, new_lat, new_lon)
-                conn.commit()
-                w.writerow([fid, name, used_mode, used_query, backend, old_lat, old_lon, new_lat, new_lon, old_gfa, new_gfa, result.display_name, "UPDATED"])
-                updated += 1
-            except Exception as e:
-                conn.rollback()
-                w.writerow([fid, name, used_mode, used_query, backend, old_lat, old_lon, new_lat, new_lon, old_gfa, old_gfa, result.display_name, f"DB_ERROR: {e}"])
-                skipped += 1
-        
         # Print final summary
         print(f"\nDone. Processed: {processed}/{total_facilities}, Updated: {updated}, Skipped: {skipped}. Log: {args.log_csv}")
 
     conn.close()
+    if cache is not None:
+        cache.close()
 
 
 if __name__ == "__main__":
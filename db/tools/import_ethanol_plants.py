@@ -15,12 +15,21 @@ Example:
 import os
 import sys
 import csv
+import io
 import argparse
+import logging
+import logging.handlers
 import time
+import sqlite3
+import queue
+import threading
 import requests
-from typing import Dict, Any, Optional, List, Tuple
+from dataclasses import dataclass
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Any, Optional, List, Tuple, Iterable, Iterator
 import psycopg2
-import psycopg2.extras
 from dotenv import load_dotenv
 
 # Load .env
@@ -29,6 +38,59 @@ if not env_loaded and os.path.exists("/project/.env"):
     load_dotenv("/project/.env")
 
 
+# Facilities are loaded in batches of this many rows (one COPY + INSERT ... SELECT each)
+FACILITY_BATCH_SIZE = 500
+
+# Geocode results survive between runs here (see GeocodeCache)
+GEOCODE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".geocode_cache.sqlite")
+GEOCODE_AHEAD = 64  # Rows the geocoding thread may get ahead of the database loop
+
+LOG_BUFFER_SIZE = 100  # Per-row log lines held before a write
+LOG_FLUSH_INTERVAL = 2.0  # Longest a held line waits, e.g. while the loop blocks on geocoding
+
+logger = logging.getLogger('ethanol_import')
+
+
+class TimedMemoryHandler(logging.handlers.MemoryHandler):
+    """Buffered import log that still shows progress while rows stall.
+    
+    A plain MemoryHandler only writes once `capacity` lines pile up, so a run
+    waiting on rate-limited geocoder lookups would print nothing for minutes.
+    This one also writes what it holds with the first line logged after
+    `interval` seconds.
+    """
+    
+    def __init__(self, capacity, interval, **kwargs):
+        super().__init__(capacity, **kwargs)
+        self.interval = interval
+        self._last_flush = time.monotonic()
+    
+    def shouldFlush(self, record):
+        return (super().shouldFlush(record)
+                or time.monotonic() - self._last_flush >= self.interval)
+    
+    def flush(self):
+        super().flush()
+        self._last_flush = time.monotonic()
+
+
+def setup_logging():
+    """Route the 'ethanol_import' logger to stdout through TimedMemoryHandler.
+    
+    Every CSV row logs its company, facility and geocode outcome; holding
+    those lines turns them into one write() per LOG_BUFFER_SIZE instead of
+    one per line. If the import fails, the error and everything held before
+    it are written at once.
+    """
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(TimedMemoryHandler(
+        LOG_BUFFER_SIZE, LOG_FLUSH_INTERVAL, flushLevel=logging.ERROR, target=stream
+    ))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
 def db_connect():
     """Connect to database using .env variables."""
     host = os.environ.get("PGHOST", "localhost")
@@ -49,38 +111,64 @@ def db_connect():
     )
 
 
-def get_or_create_facility_type(conn, name: str = "Ethanol Plant") -> int:
-    """Get facility_type_id for Ethanol Plant, create if doesn't exist."""
+def get_or_create_facility_type(conn, name: str = "Ethanol Plant",
+                                cache: Optional[Dict[str, int]] = None) -> int:
+    """Get facility_type_id for Ethanol Plant, create if doesn't exist.
+    
+    If a cache dict is given, names already resolved skip the database.
+    Does not commit; main() runs the whole import as one transaction.
+    """
+    if cache is not None and name in cache:
+        return cache[name]
+    
+    # One round trip: the no-op DO UPDATE makes RETURNING yield the row
+    # whether it was inserted or already there (facility_type.name is UNIQUE)
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT facility_type_id FROM facility_type WHERE name = %s
-            """,
-            (name,)
-        )
-        row = cur.fetchone()
-        if row:
-            return row[0]
-        
-        # Create it
         cur.execute(
             """
             INSERT INTO facility_type (name, description, is_producer, is_consumer, is_storage)
             VALUES (%s, %s, %s, %s, %s)
-            RETURNING facility_type_id
+            ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+            RETURNING facility_type_id, (xmax = 0) AS inserted
             """,
             (name, "Ethanol production facility", True, True, False)
         )
-        facility_type_id = cur.fetchone()[0]
-        conn.commit()
-        print(f"✓ Created facility type: {name} (ID: {facility_type_id})", flush=True)
+        facility_type_id, was_created = cur.fetchone()
+        if cache is not None:
+            cache[name] = facility_type_id
+        if was_created:
+            logger.info(f"✓ Created facility type: {name} (ID: {facility_type_id})")
         return facility_type_id
 
 
-def get_or_create_company(conn, company_name: str, website_url: Optional[str] = None,
+def prepare_company_upsert(conn):
+    """Server-side PREPARE the company upsert used by get_or_create_company.
+    
+    Same single-statement upsert as get_or_create_facility_type; xmax = 0
+    only on a freshly inserted row (company.name is UNIQUE). Prepared
+    statements last for the session, so call this once per connection.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            PREPARE upsert_company (text, text, text) AS
+            INSERT INTO company (name, website_url, phone_main)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+            RETURNING company_id, (xmax = 0) AS inserted
+            """
+        )
+
+
+def get_or_create_company(conn, company_name: str, cache: Optional[Dict[str, int]] = None,
+                         website_url: Optional[str] = None,
                          phone_main: Optional[str] = None) -> tuple[int, bool]:
     """Get company_id for company, create if doesn't exist.
     
+    If a cache dict is given, names already resolved skip the database.
+    Requires prepare_company_upsert() to have run on this connection.
+    Does not commit; main() runs the whole import as one transaction.
+    
     Returns:
         (company_id, was_created) tuple where was_created is True if newly created
     """
@@ -88,45 +176,49 @@ def get_or_create_company(conn, company_name: str, website_url: Optional[str] =
         raise ValueError("Company name cannot be empty")
     
     company_name = company_name.strip()
+    if cache is not None and company_name in cache:
+        return (cache[company_name], False)
     
     with conn.cursor() as cur:
-        # Check if exists
         cur.execute(
-            """
-            SELECT company_id FROM company WHERE name = %s
-            """,
-            (company_name,)
-        )
-        row = cur.fetchone()
-        if row:
-            return (row[0], False)
-        
-        # Create it
-        cur.execute(
-            """
-            INSERT INTO company (name, website_url, phone_main)
-            VALUES (%s, %s, %s)
-            RETURNING company_id
-            """,
+            "EXECUTE upsert_company (%s, %s, %s)",
             (company_name, website_url, phone_main)
         )
-        company_id = cur.fetchone()[0]
-        conn.commit()
-        print(f"  ✓ Created company: {company_name} (ID: {company_id})", flush=True)
-        return (company_id, True)
+        company_id, was_created = cur.fetchone()
+        if cache is not None:
+            cache[company_name] = company_id
+        if was_created:
+            logger.info(f"  ✓ Created company: {company_name} (ID: {company_id})")
+        return (company_id, was_created)
+
+
+def load_companies(conn) -> Dict[str, int]:
+    """Map company name -> company_id for every company, in one query.
+    
+    Used to pre-fill the get_or_create_company cache.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT company_id, name FROM company")
+        return {name: company_id for company_id, name in cur.fetchall()}
 
 
+# Both are called for several columns on every row, and CSV columns like
+# state, location and feedstock repeat a small set of values, so cache them.
+@lru_cache(maxsize=4096)
 def normalize_value(value: Optional[str]) -> Optional[str]:
     """Normalize string value - strip whitespace, return None if empty."""
     if value is None:
         return None
-    s = str(value).strip()
+    # CSV cells are already str; only other types need str()
+    s = value.strip() if isinstance(value, str) else str(value).strip()
     return s if s else None
 
 
+@lru_cache(maxsize=4096)
 def parse_float(value: Optional[str]) -> Optional[float]:
     """Parse float from string, return None if invalid."""
-    if value is None:
+    # Blank cells are the common miss; skip the exception for them
+    if value is None or value == '':
         return None
     try:
         return float(value)
@@ -134,15 +226,182 @@ def parse_float(value: Optional[str]) -> Optional[float]:
         return None
 
 
-def geocode_location(company_name: str, location: str) -> Optional[Tuple[float, float]]:
+class GeocodeCache:
+    """On-disk geocode cache keyed by normalized (company name, location).
+    
+    The dataset is small, so the whole table is loaded into a dict at startup.
+    Failed lookups are stored too (NULL lat/lon) so hopeless queries aren't
+    retried on every run. Safe to share with the geocode_ahead thread.
+    """
+    
+    def __init__(self, path: str = GEOCODE_CACHE_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode (key TEXT PRIMARY KEY, lat REAL, lon REAL, ts INTEGER)"
+        )
+        self.entries: Dict[str, Optional[Tuple[float, float]]] = {
+            key: (lat, lon) if lat is not None else None
+            for key, lat, lon in self.conn.execute("SELECT key, lat, lon FROM geocode")
+        }
+    
+    @staticmethod
+    def make_key(company_name: str, location: str) -> str:
+        return f"{company_name.strip().lower()}|{location.strip().lower()}"
+    
+    def get(self, key: str) -> Tuple[bool, Optional[Tuple[float, float]]]:
+        """Returns (found, coords); coords is None for a cached failure."""
+        if key in self.entries:
+            return True, self.entries[key]
+        return False, None
+    
+    def set(self, key: str, coords: Optional[Tuple[float, float]]):
+        lat, lon = coords if coords else (None, None)
+        with self.lock:
+            self.entries[key] = coords
+            self.conn.execute(
+                "INSERT OR REPLACE INTO geocode (key, lat, lon, ts) VALUES (?, ?, ?, ?)",
+                (key, lat, lon, int(time.time()))
+            )
+            self.conn.commit()
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class RateLimiter:
+    """Keeps calls at least `interval` seconds apart (Nominatim allows 1 req/s).
+    
+    Unlike a fixed sleep after each success, failed requests are paced too,
+    and time already spent on the request itself counts toward the interval.
+    """
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+    
+    def wait(self):
+        # Held while sleeping so concurrent callers queue up in turn
+        with self.lock:
+            now = time.monotonic()
+            if now < self.next_at:
+                time.sleep(self.next_at - now)
+                now = self.next_at
+            self.next_at = now + self.interval
+
+
+nominatim_limiter = RateLimiter(1.0)
+
+# One keep-alive session for all Nominatim requests; 429/5xx back off and retry
+_SESSION = requests.Session()
+_SESSION.headers.update({'User-Agent': 'AgInfo-Import-Script/1.0'})  # Required by Nominatim
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504]),
+))
+
+
+# Accepted CSV column names per field, in fallback order
+COLUMN_ALIASES = {
+    'company': ('name', 'company_name', 'company', 'owner', 'operator'),
+    'facility_company': ('name', 'company_name', 'company'),
+    'company_website': ('company_website', 'company_website_url'),
+    'company_phone': ('company_phone', 'company_phone_main'),
+    'location': ('location',),
+    'facility_name': ('facility_name', 'plant_name'),
+    'address': ('address', 'address_line1', 'street', 'address1'),
+    'city': ('city',),
+    'state': ('state',),
+    'postal_code': ('zip', 'postal_code', 'zipcode'),
+    'county': ('county',),
+    'latitude': ('latitude', 'lat'),
+    'longitude': ('longitude', 'lon', 'lng'),
+    'website': ('link', 'website', 'website_url'),
+    'phone': ('phone', 'phone_main'),
+    'email': ('email', 'email_main'),
+    'feedstock': ('feedstock',),
+    'rins': ('rins',),
+    'capacity': ('capacity (mmgy)',),
+    'notes': ('notes', 'description'),
+}
+
+
+@dataclass(slots=True)
+class ColumnMap:
+    """The COLUMN_ALIASES this CSV actually has, resolved once from its header.
+    
+    Each field is a tuple of present column names in fallback order (usually
+    zero or one), so rows never probe aliases the file doesn't contain.
+    """
+    company: Tuple[str, ...]
+    facility_company: Tuple[str, ...]
+    company_website: Tuple[str, ...]
+    company_phone: Tuple[str, ...]
+    location: Tuple[str, ...]
+    facility_name: Tuple[str, ...]
+    address: Tuple[str, ...]
+    city: Tuple[str, ...]
+    state: Tuple[str, ...]
+    postal_code: Tuple[str, ...]
+    county: Tuple[str, ...]
+    latitude: Tuple[str, ...]
+    longitude: Tuple[str, ...]
+    website: Tuple[str, ...]
+    phone: Tuple[str, ...]
+    email: Tuple[str, ...]
+    feedstock: Tuple[str, ...]
+    rins: Tuple[str, ...]
+    capacity: Tuple[str, ...]
+    notes: Tuple[str, ...]
+    
+    @classmethod
+    def from_header(cls, fieldnames: Iterable[str]) -> "ColumnMap":
+        present = set(fieldnames)
+        return cls(**{
+            field: tuple(name for name in aliases if name in present)
+            for field, aliases in COLUMN_ALIASES.items()
+        })
+
+
+def first_value(row: Dict[str, Any], columns: Tuple[str, ...]) -> Optional[str]:
+    """First non-empty normalized value among columns."""
+    for column in columns:
+        value = normalize_value(row.get(column))
+        if value:
+            return value
+    return None
+
+
+def first_float(row: Dict[str, Any], columns: Tuple[str, ...]) -> Optional[float]:
+    """First non-zero float among columns."""
+    for column in columns:
+        value = parse_float(row.get(column))
+        if value:
+            return value
+    return None
+
+
+def geocode_location(company_name: str, location: str,
+                     cache: Optional[GeocodeCache] = None) -> Optional[Tuple[float, float]]:
     """Geocode a location using Nominatim (OpenStreetMap).
     
     Tries multiple query formats to improve success rate.
     Returns (latitude, longitude) or None if geocoding fails.
+    Consults the cache first when one is given.
     """
     if not company_name or not location:
         return None
     
+    key = None
+    if cache is not None:
+        key = GeocodeCache.make_key(company_name, location)
+        found, coords = cache.get(key)
+        if found:
+            return coords
+    
     # Try multiple query formats
     queries = [
         f"{company_name}, {location}, USA",  # Full company name + state
@@ -158,10 +417,7 @@ def geocode_location(company_name: str, location: str) -> Optional[Tuple[float,
             queries.insert(1, f"{clean_name}, {location}, USA")  # Try without suffix
             break
     
-    headers = {
-        'User-Agent': 'AgInfo-Import-Script/1.0'  # Required by Nominatim
-    }
-    
+    had_error = False
     for query in queries:
         try:
             # Use Nominatim geocoding service (free, no API key needed)
@@ -173,7 +429,8 @@ def geocode_location(company_name: str, location: str) -> Optional[Tuple[float,
                 'addressdetails': 1
             }
             
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            nominatim_limiter.wait()
+            response = _SESSION.get(url, params=params, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -182,140 +439,248 @@ def geocode_location(company_name: str, location: str) -> Optional[Tuple[float,
                 lat = float(result.get('lat', 0))
                 lon = float(result.get('lon', 0))
                 if lat != 0 and lon != 0:
-                    # Rate limiting: be nice to Nominatim
-                    time.sleep(1)
+                    if cache is not None:
+                        cache.set(key, (lat, lon))
                     return (lat, lon)
         except Exception as e:
             # Try next query format
+            had_error = True
             continue
     
+    # Only remember a clean miss; a network error may succeed next time
+    if cache is not None and not had_error:
+        cache.set(key, None)
     return None
 
 
-def create_facility(conn, company_id: int, facility_type_id: int, row: Dict[str, Any],
-                   apply: bool = False) -> Optional[int]:
-    """Create a facility record from CSV row data."""
+def geocode_target(row: Dict[str, Any], cols: ColumnMap) -> Optional[Tuple[str, str]]:
+    """(company name, location) create_facility will geocode for this row, or
+    None if the row already has coordinates, no location, or will be skipped
+    by main() for lacking a company name."""
+    if not first_value(row, cols.company):
+        return None
+    if first_float(row, cols.latitude) and first_float(row, cols.longitude):
+        return None
+    location = first_value(row, cols.location)
+    if not location:
+        return None
+    return (first_value(row, cols.facility_company) or "Unknown Company", location)
+
+
+def geocode_ahead(rows: Iterable[Dict[str, Any]], cols: ColumnMap, cache: GeocodeCache,
+                  depth: int = GEOCODE_AHEAD) -> Iterator[Dict[str, Any]]:
+    """Yield rows in order while a background thread geocodes ahead of the caller.
+    
+    The thread resolves each distinct (company, location) the row needs before
+    queueing it, so create_facility usually finds its coordinates in the cache
+    and Nominatim requests overlap the caller's database work. At most `depth`
+    rows wait in the queue. Errors in the thread are re-raised here.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+    failure: List[BaseException] = []
+    
+    def put(item) -> bool:
+        # Give up once the consumer has gone away instead of blocking forever
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        seen = set()
+        try:
+            for row in rows:
+                target = geocode_target(row, cols)
+                if target is not None:
+                    key = GeocodeCache.make_key(*target)
+                    if key not in seen:
+                        seen.add(key)
+                        geocode_location(*target, cache)
+                if not put(row):
+                    return
+        except BaseException as e:  # includes SystemExit from iter_csv_rows
+            failure.append(e)
+        finally:
+            put(done)
+    
+    thread = threading.Thread(target=produce, name="geocode-ahead", daemon=True)
+    thread.start()
+    try:
+        while True:
+            row = buffer.get()
+            if row is done:
+                break
+            yield row
+    finally:
+        stop.set()
+        thread.join()
+    if failure:
+        raise failure[0]
+
+
+def create_facility(company_id: int, facility_type_id: int, row: Dict[str, Any], cols: ColumnMap,
+                   existing: Dict[Tuple[str, str, str], Optional[int]], pending: List[tuple],
+                   apply: bool = False, geocode_cache: Optional[GeocodeCache] = None) -> bool:
+    """Queue a facility record from CSV row data for insert_facilities().
+    
+    existing is the (name, city, state) map from load_existing_facilities();
+    queued facilities are added to it so CSV duplicates are skipped too.
+    Returns True if the facility was queued.
+    """
     
     # Extract data from row - try common column name variations
     # For ethanol plants CSV, "Name" is company name, so we'll create facility name from company + location
-    company_name_for_facility = (
-        normalize_value(row.get('name')) or
-        normalize_value(row.get('company_name')) or
-        normalize_value(row.get('company')) or
-        "Unknown Company"
-    )
-    location = normalize_value(row.get('location')) or ''
+    company_name_for_facility = first_value(row, cols.facility_company) or "Unknown Company"
+    # For ethanol CSV, "Location" is state/province code
+    location = first_value(row, cols.location) or ''
     
     facility_name = (
-        normalize_value(row.get('facility_name')) or
-        normalize_value(row.get('plant_name')) or
+        first_value(row, cols.facility_name) or
         f"{company_name_for_facility} - {location}".strip(' -') if location else company_name_for_facility
     )
     
-    address_line1 = (
-        normalize_value(row.get('address')) or
-        normalize_value(row.get('address_line1')) or
-        normalize_value(row.get('street')) or
-        normalize_value(row.get('address1'))
-    )
-    
-    # For ethanol CSV, "Location" is state/province code
-    location_code = normalize_value(row.get('location')) or ''
-    city = normalize_value(row.get('city'))
-    state = normalize_value(row.get('state')) or location_code or 'KS'  # Use location if state not provided
-    postal_code = normalize_value(row.get('zip')) or normalize_value(row.get('postal_code')) or normalize_value(row.get('zipcode'))
-    county = normalize_value(row.get('county'))
+    address_line1 = first_value(row, cols.address)
+    city = first_value(row, cols.city)
+    state = first_value(row, cols.state) or location or 'KS'  # Use location if state not provided
+    postal_code = first_value(row, cols.postal_code)
+    county = first_value(row, cols.county)
     
-    latitude = parse_float(row.get('latitude')) or parse_float(row.get('lat'))
-    longitude = parse_float(row.get('longitude')) or parse_float(row.get('lon')) or parse_float(row.get('lng'))
+    latitude = first_float(row, cols.latitude)
+    longitude = first_float(row, cols.longitude)
     
     # If coordinates not provided, try to geocode from company name + location
     if not latitude or not longitude:
-        print(f"  ⚠ No coordinates found, attempting geocoding...", flush=True)
-        coords = geocode_location(company_name_for_facility, location)
+        logger.info(f"  ⚠ No coordinates found, attempting geocoding...")
+        coords = geocode_location(company_name_for_facility, location, geocode_cache)
         if coords:
             latitude, longitude = coords
-            print(f"  ✓ Geocoded coordinates: {latitude}, {longitude}", flush=True)
+            logger.info(f"  ✓ Geocoded coordinates: {latitude}, {longitude}")
         else:
-            print(f"  ⚠ Skipping {facility_name}: could not geocode location", flush=True)
-            return None
+            logger.warning(f"  ⚠ Skipping {facility_name}: could not geocode location")
+            return False
     
-    website_url = normalize_value(row.get('link')) or normalize_value(row.get('website')) or normalize_value(row.get('website_url'))
-    phone_main = normalize_value(row.get('phone')) or normalize_value(row.get('phone_main'))
-    email_main = normalize_value(row.get('email')) or normalize_value(row.get('email_main'))
+    website_url = first_value(row, cols.website)
+    phone_main = first_value(row, cols.phone)
+    email_main = first_value(row, cols.email)
     
     # Build notes from available data
     notes_parts = []
-    if normalize_value(row.get('feedstock')):
-        notes_parts.append(f"Feedstock: {normalize_value(row.get('feedstock'))}")
-    if normalize_value(row.get('rins')):
-        notes_parts.append(f"RINs: {normalize_value(row.get('rins'))}")
-    capacity_key = 'capacity (mmgy)'
-    if normalize_value(row.get(capacity_key)):
-        notes_parts.append(f"Capacity: {normalize_value(row.get(capacity_key))} MMgy")
-    notes = '; '.join(notes_parts) if notes_parts else (normalize_value(row.get('notes')) or normalize_value(row.get('description')))
+    feedstock = first_value(row, cols.feedstock)
+    if feedstock:
+        notes_parts.append(f"Feedstock: {feedstock}")
+    rins = first_value(row, cols.rins)
+    if rins:
+        notes_parts.append(f"RINs: {rins}")
+    capacity = first_value(row, cols.capacity)
+    if capacity:
+        notes_parts.append(f"Capacity: {capacity} MMgy")
+    notes = '; '.join(notes_parts) if notes_parts else first_value(row, cols.notes)
     
     # Coordinates should be set by now (either from CSV or geocoding)
     # This check is just a safety net
     if not latitude or not longitude:
-        print(f"  ⚠ Skipping {facility_name}: missing latitude/longitude", flush=True)
-        return None
+        logger.warning(f"  ⚠ Skipping {facility_name}: missing latitude/longitude")
+        return False
     
     if not state:
         state = 'KS'  # Default to Kansas
     
-    # Check if facility already exists (by name + city + state)
+    # Check if facility already exists (by name + city + state), in the
+    # database or earlier in this CSV
+    key = (facility_name, city or '', state)
+    if key in existing:
+        facility_id = existing[key]
+        logger.info(f"  ⊙ Facility already exists: {facility_name} in {city}, {state} (ID: {facility_id if facility_id is not None else 'pending'})")
+        return False
+    
+    if not apply:
+        logger.info(f"  [DRY RUN] Would create facility: {facility_name} in {city}, {state}")
+        return False
+    
+    existing[key] = None
+    pending.append((
+        company_id, facility_type_id, facility_name, notes,
+        address_line1, city, county, state, postal_code,
+        latitude, longitude,
+        website_url, phone_main, email_main, notes,
+    ))
+    return True
+
+
+def load_existing_facilities(conn) -> Dict[Tuple[str, str, str], Optional[int]]:
+    """Map (name, city, state) -> facility_id for every facility, in one query."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT facility_id, name, COALESCE(city, ''), state FROM facility")
+        return {(name, city, state): fid for fid, name, city, state in cur.fetchall()}
+
+
+# Columns create_facility queues, in tuple order
+STAGING_COLUMNS = (
+    "company_id, facility_type_id, name, description, "
+    "address_line1, city, county, state, postal_code, "
+    "latitude, longitude, "
+    "website_url, phone_main, email_main, notes"
+)
+
+
+def insert_facilities(conn, pending: List[tuple]) -> Dict[Tuple[str, str, str], int]:
+    """Bulk-load queued facility rows; returns {(name, city or '', state): facility_id}.
+    
+    Rows are COPYed into a temp staging table (typed like facility, dropped at
+    commit), then moved over with one INSERT ... SELECT. facility has no unique
+    key to conflict on, so rows matching an existing (name, city, state) are
+    left out with NOT EXISTS and are missing from the result. geom is built in
+    the SELECT rather than left to the trg_facility_set_geom trigger.
+    """
+    buf = io.StringIO()
+    # Unquoted empty fields are NULL in COPY's csv format
+    csv.writer(buf, lineterminator='\n').writerows(pending)
+    buf.seek(0)
+    
     with conn.cursor() as cur:
         cur.execute(
+            f"""
+            CREATE TEMP TABLE IF NOT EXISTS staging_facility ON COMMIT DROP AS
+            SELECT {STAGING_COLUMNS} FROM facility WITH NO DATA
             """
-            SELECT facility_id FROM facility
-            WHERE name = %s AND city = %s AND state = %s
-            """,
-            (facility_name, city or '', state)
         )
-        existing = cur.fetchone()
-        if existing:
-            print(f"  ⊙ Facility already exists: {facility_name} in {city}, {state} (ID: {existing[0]})", flush=True)
-            return existing[0]
-        
-        if apply:
-            cur.execute(
-                """
-                INSERT INTO facility (
-                    company_id, facility_type_id, name, description,
-                    address_line1, city, county, state, postal_code,
-                    latitude, longitude,
-                    website_url, phone_main, email_main, notes,
-                    status
-                )
-                VALUES (
-                    %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s,
-                    %s, %s,
-                    %s, %s, %s, %s,
-                    'ACTIVE'
-                )
-                RETURNING facility_id
-                """,
-                (
-                    company_id, facility_type_id, facility_name, notes,
-                    address_line1, city, county, state, postal_code,
-                    latitude, longitude,
-                    website_url, phone_main, email_main, notes,
-                )
+        cur.copy_expert(
+            f"COPY staging_facility ({STAGING_COLUMNS}) FROM STDIN WITH (FORMAT csv)",
+            buf
+        )
+        cur.execute(
+            f"""
+            INSERT INTO facility (
+                {STAGING_COLUMNS},
+                geom, status
             )
-            facility_id = cur.fetchone()[0]
-            conn.commit()
-            print(f"  ✓ Created facility: {facility_name} (ID: {facility_id})", flush=True)
-            return facility_id
-        else:
-            print(f"  [DRY RUN] Would create facility: {facility_name} in {city}, {state}", flush=True)
-            return None
+            SELECT
+                s.*,
+                ST_SetSRID(ST_MakePoint(s.longitude::DOUBLE PRECISION,
+                                        s.latitude::DOUBLE PRECISION), 4326),
+                'ACTIVE'
+            FROM staging_facility s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM facility f
+                WHERE f.name = s.name
+                  AND COALESCE(f.city, '') = COALESCE(s.city, '')
+                  AND f.state = s.state
+            )
+            RETURNING facility_id, name, COALESCE(city, ''), state::TEXT
+            """
+        )
+        rows = cur.fetchall()
+        cur.execute("TRUNCATE staging_facility")
+    return {(name, city, state): facility_id for facility_id, name, city, state in rows}
 
 
-def read_csv_file(file_path: str) -> List[Dict[str, Any]]:
-    """Read CSV file and return list of dictionaries."""
-    rows = []
+def iter_csv_rows(file_path: str) -> Iterator[Dict[str, Any]]:
+    """Stream CSV rows as dictionaries, one at a time."""
     try:
         with open(file_path, 'r', encoding='utf-8-sig') as f:
             # Try to detect delimiter
@@ -325,16 +690,14 @@ def read_csv_file(file_path: str) -> List[Dict[str, Any]]:
             delimiter = sniffer.sniff(sample).delimiter
             
             reader = csv.DictReader(f, delimiter=delimiter)
-            for row in reader:
-                # Normalize keys to lowercase for easier access
-                normalized_row = {k.lower().strip(): v for k, v in row.items()}
-                rows.append(normalized_row)
+            # Normalize keys to lowercase for easier access (once, on the header)
+            if reader.fieldnames:
+                reader.fieldnames = [name.lower().strip() for name in reader.fieldnames]
+            yield from reader
     except FileNotFoundError:
         raise SystemExit(f"ERROR: File not found: {file_path}")
     except Exception as e:
         raise SystemExit(f"ERROR reading CSV file: {e}")
-    
-    return rows
 
 
 def main():
@@ -352,71 +715,120 @@ def main():
     )
     
     args = parser.parse_args()
+    setup_logging()
     
     if not args.apply:
-        print("=" * 60)
-        print("DRY RUN MODE - No changes will be made to database")
-        print("=" * 60)
-        print()
+        logger.info("=" * 60)
+        logger.info("DRY RUN MODE - No changes will be made to database")
+        logger.info("=" * 60)
+        logger.info("")
     
     # Read CSV
-    print(f"Reading CSV file: {args.csv_file}", flush=True)
-    rows = read_csv_file(args.csv_file)
-    print(f"Found {len(rows)} rows in CSV", flush=True)
+    logger.info(f"Reading CSV file: {args.csv_file}")
+    # Rows are streamed, so take the count and a sample in a quick first pass
+    first_row = None
+    total_rows = 0
+    for row in iter_csv_rows(args.csv_file):
+        if first_row is None:
+            first_row = row
+        total_rows += 1
+    logger.info(f"Found {total_rows} rows in CSV")
     
-    if len(rows) == 0:
-        print("No data to import")
+    if total_rows == 0:
+        logger.info("No data to import")
         return
+    cols = ColumnMap.from_header(first_row.keys())
     
     # Show first row as sample
-    print("\nSample row (first row):", flush=True)
-    for key, value in list(rows[0].items())[:10]:
-        print(f"  {key}: {value}", flush=True)
-    print(flush=True)
+    logger.info("\nSample row (first row):")
+    for key, value in list(first_row.items())[:10]:
+        logger.info(f"  {key}: {value}")
+    logger.info("")
     
     # Connect to database
-    print("Connecting to database...", flush=True)
+    logger.info("Connecting to database...")
     conn = db_connect()
-    print("✓ Connected", flush=True)
+    logger.info("✓ Connected")
+    geocode_cache = GeocodeCache()
+    rows = None
     
     try:
+        # Everything below is one transaction, committed at the end with --apply
+        # and rolled back otherwise. Re-running is safe (upserts plus the
+        # existing-facility check), so skip the WAL flush wait on that commit.
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL synchronous_commit = off")
+        
         # Get or create Ethanol Plant facility type
-        print("\nChecking facility type...", flush=True)
-        facility_type_id = get_or_create_facility_type(conn, "Ethanol Plant")
-        print(f"Using facility_type_id: {facility_type_id}", flush=True)
+        logger.info("\nChecking facility type...")
+        facility_type_cache: Dict[str, int] = {}
+        company_cache = load_companies(conn)
+        prepare_company_upsert(conn)
+        facility_type_id = get_or_create_facility_type(conn, "Ethanol Plant", facility_type_cache)
+        logger.info(f"Using facility_type_id: {facility_type_id}")
         
         # Process each row
-        print(f"\nProcessing {len(rows)} rows...", flush=True)
-        print("-" * 60, flush=True)
+        logger.info(f"\nProcessing {total_rows} rows...")
+        logger.info("-" * 60)
         
         created_companies = 0
         created_facilities = 0
         skipped = 0
+        duplicates = 0
+        seen_rows = set()
+        
+        existing_facilities = load_existing_facilities(conn)
+        pending_facilities: List[tuple] = []
         
+        def flush_facilities():
+            nonlocal created_facilities
+            if not pending_facilities:
+                return
+            facility_ids = insert_facilities(conn, pending_facilities)
+            for values in pending_facilities:
+                # values[2], values[5], values[7] are name, city, state
+                key = (values[2], values[5] or '', values[7])
+                facility_id = facility_ids.get(key)
+                if facility_id is None:
+                    logger.info(f"  ⊙ Facility already exists: {values[2]} in {values[5]}, {values[7]}")
+                    continue
+                existing_facilities[key] = facility_id
+                logger.info(f"  ✓ Created facility: {values[2]} (ID: {facility_id})")
+            created_facilities += len(facility_ids)
+            pending_facilities.clear()
+        
+        rows = geocode_ahead(iter_csv_rows(args.csv_file), cols, geocode_cache)
         for i, row in enumerate(rows, 1):
-            print(f"\n[{i}/{len(rows)}] Processing row...", flush=True)
+            logger.info(f"\n[{i}/{total_rows}] Processing row...")
             
             # Get company name - try common variations
             # Note: CSV has "Name" column which is the company name
-            company_name = (
-                normalize_value(row.get('name')) or
-                normalize_value(row.get('company_name')) or
-                normalize_value(row.get('company')) or
-                normalize_value(row.get('owner')) or
-                normalize_value(row.get('operator'))
-            )
+            company_name = first_value(row, cols.company)
             
             if not company_name:
-                print(f"  ⚠ Skipping row {i}: no company name found", flush=True)
+                logger.warning(f"  ⚠ Skipping row {i}: no company name found")
                 skipped += 1
                 continue
             
+            # Rows repeating a (company, location, facility name) seen earlier
+            # in the file (e.g. one row per product stream) add nothing
+            row_key = (
+                company_name,
+                first_value(row, cols.location) or '',
+                first_value(row, cols.facility_name) or '',
+            )
+            if row_key in seen_rows:
+                logger.info(f"  ⊙ Skipping row {i}: duplicate of an earlier row")
+                duplicates += 1
+                continue
+            seen_rows.add(row_key)
+            
             # Get or create company
-            company_website = normalize_value(row.get('company_website')) or normalize_value(row.get('company_website_url'))
-            company_phone = normalize_value(row.get('company_phone')) or normalize_value(row.get('company_phone_main'))
+            company_website = first_value(row, cols.company_website)
+            company_phone = first_value(row, cols.company_phone)
             
             company_id, was_created = get_or_create_company(
-                conn, company_name,
+                conn, company_name, company_cache,
                 website_url=company_website,
                 phone_main=company_phone
             )
@@ -424,34 +836,45 @@ def main():
             if was_created:
                 created_companies += 1
             
-            # Create facility
-            facility_id = create_facility(
-                conn, company_id, facility_type_id, row, apply=args.apply
+            # Queue facility; inserted in batches
+            create_facility(
+                company_id, facility_type_id, row, cols,
+                existing_facilities, pending_facilities,
+                apply=args.apply, geocode_cache=geocode_cache
             )
-            
-            if facility_id:
-                created_facilities += 1
+            if len(pending_facilities) >= FACILITY_BATCH_SIZE:
+                flush_facilities()
+        
+        flush_facilities()
+        
+        if args.apply:
+            conn.commit()
+        else:
+            # Dry run: drop any companies/facility type created along the way
+            conn.rollback()
         
         # Summary
-        print("\n" + "=" * 60)
-        print("IMPORT SUMMARY")
-        print("=" * 60)
-        print(f"Rows processed: {len(rows)}")
-        print(f"Companies created: {created_companies}")
-        print(f"Facilities created: {created_facilities}")
-        print(f"Skipped: {skipped}")
+        logger.info("\n" + "=" * 60)
+        logger.info("IMPORT SUMMARY")
+        logger.info("=" * 60)
+        logger.info(f"Rows processed: {total_rows}")
+        logger.info(f"Companies created: {created_companies}")
+        logger.info(f"Facilities created: {created_facilities}")
+        logger.info(f"Skipped: {skipped}")
+        logger.info(f"Duplicate rows: {duplicates}")
         
         if not args.apply:
-            print("\nThis was a DRY RUN. Use --apply to actually import data.")
+            logger.info("\nThis was a DRY RUN. Use --apply to actually import data.")
         
     except Exception as e:
         conn.rollback()
-        print(f"\nERROR: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"\nERROR: {e}")
         sys.exit(1)
     finally:
+        if rows is not None:
+            rows.close()  # stops the geocoding thread before the cache closes
         conn.close()
+        geocode_cache.close()
 
 
 if __name__ == "__main__":
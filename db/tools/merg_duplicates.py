@@ -28,13 +28,15 @@ Notes:
 
 import os
 import re
+import math
 import sys
 import argparse
-from typing import Any, Dict, List, Optional, Tuple, Set
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple, Set
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 import psycopg2
-import psycopg2.extras
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -46,9 +48,51 @@ CR_PATTERNS = [
     (re.compile(r"\bC\.?\s*R\.?\b", re.IGNORECASE), "County Road"),
     (re.compile(r"\bCo\.?\s*Rd\.?\b", re.IGNORECASE), "County Road"),
     (re.compile(r"\bCty\.?\s*Rd\.?\b", re.IGNORECASE), "County Road"),
+    (re.compile(r"\bCounty\s+Rd\b", re.IGNORECASE), "County Road"),
 ]
+_WS_RE = re.compile(r"\s+")
+_PUNCT_RE = re.compile(r"[^\w\s&-]")
+# ASCII characters _PUNCT_RE would drop, for the str.translate fast path
+_PUNCT_TBL = {i: None for i in range(128) if _PUNCT_RE.match(chr(i))}
+_KS_TOKEN_RE = re.compile(r"(?<!\S)Ks(?!\S)")
 BAD = {"", "n/a", "na", "none", "unknown", "null", "-", "--"}
 
+# Facility columns the merge reads; only those present in the database are
+# selected (see facility_select_list). geom itself is never shipped (hex EWKB per
+# row): rows carry has_geom, and distances come from fetch_projected_geoms.
+FACILITY_COLUMNS = [
+    "facility_id",
+    "company_id",
+    "facility_type_id",
+    "name",
+    "description",
+    "address_line1",
+    "address_line2",
+    "city",
+    "county",
+    "state",
+    "postal_code",
+    "latitude",
+    "longitude",
+    "status",
+    "website_url",
+    "phone_main",
+    "email_main",
+    "notes",
+    # optional real-world extras:
+    "geom_from_address",
+    "imported_source",
+    "updated_at",
+    "created_at",
+]
+
+# Stored generated columns from db/init/18_facility_company_norm_columns.sql: read-only,
+# so never copied into INSERTs
+GENERATED_COLUMNS = {"address_line1_norm", "name_norm"}
+
+# Rows per round-trip when streaming companies/facilities from server-side cursors
+FETCH_ITERSIZE = 10000
+
 COMPANY_SUFFIXES = [
     "inc", "inc.", "incorporated",
     "corp", "corp.", "corporation",
@@ -75,7 +119,17 @@ def db_connect():
         port=port,
     )
 
+# Catalog lookups, keyed by (kind, schema, table). The schema doesn't change
+# mid-run, so each table's columns/existence/FK list is queried only once.
+_META_CACHE: Dict[Tuple[str, str, str], Any] = {}
+
+def clear_meta_cache():
+    _META_CACHE.clear()
+
 def table_columns(conn, schema: str, table: str) -> Set[str]:
+    cache_key = ("columns", schema, table)
+    if cache_key in _META_CACHE:
+        return _META_CACHE[cache_key]
     sql = """
       SELECT column_name
       FROM information_schema.columns
@@ -83,9 +137,14 @@ def table_columns(conn, schema: str, table: str) -> Set[str]:
     """
     with conn.cursor() as cur:
         cur.execute(sql, (schema, table))
-        return {r[0] for r in cur.fetchall()}
+        cols = {r[0] for r in cur.fetchall()}
+    _META_CACHE[cache_key] = cols
+    return cols
 
 def table_exists(conn, schema: str, table: str) -> bool:
+    cache_key = ("exists", schema, table)
+    if cache_key in _META_CACHE:
+        return _META_CACHE[cache_key]
     sql = """
       SELECT 1
       FROM information_schema.tables
@@ -94,7 +153,9 @@ def table_exists(conn, schema: str, table: str) -> bool:
     """
     with conn.cursor() as cur:
         cur.execute(sql, (schema, table))
-        return cur.fetchone() is not None
+        exists = cur.fetchone() is not None
+    _META_CACHE[cache_key] = exists
+    return exists
 
 def get_deactivated_companies_table(conn) -> Optional[str]:
     """Get the name of the deactivated companies table (preferring singular form)"""
@@ -110,34 +171,114 @@ def get_fk_references(conn, referenced_schema: str, referenced_table: str) -> Li
     """
     Find all single-column foreign keys that reference referenced_schema.referenced_table.
     Returns list of (fk_schema, fk_table, fk_column).
+
+    Starts from pg_depend (indexed on the referenced object) instead of scanning
+    pg_constraint; an FK constraint has a normal dependency on the table it references.
     """
+    cache_key = ("fk_refs", referenced_schema, referenced_table)
+    if cache_key in _META_CACHE:
+        return _META_CACHE[cache_key]
+
     sql = """
-    SELECT
+    SELECT DISTINCT
       nsp_child.nspname  AS fk_schema,
       rel_child.relname  AS fk_table,
       att_child.attname  AS fk_column
-    FROM pg_constraint con
-    JOIN pg_class rel_parent ON rel_parent.oid = con.confrelid
-    JOIN pg_namespace nsp_parent ON nsp_parent.oid = rel_parent.relnamespace
+    FROM pg_depend d
+    JOIN pg_constraint con ON con.oid = d.objid
     JOIN pg_class rel_child ON rel_child.oid = con.conrelid
     JOIN pg_namespace nsp_child ON nsp_child.oid = rel_child.relnamespace
-    JOIN unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord) ON TRUE
-    JOIN pg_attribute att_child ON att_child.attrelid = con.conrelid AND att_child.attnum = k.attnum
-    WHERE con.contype = 'f'
-      AND nsp_parent.nspname = %s
-      AND rel_parent.relname = %s
+    JOIN pg_attribute att_child ON att_child.attrelid = con.conrelid AND att_child.attnum = con.conkey[1]
+    WHERE d.classid = 'pg_constraint'::regclass
+      AND d.refclassid = 'pg_class'::regclass
+      AND d.refobjid = (quote_ident(%s) || '.' || quote_ident(%s))::regclass
+      AND d.deptype = 'n'
+      AND con.contype = 'f'
+      AND con.confrelid = d.refobjid
       AND array_length(con.conkey, 1) = 1
     ORDER BY fk_schema, fk_table, fk_column
     """
     with conn.cursor() as cur:
         cur.execute(sql, (referenced_schema, referenced_table))
-        return [(r[0], r[1], r[2]) for r in cur.fetchall()]
+        refs = [(r[0], r[1], r[2]) for r in cur.fetchall()]
+    _META_CACHE[cache_key] = refs
+    return refs
+
+def prefetch_table_columns(conn, schema: str, tables: List[str]):
+    """
+    Fill the table_columns cache for several tables with one information_schema query.
+    A table that comes back with columns also exists; one with none is left for
+    table_exists to check on demand (information_schema hides columns without privileges).
+    """
+    found: Dict[str, Set[str]] = {t: set() for t in tables}
+    sql = """
+      SELECT table_name, column_name
+      FROM information_schema.columns
+      WHERE table_schema = %s AND table_name = ANY(%s)
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql, (schema, list(tables)))
+        for table, column in cur.fetchall():
+            found[table].add(column)
+    for table, cols in found.items():
+        _META_CACHE[("columns", schema, table)] = cols
+        if cols:
+            _META_CACHE[("exists", schema, table)] = True
+
+def prefetch_metadata(conn):
+    """Warm the metadata cache with everything the merge phases look up."""
+    prefetch_table_columns(conn, "public", ["company", "facility", "deactivated_company",
+                                            "deactivated_companies", "deactivated_facilities"])
+    get_deactivated_companies_table(conn)
+    table_exists(conn, "public", "deactivated_facilities")
+    get_fk_references(conn, "public", "company")
+    get_fk_references(conn, "public", "facility")
+
+def count_dependents(conn, fk_refs: List[Tuple[str, str, str]], ids: List[int]) -> Dict[Tuple[str, str, str], int]:
+    """
+    Dependent counts of ids for every FK column, in one UNION ALL round-trip.
+    Returns {(fk_schema, fk_table, fk_col): count}, one entry per ref.
+    """
+    if not fk_refs:
+        return {}
+    sql = " UNION ALL ".join(
+        f"SELECT {i}, COUNT(*) FROM {fk_schema}.{fk_table} WHERE {fk_col} = ANY(%s)"
+        for i, (fk_schema, fk_table, fk_col) in enumerate(fk_refs)
+    )
+    with conn.cursor() as cur:
+        cur.execute(sql, [list(ids)] * len(fk_refs))
+        return {tuple(fk_refs[i]): int(n) for i, n in cur.fetchall()}
 
-def count_dependents(conn, fk_schema: str, fk_table: str, fk_col: str, ids: List[int]) -> int:
-    sql = f"SELECT COUNT(*) FROM {fk_schema}.{fk_table} WHERE {fk_col} = ANY(%s)"
+def precount_dependents(conn, fk_refs: List[Tuple[str, str, str]], ids: List[int]) -> Dict[Tuple[str, str, str, int], int]:
+    """
+    Dependent counts for every id in ids, one GROUP BY query per FK column.
+    Returns {(fk_schema, fk_table, fk_col, id): count}; ids with no dependents are absent.
+    """
+    counts: Dict[Tuple[str, str, str, int], int] = {}
+    if not ids:
+        return counts
     with conn.cursor() as cur:
-        cur.execute(sql, (ids,))
-        return int(cur.fetchone()[0])
+        for fk_schema, fk_table, fk_col in fk_refs:
+            sql = f"SELECT {fk_col}, COUNT(*) FROM {fk_schema}.{fk_table} WHERE {fk_col} = ANY(%s) GROUP BY {fk_col}"
+            cur.execute(sql, (list(ids),))
+            for ref_id, n in cur.fetchall():
+                counts[(fk_schema, fk_table, fk_col, ref_id)] = int(n)
+    return counts
+
+def dependents_for(conn, counts: Optional[Dict[Tuple[str, str, str, int], int]],
+                   fk_schema: str, fk_table: str, fk_col: str, ids: List[int]) -> int:
+    """Dependent count for one FK column, answered from precount_dependents output when given."""
+    if counts is None:
+        return count_dependents(conn, [(fk_schema, fk_table, fk_col)], ids).get((fk_schema, fk_table, fk_col), 0)
+    return sum(counts.get((fk_schema, fk_table, fk_col, i), 0) for i in ids)
+
+def dependents_by_ref(conn, counts: Optional[Dict[Tuple[str, str, str, int], int]],
+                      fk_refs: List[Tuple[str, str, str]], ids: List[int]) -> Dict[Tuple[str, str, str], int]:
+    """Dependent counts for every ref in fk_refs: from counts when given, else one count_dependents query."""
+    if counts is None:
+        found = count_dependents(conn, fk_refs, ids)
+        return {tuple(ref): found.get(tuple(ref), 0) for ref in fk_refs}
+    return {tuple(ref): dependents_for(conn, counts, *ref, ids) for ref in fk_refs}
 
 def repoint_dependents(conn, fk_schema: str, fk_table: str, fk_col: str, old_ids: List[int], new_id: int) -> int:
     """
@@ -146,42 +287,41 @@ def repoint_dependents(conn, fk_schema: str, fk_table: str, fk_col: str, old_ids
     """
     # Special handling for facility table with unique constraint on (company_id, name, city, state)
     if fk_table == "facility" and fk_col == "company_id":
-        # Check for conflicts: facilities that would violate unique constraint
-        conflict_sql = """
-            SELECT f1.facility_id, f1.name, f1.city, f1.state
-            FROM public.facility f1
-            WHERE f1.company_id = ANY(%s)
-            AND EXISTS (
-                SELECT 1 FROM public.facility f2
-                WHERE f2.company_id = %s
-                AND f2.name = f1.name
-                AND COALESCE(f2.city, '') = COALESCE(f1.city, '')
-                AND COALESCE(f2.state, '') = COALESCE(f1.state, '')
+        # One anti-join UPDATE moves every non-conflicting facility; the outer SELECT still
+        # sees the pre-update snapshot, so it reports the skipped ones in the same round-trip
+        # (always one row, with NULL facility columns when nothing was skipped).
+        # Keep the conflict predicate in step with facility_company_name_city_state_idx
+        # (db/init/20_index_facility_merge_key.sql) so the probe stays an index scan.
+        sql = """
+            WITH moved AS (
+                UPDATE public.facility f
+                SET company_id = %s
+                WHERE f.company_id = ANY(%s)
+                AND NOT EXISTS (
+                    SELECT 1 FROM public.facility f2
+                    WHERE f2.company_id = %s
+                    AND f2.name = f.name
+                    AND COALESCE(f2.city, '') = COALESCE(f.city, '')
+                    AND COALESCE(f2.state, '') = COALESCE(f.state, '')
+                )
+                RETURNING f.facility_id
             )
+            SELECT (SELECT count(*) FROM moved), s.facility_id, s.name, s.city, s.state
+            FROM (SELECT 1) AS one
+            LEFT JOIN public.facility s
+              ON s.company_id = ANY(%s)
+             AND s.facility_id NOT IN (SELECT facility_id FROM moved)
+            ORDER BY s.facility_id
         """
         with conn.cursor() as cur:
-            cur.execute(conflict_sql, (old_ids, new_id))
-            conflicts = cur.fetchall()
-            
-            if conflicts:
-                conflict_ids = [c[0] for c in conflicts]
-                print(f"    ⚠️  Warning: {len(conflicts)} facilities would violate unique constraint, skipping repoint:")
-                for c in conflicts:
-                    print(f"        facility_id={c[0]}: '{c[1]}', {c[2]}, {c[3]}")
-                # Update only non-conflicting records
-                exclude_sql = """
-                    UPDATE public.facility 
-                    SET company_id = %s 
-                    WHERE company_id = ANY(%s) 
-                    AND facility_id != ALL(%s)
-                """
-                cur.execute(exclude_sql, (new_id, old_ids, conflict_ids))
-                return cur.rowcount
-            else:
-                # No conflicts, proceed normally
-                sql = "UPDATE public.facility SET company_id = %s WHERE company_id = ANY(%s)"
-                cur.execute(sql, (new_id, old_ids))
-                return cur.rowcount
+            cur.execute(sql, (new_id, old_ids, new_id, old_ids))
+            rows = cur.fetchall()
+        conflicts = [r[1:] for r in rows if r[1] is not None]
+        if conflicts:
+            print(f"    ⚠️  Warning: {len(conflicts)} facilities would violate unique constraint, skipping repoint:")
+            for c in conflicts:
+                print(f"        facility_id={c[0]}: '{c[1]}', {c[2]}, {c[3]}")
+        return rows[0][0] if rows else 0
     else:
         # Normal repoint for other tables
         sql = f"UPDATE {fk_schema}.{fk_table} SET {fk_col} = %s WHERE {fk_col} = ANY(%s)"
@@ -189,20 +329,62 @@ def repoint_dependents(conn, fk_schema: str, fk_table: str, fk_col: str, old_ids
             cur.execute(sql, (new_id, old_ids))
             return cur.rowcount
 
+def repoint_children(conn, fk_refs: List[Tuple[str, str, str]], old_ids: List[int],
+                     new_id: int) -> List[Tuple[Tuple[str, str, str], int]]:
+    """
+    Repoint every child FK column from old_ids to new_id in one statement (one UPDATE
+    CTE per column, counts read back together). A table with two FK columns would
+    have the same row updated twice in one statement, which Postgres doesn't allow,
+    so such refs fall back to repoint_dependents one at a time.
+    """
+    tables = [(s, t) for s, t, _ in fk_refs]
+    single = [ref for ref in fk_refs if tables.count(ref[:2]) == 1]
+    results: List[Tuple[Tuple[str, str, str], int]] = []
+    if single:
+        ctes = ",\n".join(
+            f"u{i} AS (UPDATE {s}.{t} SET {c} = %s WHERE {c} = ANY(%s) RETURNING 1)"
+            for i, (s, t, c) in enumerate(single)
+        )
+        counts = ", ".join(f"(SELECT count(*) FROM u{i})" for i in range(len(single)))
+        with conn.cursor() as cur:
+            cur.execute(f"WITH {ctes}\nSELECT {counts}", (new_id, old_ids) * len(single))
+            results.extend(zip(single, (int(n) for n in cur.fetchone())))
+    for ref in fk_refs:
+        if ref not in single:
+            results.append((ref, repoint_dependents(conn, *ref, old_ids, new_id)))
+    return results
+
+def run_statements(cur, statements: List[Tuple[str, Tuple[Any, ...]]]):
+    """
+    Send several statements in one round-trip: psycopg2 interpolates them client-side
+    and the server runs the batch in order, inside the current transaction. Only the
+    last statement's result (and rowcount) is available afterwards.
+    """
+    sql = ";\n".join(stmt.strip() for stmt, _ in statements)
+    cur.execute(sql, tuple(p for _, params in statements for p in params))
+
 # ----------------------------
 # Normalization
 # ----------------------------
+# These run for several columns of every row (keys, display, proposals) and see the
+# same city/state/name strings over and over, so the string paths are memoized
+# (as are clean_street and normalize_company_name below).
+@lru_cache(maxsize=200_000)
 def norm_ws(s: str) -> str:
-    return re.sub(r"\s+", " ", s).strip()
+    return _WS_RE.sub(" ", s).strip()
+
+@lru_cache(maxsize=200_000)
+def _normalize_str(s: str) -> Optional[str]:
+    t = norm_ws(s)
+    return t if t else None
 
 def normalize_value(v: Any) -> Any:
-    if v is None:
-        return None
+    # Only strings are normalized (and cached); numbers, dates, etc. pass through
     if isinstance(v, str):
-        t = norm_ws(v)
-        return t if t else None
+        return _normalize_str(v)
     return v
 
+@lru_cache(maxsize=200_000)
 def clean_street(s: Optional[str]) -> str:
     if not s:
         return ""
@@ -211,14 +393,15 @@ def clean_street(s: Optional[str]) -> str:
         return ""
     for pat, repl in CR_PATTERNS:
         x = pat.sub(repl, x)
-    x = re.sub(r"\bCounty\s+Rd\b", "County Road", x, flags=re.IGNORECASE)
     return norm_ws(x)
 
+@lru_cache(maxsize=200_000)
 def normalize_company_name(name: Optional[str]) -> str:
     if not name:
         return ""
     n = norm_ws(name).lower()
-    n = re.sub(r"[^\w\s&-]", "", n)  # drop punctuation except word/space/&/-
+    # drop punctuation except word/space/&/-
+    n = n.translate(_PUNCT_TBL) if n.isascii() else _PUNCT_RE.sub("", n)
     parts = [p for p in n.split() if p not in COMPANY_SUFFIXES]
     return " ".join(parts)
 
@@ -258,10 +441,24 @@ def ask_yes_no(prompt: str) -> bool:
 # ----------------------------
 # Company merge (phase A)
 # ----------------------------
-def fetch_companies(conn) -> List[Dict[str, Any]]:
-    """Fetch companies, excluding those already merged (in deactivated_company/deactivated_companies)"""
-    # Exclude companies that have been merged/archived
-    exclude_clause = ""
+def _dict_rows(cur) -> Iterator[Dict[str, Any]]:
+    """
+    Rows of an executed cursor as plain dicts. RealDictRow is an OrderedDict subclass
+    with a Python-level __setitem__; plain dicts are smaller and cheaper to read and
+    update in the grouping/merge loops, and description is only read once.
+    """
+    names = None
+    for row in cur:
+        if names is None:
+            names = [d[0] for d in cur.description]
+        yield dict(zip(names, row))
+
+def fetch_companies(conn) -> Iterator[Dict[str, Any]]:
+    """Stream companies, excluding those already merged (in deactivated_company/deactivated_companies)"""
+    # Exclude companies that have been merged/archived, as an anti-join: NOT IN (subquery)
+    # can't become a hashed anti-join and matches nothing once the subquery yields a NULL
+    exclude_join = ""
+    exclude_where = ""
     deact_table = get_deactivated_companies_table(conn)
     if deact_table:
         # Check what columns the deactivated table has
@@ -269,22 +466,74 @@ def fetch_companies(conn) -> List[Dict[str, Any]]:
         # Try to find the ID column - could be original_company_id or company_id
         id_col = "original_company_id" if "original_company_id" in deact_cols else ("company_id" if "company_id" in deact_cols else None)
         if id_col:
-            # Check if reason column exists for filtering
-            if "reason" in deact_cols:
-                exclude_clause = f"AND company_id NOT IN (SELECT {id_col} FROM public.{deact_table} WHERE reason = 'MERGED')"
-            else:
-                # If no reason column, exclude all companies in the deactivated table
-                exclude_clause = f"AND company_id NOT IN (SELECT {id_col} FROM public.{deact_table})"
+            # Only MERGED rows if there's a reason column, otherwise everything in the deactivated table
+            reason = " AND d.reason = 'MERGED'" if "reason" in deact_cols else ""
+            exclude_join = f"LEFT JOIN public.{deact_table} d ON d.{id_col} = c.company_id{reason}"
+            exclude_where = f"AND d.{id_col} IS NULL"
     
+    # name_norm (when migrated) is normalize_company_name computed by Postgres on write
+    norm = ", c.name_norm" if "name_norm" in table_columns(conn, "public", "company") else ""
     sql = f"""
-        SELECT company_id, name, website_url, phone_main, notes 
-        FROM public.company 
-        WHERE 1=1 {exclude_clause}
-        ORDER BY company_id
+        SELECT c.company_id, c.name, c.website_url, c.phone_main, c.notes{norm}
+        FROM public.company c
+        {exclude_join}
+        WHERE 1=1 {exclude_where}
+        ORDER BY c.company_id
     """
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+    with conn.cursor(name="company_scan") as cur:
+        cur.itersize = FETCH_ITERSIZE
         cur.execute(sql)
-        return list(cur.fetchall())
+        yield from _dict_rows(cur)
+
+def fetch_similar_company_pairs(conn, threshold: float) -> List[Tuple[int, int]]:
+    """
+    (company_id, company_id) pairs whose normalized names are trigram-similar
+    (pg_trgm %, threshold 0-1). The self-join uses the GIN trigram index from
+    db/init/19_company_name_trgm.sql, so only near matches come back to Python.
+    """
+    key = "{t}.name_norm" if "name_norm" in table_columns(conn, "public", "company") else "lower({t}.name)"
+    a_key, b_key = key.format(t="a"), key.format(t="b")
+    # No query parameters, so % is pg_trgm's similarity operator, not a placeholder
+    sql = f"""
+        SELECT a.company_id, b.company_id
+        FROM public.company a
+        JOIN public.company b ON a.company_id < b.company_id AND {a_key} % {b_key}
+        WHERE {a_key} <> ''
+    """
+    with conn.cursor() as cur:
+        # Transaction-local, like SET LOCAL
+        cur.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", (str(threshold),))
+        cur.execute(sql)
+        return [(a, b) for a, b in cur.fetchall()]
+
+def link_company_groups(comp_groups: Dict[str, List[Dict[str, Any]]], company_keys: Dict[int, str],
+                        pairs: Iterable[Tuple[int, int]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Union the name-key groups of every linked company pair (transitively); pairs
+    naming companies outside comp_groups (e.g. already merged) are ignored.
+    """
+    parent = {k: k for k in comp_groups}
+
+    def find(k: str) -> str:
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    for a, b in pairs:
+        ka, kb = company_keys.get(a), company_keys.get(b)
+        if ka is None or kb is None:
+            continue
+        ra, rb = find(ka), find(kb)
+        if ra != rb:
+            parent[rb] = ra
+
+    linked: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for k, rows in comp_groups.items():
+        linked[find(k)].extend(rows)
+    for rows in linked.values():
+        rows.sort(key=lambda r: r["company_id"])
+    return linked
 
 def company_score(r: Dict[str, Any]) -> int:
     s = 0
@@ -294,26 +543,35 @@ def company_score(r: Dict[str, Any]) -> int:
             s += w
     return s
 
+def combine_texts(values: Iterable[Optional[str]]) -> Optional[str]:
+    """
+    Combine distinct text values in one pass. Each value is lowercased once and kept
+    only if no kept chunk already contains it; a value containing kept chunks
+    replaces them (the longer one wins), so nothing is duplicated. Exact repeats
+    are dropped by a set lookup before any substring scan.
+    """
+    chunks: List[Tuple[str, str]] = []  # (text, lowercased)
+    seen: Set[str] = set()  # every lowercased value already folded in (all still covered)
+    for v in values:
+        t = normalize_value(v)
+        if not t:
+            continue
+        low = t.lower()
+        if low in seen:
+            continue
+        seen.add(low)
+        if any(low in kept for _, kept in chunks):
+            continue
+        covered = [i for i, (_, kept) in enumerate(chunks) if kept in low]
+        if covered:
+            chunks[covered[0]] = (t, low)
+            chunks = [c for i, c in enumerate(chunks) if i not in covered[1:]]
+        else:
+            chunks.append((t, low))
+    return "\n\n---\n\n".join(t for t, _ in chunks) or None
+
 def combine_text(a: Optional[str], b: Optional[str]) -> Optional[str]:
-    a = normalize_value(a)
-    b = normalize_value(b)
-    if not a and not b:
-        return None
-    if a and not b:
-        return a
-    if b and not a:
-        return b
-    if a == b:
-        return a
-    # Check if one contains the other (avoid duplicates)
-    a_lower = a.lower().strip() if a else ""
-    b_lower = b.lower().strip() if b else ""
-    if a_lower and b_lower:
-        if a_lower in b_lower:
-            return b  # b contains a, return the longer one
-        if b_lower in a_lower:
-            return a  # a contains b, return the longer one
-    return f"{a}\n\n---\n\n{b}"
+    return combine_texts((a, b))
 
 def propose_company_canonical(rows: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[int]]:
     # choose a base record (best completeness)
@@ -326,7 +584,7 @@ def propose_company_canonical(rows: List[Dict[str, Any]]) -> Tuple[Dict[str, Any
             merged["website_url"] = normalize_value(r.get("website_url"))
         if not normalize_value(merged.get("phone_main")) and normalize_value(r.get("phone_main")):
             merged["phone_main"] = normalize_value(r.get("phone_main"))
-        merged["notes"] = combine_text(merged.get("notes"), r.get("notes"))
+    merged["notes"] = combine_texts([base.get("notes")] + [r.get("notes") for r in others])
     return merged, [r["company_id"] for r in rows]
 
 def print_company_group(rows: List[Dict[str, Any]], proposed: Dict[str, Any]):
@@ -377,12 +635,16 @@ def print_company_group(rows: List[Dict[str, Any]], proposed: Dict[str, Any]):
     
     return trivial_name_diff and len(diffs) == 0
 
-def apply_company_merge(conn, proposed: Dict[str, Any], group_ids: List[int], apply: bool) -> List[int]:
+def apply_company_merge(conn, proposed: Dict[str, Any], group_ids: List[int], apply: bool,
+                        counts: Optional[Dict[Tuple[str, str, str, int], int]] = None,
+                        leftover_facilities: Optional[Set[int]] = None) -> List[int]:
     """
     Canonical company is proposed['company_id'].
     Repoint all FKs from other ids -> canonical.
     Update canonical record with merged fields.
     Optionally archive other company rows if public.deactivated_company or public.deactivated_companies exists.
+    counts: precount_dependents output covering group_ids (otherwise counted here).
+    leftover_facilities: if given, receives the ids of facilities left on old company_ids.
     
     Returns: list of old company_ids that still have facilities (couldn't be repointed due to constraints)
     """
@@ -394,8 +656,8 @@ def apply_company_merge(conn, proposed: Dict[str, Any], group_ids: List[int], ap
     fk_refs = get_fk_references(conn, "public", "company")
 
     # show dependents summary
-    for fk_schema, fk_table, fk_col in fk_refs:
-        c = count_dependents(conn, fk_schema, fk_table, fk_col, old_ids)
+    planned = dependents_by_ref(conn, counts, fk_refs, old_ids)
+    for (fk_schema, fk_table, fk_col), c in planned.items():
         if c:
             print(f"    will repoint {c} rows in {fk_schema}.{fk_table}.{fk_col}")
 
@@ -403,167 +665,163 @@ def apply_company_merge(conn, proposed: Dict[str, Any], group_ids: List[int], ap
         print("    DRY RUN: would repoint FKs + update canonical company.")
         return old_ids  # Return all old_ids in dry run
 
-    # repoint dependents
-    for fk_schema, fk_table, fk_col in fk_refs:
-        updated = repoint_dependents(conn, fk_schema, fk_table, fk_col, old_ids, canonical_id)
-        if updated:
-            print(f"    repointed {updated} rows in {fk_schema}.{fk_table}.{fk_col}")
-    
-    # After repoint, check which old company_ids still have facilities (couldn't be repointed)
-    remaining_old_ids = []
-    check_sql = "SELECT DISTINCT company_id FROM public.facility WHERE company_id = ANY(%s)"
-    with conn.cursor() as cur:
-        cur.execute(check_sql, (old_ids,))
-        remaining = cur.fetchall()
-        remaining_old_ids = [r[0] for r in remaining]
-
-    # update canonical company fields
-    sql = """
-      UPDATE public.company
-      SET website_url = %s,
-          phone_main  = %s,
-          notes       = %s
-      WHERE company_id = %s
-    """
-    with conn.cursor() as cur:
-        cur.execute(sql, (proposed.get("website_url"), proposed.get("phone_main"), proposed.get("notes"), canonical_id))
+    # transaction
+    try:
+        # repoint dependents: facilities go first on their own (unique-key conflicts are
+        # skipped and reported); every other FK moves wholesale in one statement, whatever
+        # the precount said (rows may have been added since), and reports what it moved
+        for fk_schema, fk_table, fk_col in fk_refs:
+            if fk_table == "facility" and fk_col == "company_id":
+                updated = repoint_dependents(conn, fk_schema, fk_table, fk_col, old_ids, canonical_id)
+                if updated:
+                    print(f"    repointed {updated} rows in {fk_schema}.{fk_table}.{fk_col}")
+        others = [ref for ref in fk_refs if not (ref[1] == "facility" and ref[2] == "company_id")]
+        for (fk_schema, fk_table, fk_col), updated in repoint_children(conn, others, old_ids, canonical_id):
+            if updated:
+                print(f"    repointed {updated} rows in {fk_schema}.{fk_table}.{fk_col}")
 
-    # Identify companies with no remaining dependents (can be safely moved to deactivated_company/deactivated_companies)
-    companies_to_deactivate = [oid for oid in old_ids if oid not in remaining_old_ids]
-    
-    # Move companies with no dependents to deactivated_company/deactivated_companies, then delete them
-    if companies_to_deactivate:
-        deact_table = get_deactivated_companies_table(conn)
-        if deact_table:
-            deact_cols = table_columns(conn, "public", deact_table)
-            company_cols = table_columns(conn, "public", "company")
-            # Find common columns between company and deactivated table
-            common_cols = [col for col in company_cols if col in deact_cols]
-            
-            if common_cols:
-                # Use INSERT with common columns (simple copy structure)
-                cols_str = ", ".join(common_cols)
-                select_cols = ", ".join(common_cols)
-                with conn.cursor() as cur:
-                    # Try to insert, handling conflict if there's a unique constraint
-                    try:
-                        cur.execute(f"""
-                          INSERT INTO public.{deact_table} ({cols_str})
-                          SELECT {select_cols}
-                          FROM public.company c
-                          WHERE c.company_id = ANY(%s)
-                        """, (companies_to_deactivate,))
-                        moved_count = cur.rowcount
-                    except psycopg2.errors.UniqueViolation:
-                        # If unique constraint violation, use ON CONFLICT if possible
-                        conn.rollback()
-                        # Try with ON CONFLICT if we have a primary key or unique column
-                        pk_col = "company_id" if "company_id" in deact_cols else ("original_company_id" if "original_company_id" in deact_cols else None)
-                        if pk_col:
-                            cur.execute(f"""
-                              INSERT INTO public.{deact_table} ({cols_str})
-                              SELECT {select_cols}
-                              FROM public.company c
-                              WHERE c.company_id = ANY(%s)
-                              ON CONFLICT ({pk_col}) DO NOTHING
-                            """, (companies_to_deactivate,))
-                            moved_count = cur.rowcount
-                        else:
-                            moved_count = 0
-                    
-                    if moved_count > 0:
-                        print(f"    📦 Moved {moved_count} company record(s) to {deact_table} (no remaining dependents)")
-        
-        # Delete companies that have been moved to deactivated_company/deactivated_companies
-        delete_sql = "DELETE FROM public.company WHERE company_id = ANY(%s)"
+        # update canonical company fields and check which old company_ids still have
+        # facilities (couldn't be repointed), in one round-trip
+        statements: List[Tuple[str, Tuple[Any, ...]]] = [("""
+          UPDATE public.company
+          SET website_url = %s,
+              phone_main  = %s,
+              notes       = %s
+          WHERE company_id = %s
+        """, (proposed.get("website_url"), proposed.get("phone_main"), proposed.get("notes"), canonical_id))]
+        statements.append(("SELECT company_id, facility_id FROM public.facility WHERE company_id = ANY(%s) ORDER BY company_id",
+                           (old_ids,)))
         with conn.cursor() as cur:
-            cur.execute(delete_sql, (companies_to_deactivate,))
-            deleted_count = cur.rowcount
+            run_statements(cur, statements)
+            leftover = cur.fetchall()
+        remaining_old_ids = list(dict.fromkeys(r[0] for r in leftover))
+        if leftover_facilities is not None:
+            leftover_facilities.update(r[1] for r in leftover)
+
+        # Identify companies with no remaining dependents (can be safely moved to deactivated_company/deactivated_companies)
+        companies_to_deactivate = [oid for oid in old_ids if oid not in remaining_old_ids]
+    
+        # Move companies with no dependents to deactivated_company/deactivated_companies, then delete them.
+        # Archive and delete run as one statement: both CTEs read the same pre-delete snapshot,
+        # and rows already archived by an earlier run are skipped (ON CONFLICT DO NOTHING).
+        if companies_to_deactivate:
+            archive_cte = "SELECT 1 WHERE false"
+            deact_table = get_deactivated_companies_table(conn)
+            if deact_table:
+                deact_cols = table_columns(conn, "public", deact_table)
+                company_cols = table_columns(conn, "public", "company")
+                # Find common columns between company and deactivated table
+                common_cols = [col for col in company_cols if col in deact_cols and col not in GENERATED_COLUMNS]
+                if common_cols:
+                    cols_str = ", ".join(common_cols)
+                    archive_cte = f"""
+                      INSERT INTO public.{deact_table} ({cols_str})
+                      SELECT {cols_str}
+                      FROM public.company c
+                      WHERE c.company_id = ANY(%s)
+                      ON CONFLICT DO NOTHING
+                      RETURNING 1
+                    """
+            sql = f"""
+              WITH moved AS ({archive_cte}),
+              gone AS (DELETE FROM public.company WHERE company_id = ANY(%s) RETURNING 1)
+              SELECT (SELECT count(*) FROM moved), (SELECT count(*) FROM gone)
+            """
+            params = (companies_to_deactivate,) * sql.count("%s")
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                moved_count, deleted_count = cur.fetchone()
+            if moved_count > 0:
+                print(f"    📦 Moved {moved_count} company record(s) to {deact_table} (no remaining dependents)")
             if deleted_count > 0:
                 print(f"    🗑️  Deleted {deleted_count} old company record(s) from company table")
     
-    if remaining_old_ids:
-        print(f"    ℹ️  {len(remaining_old_ids)} old company record(s) retained in company table (still have facilities: {remaining_old_ids})")
+        if remaining_old_ids:
+            print(f"    ℹ️  {len(remaining_old_ids)} old company record(s) retained in company table (still have facilities: {remaining_old_ids})")
 
-    conn.commit()
-    print(f"    ✅ merged companies into company_id={canonical_id} (repointed {old_ids} -> {canonical_id})")
+        conn.commit()
+        print(f"    ✅ merged companies into company_id={canonical_id} (repointed {old_ids} -> {canonical_id})")
+    except Exception:
+        # rollback() leaves the connection ready for the next transaction
+        conn.rollback()
+        raise
     return remaining_old_ids
 
 # ----------------------------
 # Facility merge (phase B)
 # ----------------------------
+def facility_select_list(conn) -> str:
+    """FACILITY_COLUMNS present in this database, as a SELECT list (column set is cached)."""
+    cols = table_columns(conn, "public", "facility")
+    use = [c for c in FACILITY_COLUMNS if c in cols]
+    if "geom" in cols:
+        use.append("geom IS NOT NULL AS has_geom")
+    return ", ".join(use)
+
 def fetch_facilities_by_company(conn, company_ids: List[int]) -> List[Dict[str, Any]]:
     """Fetch facilities for specific company IDs"""
-    cols = table_columns(conn, "public", "facility")
-    
-    want = [
-        "facility_id",
-        "company_id",
-        "facility_type_id",
-        "name",
-        "description",
-        "address_line1",
-        "address_line2",
-        "city",
-        "county",
-        "state",
-        "postal_code",
-        "latitude",
-        "longitude",
-        "geom",
-        "status",
-        "website_url",
-        "phone_main",
-        "email_main",
-        "notes",
-        # optional real-world extras:
-        "geom_from_address",
-        "imported_source",
-        "updated_at",
-        "created_at",
-    ]
-    use = [c for c in want if c in cols]
-    sql = "SELECT " + ", ".join(use) + " FROM public.facility WHERE company_id = ANY(%s) ORDER BY facility_id"
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+    sql = "SELECT " + facility_select_list(conn) + " FROM public.facility WHERE company_id = ANY(%s) ORDER BY facility_id"
+    with conn.cursor() as cur:
         cur.execute(sql, (company_ids,))
-        return list(cur.fetchall())
+        return list(_dict_rows(cur))
 
-def fetch_facilities(conn) -> List[Dict[str, Any]]:
-    # pull all columns we might use; if some don't exist in your DB, select will fail
-    # so we build the SELECT dynamically from actual columns present.
-    cols = table_columns(conn, "public", "facility")
+def _squashed(col: str) -> str:
+    # Lowercased with every whitespace character removed: coarser than the Python keys
+    # (norm_ws + strip + lower/upper), so rows Python would group always share a SQL key.
+    return f"lower(regexp_replace(COALESCE({col}, ''), '\\s', '', 'g'))"
 
-    want = [
-        "facility_id",
-        "company_id",
-        "facility_type_id",
-        "name",
-        "description",
-        "address_line1",
-        "address_line2",
-        "city",
-        "county",
-        "state",
-        "postal_code",
-        "latitude",
-        "longitude",
-        "geom",
-        "status",
-        "website_url",
-        "phone_main",
-        "email_main",
-        "notes",
-        # optional real-world extras:
-        "geom_from_address",
-        "imported_source",
-        "updated_at",
-        "created_at",
-    ]
-    use = [c for c in want if c in cols]
-    sql = "SELECT " + ", ".join(use) + " FROM public.facility ORDER BY facility_id"
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+def fetch_duplicate_candidate_ids(conn, active_only: bool = False) -> List[int]:
+    """
+    Let Postgres bucket facilities and return only ids that share a coarse address key
+    (company_id, [address_line1_norm,] city, state, postal_code) or unique key
+    (company_id, name, city, state) with at least one other facility. The exact keys
+    (clean_street etc.) are applied in Python over these candidates only. Like
+    build_facility_groups_by_unique_key, the unique-key branch skips blank name/city/state.
+    """
+    active = "AND status IS DISTINCT FROM 'INACTIVE'" if active_only else ""
+    city, state = _squashed("city"), _squashed("state")
+    # With the migrated address_line1_norm column the street joins the key too
+    has_norm = "address_line1_norm" in table_columns(conn, "public", "facility")
+    street = f"{_squashed('address_line1_norm')}, " if has_norm else ""
+    sql = f"""
+        SELECT DISTINCT unnest(ids) AS facility_id
+        FROM (
+            SELECT array_agg(facility_id) AS ids
+            FROM public.facility
+            WHERE company_id IS NOT NULL {active}
+            GROUP BY company_id, {street}{city}, {state}, {_squashed("postal_code")}
+            HAVING count(*) > 1
+            UNION ALL
+            SELECT array_agg(facility_id) AS ids
+            FROM public.facility
+            WHERE company_id IS NOT NULL {active}
+              AND {_squashed("name")} <> '' AND {city} <> '' AND {state} <> ''
+            GROUP BY company_id, {_squashed("name")}, {city}, {state}
+            HAVING count(*) > 1
+        ) g
+        ORDER BY facility_id
+    """
+    with conn.cursor() as cur:
         cur.execute(sql)
-        return list(cur.fetchall())
+        return [r[0] for r in cur.fetchall()]
+
+def fetch_facilities(conn, active_only: bool = False, ids: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream facilities through a server-side cursor (FETCH_ITERSIZE rows per round-trip)
+    instead of materializing the whole table. active_only skips status = 'INACTIVE';
+    ids restricts the scan to those facility_ids.
+    """
+    conds = []
+    if active_only:
+        conds.append("status IS DISTINCT FROM 'INACTIVE'")
+    if ids is not None:
+        conds.append("facility_id = ANY(%s)")
+    where = ("WHERE " + " AND ".join(conds)) if conds else ""
+    sql = "SELECT " + facility_select_list(conn) + f" FROM public.facility {where} ORDER BY facility_id"
+    with conn.cursor(name="facility_scan") as cur:
+        cur.itersize = FETCH_ITERSIZE
+        cur.execute(sql, (list(ids),) if ids is not None else None)
+        yield from _dict_rows(cur)
 
 def facility_key(row: Dict[str, Any]) -> str:
     company_id = row.get("company_id")
@@ -574,23 +832,38 @@ def facility_key(row: Dict[str, Any]) -> str:
     # Include company_id so facilities from different companies are never grouped together
     return f"{company_id}|{a1.lower()}|{city}|{state}|{postal}"
 
-def geom_distance_m(conn, id1: int, id2: int) -> Optional[float]:
-    sql = """
-      SELECT
-        CASE
-          WHEN f1.geom IS NULL OR f2.geom IS NULL THEN NULL
-          ELSE ST_Distance(ST_Transform(f1.geom, 3857), ST_Transform(f2.geom, 3857))
-        END AS meters
-      FROM public.facility f1
-      JOIN public.facility f2 ON f2.facility_id = %s
-      WHERE f1.facility_id = %s
+# facility_id -> Web Mercator (x, y), or None when it has no geom. A facility's geom
+# doesn't change during a run (merges insert new rows), so each is projected once.
+_PROJECTED_CACHE: Dict[int, Optional[Tuple[float, float]]] = {}
+
+def fetch_projected_geoms(conn, ids: List[int]) -> Dict[int, Tuple[float, float]]:
     """
-    with conn.cursor() as cur:
-        cur.execute(sql, (id2, id1))
-        r = cur.fetchone()
-        return r[0] if r else None
+    Web Mercator (3857) x/y for each facility in ids that has a geom.
+    Distances between these points are what ST_Distance on the transformed geoms returns.
+    Only ids not already in _PROJECTED_CACHE are queried, in a single round-trip.
+    """
+    missing = [i for i in ids if i not in _PROJECTED_CACHE]
+    if missing:
+        sql = """
+          SELECT facility_id, ST_X(ST_Transform(geom, 3857)), ST_Y(ST_Transform(geom, 3857))
+          FROM public.facility
+          WHERE facility_id = ANY(%s) AND geom IS NOT NULL
+        """
+        with conn.cursor() as cur:
+            cur.execute(sql, (missing,))
+            found = {r[0]: (r[1], r[2]) for r in cur.fetchall()}
+        for i in missing:
+            _PROJECTED_CACHE[i] = found.get(i)
+    return {i: _PROJECTED_CACHE[i] for i in ids if _PROJECTED_CACHE[i] is not None}
+
+def projected_distance_m(coords: Dict[int, Tuple[float, float]], id1: int, id2: int) -> Optional[float]:
+    p1 = coords.get(id1)
+    p2 = coords.get(id2)
+    if p1 is None or p2 is None:
+        return None
+    return math.hypot(p1[0] - p2[0], p1[1] - p2[1])
 
-def build_facility_groups(conn, rows: List[Dict[str, Any]], max_meters: float) -> List[List[Dict[str, Any]]]:
+def build_facility_groups(conn, rows: Iterable[Dict[str, Any]], max_meters: float) -> List[List[Dict[str, Any]]]:
     """
     Group facilities by address (address_line1, city, state, postal_code) AND company_id.
     Only facilities with the same company_id can be grouped together.
@@ -603,6 +876,11 @@ def build_facility_groups(conn, rows: List[Dict[str, Any]], max_meters: float) -
             continue
         by_key[k].append(r)
 
+    # Project every candidate's geom in one round-trip; distances are then computed locally
+    candidate_ids = [r["facility_id"] for items in by_key.values() if len(items) >= 2
+                     for r in items if r.get("has_geom")]
+    coords = fetch_projected_geoms(conn, candidate_ids) if candidate_ids else {}
+
     groups: List[List[Dict[str, Any]]] = []
     for k, items in by_key.items():
         if len(items) < 2:
@@ -625,8 +903,8 @@ def build_facility_groups(conn, rows: List[Dict[str, Any]], max_meters: float) -
                 anchor = r
                 continue
             d = None
-            if anchor and ("geom" in r and "geom" in anchor):
-                d = geom_distance_m(conn, anchor["facility_id"], r["facility_id"])
+            if anchor and r.get("has_geom") and anchor.get("has_geom"):
+                d = projected_distance_m(coords, anchor["facility_id"], r["facility_id"])
             if d is not None and d > max_meters:
                 if len(cluster) >= 2:
                     groups.append(cluster)
@@ -677,7 +955,7 @@ def build_facility_groups_by_name(conn, rows: List[Dict[str, Any]], target_compa
     
     return groups
 
-def build_facility_groups_by_unique_key(conn, rows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+def build_facility_groups_by_unique_key(conn, rows: Iterable[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
     """
     Group facilities by (company_id, name, city, state) - finds exact duplicates
     that would violate the unique constraint facility_company_name_city_state_uniq.
@@ -705,6 +983,28 @@ def build_facility_groups_by_unique_key(conn, rows: List[Dict[str, Any]]) -> Lis
     
     return groups
 
+def combine_facility_groups(address_groups: List[List[Dict[str, Any]]],
+                            unique_key_groups: List[List[Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+    """
+    Address groups first, then unique-key groups that share no facility with any
+    address group; a facility appearing in several groups stays in the first one.
+    One pass over each group against id sets, not a pairwise scan of all groups.
+    """
+    address_ids = {r["facility_id"] for g in address_groups for r in g}
+    combined = list(address_groups) + [
+        g for g in unique_key_groups if not any(r["facility_id"] in address_ids for r in g)
+    ]
+
+    # Remove duplicates from groups (if a facility appears in multiple groups, keep it in the first one)
+    seen_facility_ids: Set[int] = set()
+    deduplicated: List[List[Dict[str, Any]]] = []
+    for group in combined:
+        group_ids = {r["facility_id"] for r in group}
+        if not (group_ids & seen_facility_ids):  # No overlap with already processed facilities
+            deduplicated.append(group)
+            seen_facility_ids.update(group_ids)
+    return deduplicated
+
 def is_kgfaish(text: Optional[str]) -> bool:
     t = (text or "").lower()
     return "ksgrainandfeed" in t or "kgfa" in t
@@ -735,24 +1035,37 @@ def propose_facility_merge(conn, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
     cols = set(rows[0].keys())
     merged: Dict[str, Any] = {}
 
+    # Normalize each column once for the whole group (column-wise); the completeness
+    # score and the per-field picks below all read from this instead of re-normalizing
+    norm: Dict[str, List[Any]] = {f: [normalize_value(r.get(f)) for r in rows] for f in cols}
+
     # choose a "base" record by completeness
-    def rec_score(r: Dict[str, Any]) -> int:
+    def rec_score(i: int) -> int:
+        r = rows[i]
         s = 0
         for f, w in [
             ("description", 5), ("notes", 4),
             ("website_url", 2), ("phone_main", 2), ("email_main", 2),
             ("address_line1", 3), ("city", 2), ("state", 2), ("postal_code", 2),
-            ("latitude", 2), ("longitude", 2), ("geom", 3),
+            ("latitude", 2), ("longitude", 2),
         ]:
-            if f in r and normalize_value(r.get(f)) is not None:
+            if f in norm and norm[f][i] is not None:
                 s += w
+        if r.get("has_geom"):
+            s += 3
         if str(r.get("status", "")).upper() == "ACTIVE":
             s += 2
         if "geom_from_address" in r and r.get("geom_from_address"):
             s += 1
         return s
 
-    base = max(rows, key=rec_score)
+    base_i = max(range(len(rows)), key=rec_score)
+    base = rows[base_i]
+
+    def pick(f: str) -> Any:
+        # base record's normalized value, else the first non-empty one in the group
+        v = norm[f][base_i]
+        return v if v is not None else next((x for x in norm[f] if x is not None), None)
 
     # merge core IDs
     for f in ["company_id", "facility_type_id"]:
@@ -767,17 +1080,13 @@ def propose_facility_merge(conn, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
     for f in ["address_line1", "address_line2", "city", "county", "state", "postal_code"]:
         if f in cols:
             # prefer base, else first non-empty, but normalize CR in address_line1
-            val = normalize_value(base.get(f))
-            if val is None:
-                for r in rows:
-                    v = normalize_value(r.get(f))
-                    if v is not None:
-                        val = v
-                        break
+            val = pick(f)
             if f == "address_line1" and val:
-                val = clean_street(val)  # returns normalized (lowered); keep nicer casing:
-                val = " ".join([w.capitalize() if w.lower() not in ("ks",) else w.upper() for w in val.split()])
-                val = val.replace("County road", "County Road")
+                # nicer casing: every token capitalized (so "County Road" stays intact),
+                # then the KS state token, which capitalize() leaves as "Ks"
+                val = " ".join(map(str.capitalize, clean_street(val).split()))
+                if "Ks" in val:
+                    val = _KS_TOKEN_RE.sub("KS", val)
             merged[f] = val
 
     # status always ACTIVE on new
@@ -787,47 +1096,28 @@ def propose_facility_merge(conn, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
     # contact-ish singletons
     for f in ["website_url", "phone_main", "email_main"]:
         if f in cols:
-            v = normalize_value(base.get(f))
-            if v is None:
-                for r in rows:
-                    rv = normalize_value(r.get(f))
-                    if rv is not None:
-                        v = rv
-                        break
-            merged[f] = v
+            merged[f] = pick(f)
 
     # text combine
     for f in ["description", "notes", "imported_source"]:
         if f in cols:
-            # prefer longer, but combine distinct
-            acc = None
-            for r in sorted(rows, key=lambda x: score_text(x.get(f)), reverse=True):
-                acc = combine_text(acc, r.get(f))
-            merged[f] = acc
+            # prefer longer, but combine distinct (sort keys come from the pre-normalized column)
+            vals = norm[f]
+            scores = [score_text(v) for v in vals]
+            order = sorted(range(len(rows)), key=scores.__getitem__, reverse=True)
+            merged[f] = combine_texts(vals[i] for i in order)
 
     # geom flags
     if "geom_from_address" in cols:
-        merged["geom_from_address"] = any(bool(r.get("geom_from_address")) for r in rows)
+        merged["geom_from_address"] = any(r.get("geom_from_address") for r in rows)
 
-    # lat/lon
+    # lat/lon: base, else a record with geom_from_address, else the first non-null
+    geocoded = [r for r in rows if r.get("geom_from_address")]
     for f in ["latitude", "longitude"]:
         if f in cols:
             v = base.get(f)
             if v is None:
-                # prefer record with geom_from_address if available
-                preferred = None
-                if "geom_from_address" in cols:
-                    for r in rows:
-                        if r.get("geom_from_address") and r.get(f) is not None:
-                            preferred = r.get(f)
-                            break
-                if preferred is not None:
-                    v = preferred
-                else:
-                    for r in rows:
-                        if r.get(f) is not None:
-                            v = r.get(f)
-                            break
+                v = next((r.get(f) for r in geocoded + rows if r.get(f) is not None), None)
             merged[f] = v
 
     return merged
@@ -854,11 +1144,14 @@ def print_facility_group(group_idx: int, total: int, rows: List[Dict[str, Any]],
     matches = []
     diffs: List[str] = []
     trivial_name_diff = False
+
+    # Normalize every displayed field of every row once; both checks below read these
+    norm = {f: [normalize_value(r.get(f)) for r in rows] for f in fields}
+    merged_norm = {f: normalize_value(proposed.get(f)) for f in fields}
     
     for f in fields:
-        vals = [normalize_value(r.get(f)) for r in rows]
-        uniq = {v for v in vals if v is not None}
-        if len(uniq) == 1 and len(uniq) != 0:
+        distinct = set(norm[f]) - {None}
+        if len(distinct) == 1:
             matches.append(f)
         else:
             # Special handling for name field - check if difference is trivial
@@ -871,9 +1164,9 @@ def print_facility_group(group_idx: int, total: int, rows: List[Dict[str, Any]],
                         trivial_name_diff = True
                         matches.append(f)  # Treat as match
                         continue
-            # only show if the merged value differs from at least one source OR combines
-            mv = normalize_value(proposed.get(f))
-            if any(mv != normalize_value(r.get(f)) for r in rows):
+            # only show if the merged value differs from at least one source OR combines;
+            # with 2+ distinct sources it always does, with none only if it is non-null
+            if distinct or merged_norm[f] is not None:
                 diffs.append(f)
 
     if matches:
@@ -895,6 +1188,15 @@ def print_facility_group(group_idx: int, total: int, rows: List[Dict[str, Any]],
     # Auto-accept if only trivial name difference and no other significant differences
     return trivial_name_diff and len(diffs) == 0
 
+def facility_insert_columns(conn) -> FrozenSet[str]:
+    """Facility columns an INSERT may set: not the serial id, not generated ones (cached)."""
+    cache_key = ("insertable", "public", "facility")
+    if cache_key not in _META_CACHE:
+        _META_CACHE[cache_key] = frozenset(
+            table_columns(conn, "public", "facility") - {"facility_id"} - GENERATED_COLUMNS
+        )
+    return _META_CACHE[cache_key]
+
 def insert_new_facility(conn, proposed: Dict[str, Any], exclude_ids: Optional[List[int]] = None) -> int:
     """
     Insert a new facility, or return existing facility_id if one with same (company_id, name, city, state) exists.
@@ -904,8 +1206,8 @@ def insert_new_facility(conn, proposed: Dict[str, Any], exclude_ids: Optional[Li
     unique key, we should use that facility as the target instead of creating a new one.
     """
     cols_present = table_columns(conn, "public", "facility")
-    # facility_id is serial
-    insertable = [k for k in proposed.keys() if k in cols_present and k != "facility_id"]
+    insert_cols = facility_insert_columns(conn)
+    insertable = [k for k in proposed if k in insert_cols]
 
     # ensure required cols exist and have values if your DB enforces NOT NULL
     # (schema doc says name/lat/lon are NOT NULL)
@@ -1001,34 +1303,42 @@ def insert_new_facility(conn, proposed: Dict[str, Any], exclude_ids: Optional[Li
                         return existing[0]
             raise
 
-def archive_facility(conn, old_id: int, new_id: int, reason_detail: str):
+def archive_facilities(conn, old_ids: List[int], new_id: int, reason_detail: str):
+    """Snapshot every facility in old_ids into deactivated_facilities with one INSERT ... SELECT."""
     sql = """
       INSERT INTO public.deactivated_facilities
         (original_facility_id, reason, merged_to_facility_id, reason_detail, facility_snapshot)
       SELECT
         f.facility_id, 'MERGED', %s, %s, to_jsonb(f)
       FROM public.facility f
-      WHERE f.facility_id = %s
+      WHERE f.facility_id = ANY(%s)
     """
     with conn.cursor() as cur:
-        cur.execute(sql, (new_id, reason_detail, old_id))
+        cur.execute(sql, (new_id, reason_detail, old_ids))
 
-def deactivate_facility(conn, old_id: int):
+def deactivate_facilities(conn, old_ids: List[int]):
     # schema says facility.status exists with ACTIVE/INACTIVE
     with conn.cursor() as cur:
-        cur.execute("UPDATE public.facility SET status = 'INACTIVE' WHERE facility_id = %s", (old_id,))
+        cur.execute("UPDATE public.facility SET status = 'INACTIVE' WHERE facility_id = ANY(%s)", (old_ids,))
 
-def apply_facility_merge(conn, rows: List[Dict[str, Any]], proposed: Dict[str, Any], apply: bool):
+def apply_facility_merge(conn, rows: List[Dict[str, Any]], proposed: Dict[str, Any], apply: bool,
+                         counts: Optional[Dict[Tuple[str, str, str, int], int]] = None):
+    """
+    Insert/update the merged facility, repoint its children and archive/deactivate
+    the originals in one transaction per group, so a failing group (e.g. a child
+    row colliding on a composite key) rolls back alone.
+    counts: precount_dependents output covering rows.
+    """
     old_ids = [r["facility_id"] for r in rows]
 
     # Discover all tables that FK -> facility (facility_contact, facility_service, facility_product, facility_transport_mode, etc.)
     fk_refs = get_fk_references(conn, "public", "facility")
 
-    # show dependent counts
-    for fk_schema, fk_table, fk_col in fk_refs:
-        c = count_dependents(conn, fk_schema, fk_table, fk_col, old_ids)
-        if c:
-            print(f"    will repoint {c} rows in {fk_schema}.{fk_table}.{fk_col}")
+    # show dependent counts (an --apply run without precounts reports the UPDATE rowcounts instead)
+    if counts is not None or not apply:
+        for (fk_schema, fk_table, fk_col), c in dependents_by_ref(conn, counts, fk_refs, old_ids).items():
+            if c:
+                print(f"    will repoint {c} rows in {fk_schema}.{fk_table}.{fk_col}")
 
     if not apply:
         print("    DRY RUN: would insert new facility + repoint FKs + archive + deactivate.")
@@ -1045,11 +1355,14 @@ def apply_facility_merge(conn, rows: List[Dict[str, Any]], proposed: Dict[str, A
         
         # If using existing facility, update it with merged data (except the unique constraint fields)
         if not is_new:
-            # Update the existing facility with merged data
-            cols_present = table_columns(conn, "public", "facility")
-            updateable = [k for k in proposed.keys() 
-                         if k in cols_present 
-                         and k not in ("facility_id", "company_id", "name", "city", "state")]  # Don't update unique constraint fields
+            # Update the existing facility with merged data, but only the columns that change:
+            # the target is one of this group's rows, so its current values are already here
+            target = next(r for r in rows if r["facility_id"] == new_id)
+            insert_cols = facility_insert_columns(conn)
+            updateable = [k for k in proposed.keys()
+                         if k in insert_cols
+                         and k not in ("company_id", "name", "city", "state")  # Don't update unique constraint fields
+                         and proposed.get(k) != target.get(k)]
             
             if updateable:
                 set_clauses = [f"{k} = %s" for k in updateable]
@@ -1060,17 +1373,16 @@ def apply_facility_merge(conn, rows: List[Dict[str, Any]], proposed: Dict[str, A
                     print(f"    updated existing facility_id={new_id} with merged data")
 
         # repoint children first (safer if any FKs are non-nullable)
-        for fk_schema, fk_table, fk_col in fk_refs:
-            updated = repoint_dependents(conn, fk_schema, fk_table, fk_col, old_ids, new_id)
+        for (fk_schema, fk_table, fk_col), updated in repoint_children(conn, fk_refs, old_ids, new_id):
             if updated:
                 print(f"    repointed {updated} rows in {fk_schema}.{fk_table}.{fk_col}")
 
         # archive and deactivate originals (but not if one of them is the target)
-        for oid in old_ids:
-            if oid != new_id:  # Don't archive/deactivate the target facility
-                if table_exists(conn, "public", "deactivated_facilities"):
-                    archive_facility(conn, oid, new_id, reason_detail)
-                deactivate_facility(conn, oid)
+        retired = [oid for oid in old_ids if oid != new_id]
+        if retired:
+            if table_exists(conn, "public", "deactivated_facilities"):
+                archive_facilities(conn, retired, new_id, reason_detail)
+            deactivate_facilities(conn, retired)
 
         conn.commit()
         if is_new:
@@ -1078,18 +1390,197 @@ def apply_facility_merge(conn, rows: List[Dict[str, Any]], proposed: Dict[str, A
         else:
             print(f"    ✅ merged into existing facility_id={new_id}; archived+deactivated {[oid for oid in old_ids if oid != new_id]}")
     except Exception as e:
+        # rollback() leaves the connection ready for the next transaction
         conn.rollback()
-        # Ensure connection is ready for next transaction by resetting state
-        if not conn.closed:
-            try:
-                # Create a new cursor to reset the connection state
-                with conn.cursor() as reset_cur:
-                    reset_cur.execute("SELECT 1")
-            except:
-                # If that fails, connection is likely broken - caller should handle
-                pass
         raise
 
+def apply_facility_merges_parallel(approved: List[Tuple[List[Dict[str, Any]], Dict[str, Any]]], workers: int,
+                                   counts: Optional[Dict[Tuple[str, str, str, int], int]] = None) -> int:
+    """
+    Apply already-approved facility merges on up to `workers` connections. All groups
+    of one company go to the same worker, so the (company_id, name, city, state)
+    checks and inserts of different workers can never collide; groups themselves are
+    facility-disjoint. Each worker commits per group (as apply_facility_merge does).
+    Returns the number of merges applied.
+    """
+    by_company: Dict[Any, List[Tuple[List[Dict[str, Any]], Dict[str, Any]]]] = defaultdict(list)
+    for group, proposed in approved:
+        by_company[proposed.get("company_id")].append((group, proposed))
+    buckets: List[List[Tuple[List[Dict[str, Any]], Dict[str, Any]]]] = [[] for _ in range(max(1, workers))]
+    for items in sorted(by_company.values(), key=len, reverse=True):
+        min(buckets, key=len).extend(items)
+    buckets = [b for b in buckets if b]
+
+    def run(bucket) -> int:
+        # Failures are reported and counted here, never raised: other workers' merges are
+        # already committed, so one worker must not abort the run
+        try:
+            conn = db_connect()
+        except Exception as e:
+            print(f"    ❌ worker could not connect, {len(bucket)} facility groups not merged: {e}")
+            return 0
+        merged = 0
+        try:
+            for n, (group, proposed) in enumerate(bucket):
+                try:
+                    apply_facility_merge(conn, group, proposed, apply=True, counts=counts)
+                    merged += 1
+                except Exception as e:
+                    print(f"    ❌ merge failed for group { [r['facility_id'] for r in group] }: {e}")
+                    try:
+                        conn.rollback()
+                    except Exception as reset_error:
+                        print(f"    ❌ worker connection lost, {len(bucket) - n - 1} facility groups not merged: {reset_error}")
+                        break
+        finally:
+            conn.close()
+        return merged
+
+    if not buckets:
+        return 0
+    with ThreadPoolExecutor(max_workers=len(buckets)) as pool:
+        return sum(pool.map(run, buckets))
+
+def apply_company_merges_parallel(merges: List[Tuple[Dict[str, Any], List[int]]], workers: int,
+                                  counts: Optional[Dict[Tuple[str, str, str, int], int]] = None
+                                  ) -> List[Tuple[Dict[str, Any], List[int], List[int], Set[int]]]:
+    """
+    Apply already-approved company merges (proposed, group_ids) on up to `workers`
+    connections. Groups are company-disjoint, so their repoints never touch the same
+    rows; apply_company_merge commits each one. Returns, in input order,
+    (proposed, group_ids, remaining_old_ids, stuck facility ids) per successful merge.
+    """
+    buckets = [list(range(w, len(merges), max(1, workers))) for w in range(max(1, workers))]
+    buckets = [b for b in buckets if b]
+    results: List[Optional[Tuple[Dict[str, Any], List[int], List[int], Set[int]]]] = [None] * len(merges)
+
+    def run(bucket: List[int]) -> None:
+        # As in apply_facility_merges_parallel: a failed merge is rolled back and reported,
+        # and its result left out, without aborting merges other workers have committed
+        try:
+            conn = db_connect()
+        except Exception as e:
+            print(f"  ❌ worker could not connect, {len(bucket)} company groups not merged: {e}")
+            return
+        try:
+            for n, i in enumerate(bucket):
+                proposed, ids = merges[i]
+                stuck: Set[int] = set()
+                try:
+                    remaining = apply_company_merge(conn, proposed, ids, apply=True,
+                                                    counts=counts, leftover_facilities=stuck)
+                except Exception as e:
+                    print(f"  ❌ merge failed for company group {ids}: {e}")
+                    try:
+                        conn.rollback()
+                    except Exception as reset_error:
+                        print(f"  ❌ worker connection lost, {len(bucket) - n - 1} company groups not merged: {reset_error}")
+                        break
+                    continue
+                results[i] = (proposed, ids, remaining, stuck)
+        finally:
+            conn.close()
+
+    if buckets:
+        with ThreadPoolExecutor(max_workers=len(buckets)) as pool:
+            list(pool.map(run, buckets))
+    return [r for r in results if r is not None]
+
+def review_company_facilities(conn, proposed: Dict[str, Any], ids: List[int], remaining_old_ids: List[int],
+                              stuck: Set[int], facilities_by_company: Dict[int, List[Dict[str, Any]]],
+                              args: argparse.Namespace,
+                              approved: Optional[List[Tuple[List[Dict[str, Any]], Dict[str, Any]]]] = None):
+    """
+    Phase A facility review for one merged company group. Approved facility merges
+    are applied here, or appended to approved (if given) to be applied in parallel.
+    """
+    # Include canonical company_id and any old company_ids that still have facilities
+    canonical_id = proposed["company_id"]
+    if remaining_old_ids:
+        print(f"\n    Note: Some facilities still have old company_ids {remaining_old_ids} (couldn't be repointed)")
+    
+    print(f"\n    Processing facilities for company_id={canonical_id} (including facilities with old company_ids: {remaining_old_ids})")
+    facilities = sorted(
+        (r for cid in ids for r in facilities_by_company.pop(cid, [])),
+        key=lambda r: r["facility_id"],
+    )
+    if args.apply:
+        # The merge repointed everything except the facilities left on remaining_old_ids
+        for r in facilities:
+            if r["facility_id"] not in stuck:
+                r["company_id"] = canonical_id
+    
+    if not facilities:
+        print(f"    No facilities found for this company.")
+        return
+    
+    print(f"    Found {len(facilities)} total facilities for this company.")
+    
+    # Build facility groups from these facilities
+    groups = build_facility_groups(conn, facilities, max_meters=args.max_meters)
+    
+    # Also check for duplicates by (name, city, state) - handles cases where facilities
+    # couldn't be repointed due to unique constraint violations
+    if remaining_old_ids:
+        name_based_groups = build_facility_groups_by_name(conn, facilities, canonical_id)
+        # Merge groups - if a facility is in both, prefer the address-based group
+        for name_group in name_based_groups:
+            # Check if any facility in name_group is already in an address-based group
+            name_group_ids = {r["facility_id"] for r in name_group}
+            found_in_existing = False
+            for addr_group in groups:
+                addr_group_ids = {r["facility_id"] for r in addr_group}
+                if name_group_ids & addr_group_ids:  # Intersection
+                    found_in_existing = True
+                    break
+            if not found_in_existing and len(name_group) >= 2:
+                groups.append(name_group)
+    
+    if not groups:
+        print(f"    No duplicate facility groups found for this company.")
+        return
+    
+    print(f"    Found {len(groups)} duplicate facility groups for this company.")
+    facility_counts = precount_dependents(
+        conn, get_fk_references(conn, "public", "facility"),
+        [r["facility_id"] for g in groups for r in g]
+    )
+    
+    # Process each facility group
+    for j, facility_group in enumerate(groups, start=1):
+        proposed_fac = propose_facility_merge(conn, facility_group)
+        auto_accept_fac = print_facility_group(j, len(groups), facility_group, proposed_fac)
+
+        if auto_accept_fac:
+            print("    ✓ Auto-accepting: names differ only by punctuation/suffixes, no other differences")
+            do_fac = True
+        else:
+            do_fac = ask_yes_no("    Merge facilities into NEW record + archive originals? (y/n): ")
+        
+        if not do_fac:
+            print("    skipped.")
+            continue
+
+        if approved is not None:
+            approved.append((facility_group, proposed_fac))
+            continue
+
+        try:
+            # apply_facility_merge commits internally if --apply
+            apply_facility_merge(conn, facility_group, proposed_fac, apply=args.apply,
+                                 counts=facility_counts)
+        except Exception as e:
+            print(f"    ❌ merge failed for group { [r['facility_id'] for r in facility_group] }: {e}")
+            # Ensure transaction is rolled back (that alone leaves the connection ready)
+            try:
+                if not conn.closed:
+                    conn.rollback()
+            except Exception as reset_error:
+                print(f"    ⚠️  Warning: Could not reset connection state: {reset_error}")
+            continue
+    
+    print(f"\n    ✅ Completed processing company_id={canonical_id} and its facilities")
+
 # ----------------------------
 # Main runner with progress
 # ----------------------------
@@ -1099,22 +1590,36 @@ def main():
     ap.add_argument("--max-meters", type=float, default=250.0, help="Max distance to keep in same facility group")
     ap.add_argument("--limit-companies", type=int, default=0, help="Limit company groups reviewed (0=all)")
     ap.add_argument("--limit-facilities", type=int, default=0, help="Limit facility groups reviewed (0=all)")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="With --apply, approve all facility groups first, then merge them (and auto-accepted "
+                         "company groups) on this many connections")
+    ap.add_argument("--name-similarity", type=float, default=None,
+                    help="Also group companies whose names are at least this trigram-similar (0-1, needs pg_trgm)")
     args = ap.parse_args()
 
     conn = db_connect()
     conn.autocommit = False
 
     try:
+        prefetch_metadata(conn)
+
         # -------------------------
         # Phase A: companies first
         # -------------------------
         companies = fetch_companies(conn)
         comp_groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        company_keys: Dict[int, str] = {}
         for c in companies:
-            k = normalize_company_name(c.get("name"))
+            k = c["name_norm"] if "name_norm" in c else normalize_company_name(c.get("name"))
             if not k:
                 continue
             comp_groups[k].append(c)
+            company_keys[c["company_id"]] = k
+
+        if args.name_similarity is not None:
+            pairs = fetch_similar_company_pairs(conn, args.name_similarity)
+            print(f"  {len(pairs)} company name pairs at similarity >= {args.name_similarity}")
+            comp_groups = link_company_groups(comp_groups, company_keys, pairs)
 
         company_dupe_groups = [g for g in comp_groups.values() if len(g) >= 2]
         company_dupe_groups.sort(key=lambda g: (len(g), g[0]["company_id"]), reverse=True)
@@ -1122,7 +1627,21 @@ def main():
         if args.limit_companies and args.limit_companies > 0:
             company_dupe_groups = company_dupe_groups[: args.limit_companies]
 
+        # With --workers, auto-accepted company merges and all approved facility merges
+        # are collected and applied on parallel connections instead of one at a time
+        parallel = args.apply and args.workers > 1
+        approved: List[Tuple[List[Dict[str, Any]], Dict[str, Any]]] = []
+        deferred_companies: List[Tuple[Dict[str, Any], List[int]]] = []
+
         print(f"\nProcessing {len(company_dupe_groups)} company groups (one at a time with facilities).")
+        # Groups are disjoint, so counts taken up front stay accurate as earlier groups merge
+        grouped_company_ids = [c["company_id"] for g in company_dupe_groups for c in g]
+        company_counts = precount_dependents(conn, get_fk_references(conn, "public", "company"), grouped_company_ids)
+        # Facilities of every grouped company in one query; each group takes its own
+        # (groups are disjoint) instead of re-selecting after its company merge
+        facilities_by_company: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        for r in fetch_facilities_by_company(conn, grouped_company_ids):
+            facilities_by_company[r["company_id"]].append(r)
         for i, g in enumerate(company_dupe_groups, start=1):
             proposed, ids = propose_company_canonical(g)
             print(f"\n{'='*86}")
@@ -1140,85 +1659,32 @@ def main():
                 print("    skipped.")
                 continue
 
+            if parallel and auto_accept:
+                deferred_companies.append((proposed, ids))
+                continue
+
             # Merge the company (this commits internally if --apply)
             # Returns list of old company_ids that still have facilities (couldn't be repointed)
-            remaining_old_ids = apply_company_merge(conn, proposed, ids, apply=args.apply)
+            stuck: Set[int] = set()
+            remaining_old_ids = apply_company_merge(conn, proposed, ids, apply=args.apply,
+                                                    counts=company_counts, leftover_facilities=stuck)
             
             # Now process facilities for this company
-            # Include canonical company_id and any old company_ids that still have facilities
-            canonical_id = proposed["company_id"]
-            all_company_ids = [canonical_id]
-            if remaining_old_ids:
-                all_company_ids.extend(remaining_old_ids)
-                print(f"\n    Note: Some facilities still have old company_ids {remaining_old_ids} (couldn't be repointed)")
-            
-            print(f"\n    Processing facilities for company_id={canonical_id} (including facilities with old company_ids: {remaining_old_ids})")
-            facilities = fetch_facilities_by_company(conn, all_company_ids)
-            
-            if not facilities:
-                print(f"    No facilities found for this company.")
-                continue
-            
-            print(f"    Found {len(facilities)} total facilities for this company.")
-            
-            # Build facility groups from these facilities
-            groups = build_facility_groups(conn, facilities, max_meters=args.max_meters)
-            
-            # Also check for duplicates by (name, city, state) - handles cases where facilities
-            # couldn't be repointed due to unique constraint violations
-            if remaining_old_ids:
-                name_based_groups = build_facility_groups_by_name(conn, facilities, canonical_id)
-                # Merge groups - if a facility is in both, prefer the address-based group
-                for name_group in name_based_groups:
-                    # Check if any facility in name_group is already in an address-based group
-                    name_group_ids = {r["facility_id"] for r in name_group}
-                    found_in_existing = False
-                    for addr_group in groups:
-                        addr_group_ids = {r["facility_id"] for r in addr_group}
-                        if name_group_ids & addr_group_ids:  # Intersection
-                            found_in_existing = True
-                            break
-                    if not found_in_existing and len(name_group) >= 2:
-                        groups.append(name_group)
-            
-            if not groups:
-                print(f"    No duplicate facility groups found for this company.")
-                continue
-            
-            print(f"    Found {len(groups)} duplicate facility groups for this company.")
-            
-            # Process each facility group
-            for j, facility_group in enumerate(groups, start=1):
-                proposed_fac = propose_facility_merge(conn, facility_group)
-                auto_accept_fac = print_facility_group(j, len(groups), facility_group, proposed_fac)
-
-                if auto_accept_fac:
-                    print("    ✓ Auto-accepting: names differ only by punctuation/suffixes, no other differences")
-                    do_fac = True
-                else:
-                    do_fac = ask_yes_no("    Merge facilities into NEW record + archive originals? (y/n): ")
-                
-                if not do_fac:
-                    print("    skipped.")
-                    continue
-
-                try:
-                    # apply_facility_merge commits internally if --apply
-                    apply_facility_merge(conn, facility_group, proposed_fac, apply=args.apply)
-                except Exception as e:
-                    print(f"    ❌ merge failed for group { [r['facility_id'] for r in facility_group] }: {e}")
-                    # Ensure transaction is rolled back and connection is ready
-                    try:
-                        if not conn.closed:
-                            conn.rollback()
-                            # Reset connection state
-                            with conn.cursor() as reset_cur:
-                                reset_cur.execute("SELECT 1")
-                    except Exception as reset_error:
-                        print(f"    ⚠️  Warning: Could not reset connection state: {reset_error}")
-                    continue
-            
-            print(f"\n    ✅ Completed processing company_id={canonical_id} and its facilities")
+            review_company_facilities(conn, proposed, ids, remaining_old_ids, stuck, facilities_by_company,
+                                      args, approved if parallel else None)
+
+        if deferred_companies:
+            print(f"\nApplying {len(deferred_companies)} auto-accepted company merges on up to {args.workers} connections...")
+            for proposed, ids, remaining_old_ids, stuck in apply_company_merges_parallel(
+                    deferred_companies, args.workers, counts=company_counts):
+                review_company_facilities(conn, proposed, ids, remaining_old_ids, stuck, facilities_by_company,
+                                          args, approved)
+
+        if approved:
+            print(f"\nApplying {len(approved)} approved facility merges on up to {args.workers} connections...")
+            merged = apply_facility_merges_parallel(approved, args.workers)
+            print(f"  merged {merged}/{len(approved)} facility groups")
+            approved = []
 
         # -------------------------
         # Phase B: facility duplicates (independent of companies)
@@ -1227,50 +1693,36 @@ def main():
         print(f"[Phase B: Processing facility duplicates independently]")
         print(f"{'='*86}")
         
-        # Fetch all active facilities (exclude those already deactivated/merged)
-        all_facilities = fetch_facilities(conn)
-        # Filter to only active facilities (if status column exists)
+        # Only active facilities (exclude those already deactivated/merged), if status column exists
         cols = table_columns(conn, "public", "facility")
-        if "status" in cols:
-            all_facilities = [f for f in all_facilities if f.get("status") != "INACTIVE"]
+        active_only = "status" in cols
+        print("Scanning active facilities for duplicates...")
+        
+        # Postgres narrows the table to facilities sharing a coarse key; only those rows
+        # are fetched in full and bucketed by the exact keys below
+        candidate_ids = fetch_duplicate_candidate_ids(conn, active_only)
+        candidates = list(fetch_facilities(conn, active_only, ids=candidate_ids)) if candidate_ids else []
+        print(f"  {len(candidate_ids)} candidate facilities share a key with another facility")
+        
+        # Build facility groups by address (geographic proximity)
+        address_groups = build_facility_groups(conn, candidates, max_meters=args.max_meters)
         
-        if not all_facilities:
-            print("No active facilities found to process.")
+        # Also check for exact duplicates by (company_id, name, city, state)
+        unique_key_groups = build_facility_groups_by_unique_key(conn, candidates)
+        
+        if not address_groups and not unique_key_groups:
+            print("No duplicate facility groups found.")
         else:
-            print(f"Found {len(all_facilities)} active facilities to check for duplicates.")
-            
-            # Build facility groups by address (geographic proximity)
-            address_groups = build_facility_groups(conn, all_facilities, max_meters=args.max_meters)
-            
-            # Also check for exact duplicates by (company_id, name, city, state)
-            unique_key_groups = build_facility_groups_by_unique_key(conn, all_facilities)
-            
-            # Merge groups - if a facility is in both, prefer the address-based group
-            all_facility_groups = list(address_groups)
-            for unique_group in unique_key_groups:
-                unique_group_ids = {r["facility_id"] for r in unique_group}
-                found_in_existing = False
-                for addr_group in all_facility_groups:
-                    addr_group_ids = {r["facility_id"] for r in addr_group}
-                    if unique_group_ids & addr_group_ids:  # Intersection
-                        found_in_existing = True
-                        break
-                if not found_in_existing:
-                    all_facility_groups.append(unique_group)
-            
-            # Remove duplicates from groups (if a facility appears in multiple groups, keep it in the first one)
-            seen_facility_ids = set()
-            deduplicated_groups = []
-            for group in all_facility_groups:
-                group_ids = {r["facility_id"] for r in group}
-                if not (group_ids & seen_facility_ids):  # No overlap with already processed facilities
-                    deduplicated_groups.append(group)
-                    seen_facility_ids.update(group_ids)
+            deduplicated_groups = combine_facility_groups(address_groups, unique_key_groups)
             
             if args.limit_facilities and args.limit_facilities > 0:
                 deduplicated_groups = deduplicated_groups[: args.limit_facilities]
             
             print(f"\nProcessing {len(deduplicated_groups)} facility duplicate groups.")
+            facility_counts = precount_dependents(
+                conn, get_fk_references(conn, "public", "facility"),
+                [r["facility_id"] for g in deduplicated_groups for r in g]
+            )
             
             for i, facility_group in enumerate(deduplicated_groups, start=1):
                 proposed_fac = propose_facility_merge(conn, facility_group)
@@ -1286,22 +1738,29 @@ def main():
                     print("    skipped.")
                     continue
 
+                if parallel:
+                    approved.append((facility_group, proposed_fac))
+                    continue
+
                 try:
                     # apply_facility_merge commits internally if --apply
-                    apply_facility_merge(conn, facility_group, proposed_fac, apply=args.apply)
+                    apply_facility_merge(conn, facility_group, proposed_fac, apply=args.apply,
+                                         counts=facility_counts)
                 except Exception as e:
                     print(f"    ❌ merge failed for group { [r['facility_id'] for r in facility_group] }: {e}")
-                    # Ensure transaction is rolled back and connection is ready
+                    # Ensure transaction is rolled back (that alone leaves the connection ready)
                     try:
                         if not conn.closed:
                             conn.rollback()
-                            # Reset connection state
-                            with conn.cursor() as reset_cur:
-                                reset_cur.execute("SELECT 1")
                     except Exception as reset_error:
                         print(f"    ⚠️  Warning: Could not reset connection state: {reset_error}")
                     continue
 
+            if approved:
+                print(f"\nApplying {len(approved)} approved facility merges on up to {args.workers} connections...")
+                merged = apply_facility_merges_parallel(approved, args.workers, counts=facility_counts)
+                print(f"  merged {merged}/{len(approved)} facility groups")
+
         print("\nAll done.")
         if not args.apply:
             print("Ran in DRY RUN mode (no DB writes). Re-run with --apply to execute.")
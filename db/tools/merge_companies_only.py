@@ -25,8 +25,10 @@ import os
 import re
 import sys
 import argparse
-from typing import Any, Dict, List, Optional, Tuple, Set
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Set
 from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
 
 import psycopg2
 import psycopg2.extras
@@ -67,6 +69,9 @@ def normalize_company_name(name: Optional[str]) -> str:
 # ----------------------------
 # DB helpers
 # ----------------------------
+# Rows per round-trip when streaming from server-side cursors (narrow rows, so large)
+FETCH_ITERSIZE = 10000
+
 def db_connect():
     host = os.environ.get("PGHOST", "localhost")
     port = os.environ.get("POSTGIS_HOST_PORT")
@@ -94,6 +99,16 @@ def table_exists(conn, schema: str, table: str) -> bool:
         cur.execute(sql, (schema, table))
         return cur.fetchone() is not None
 
+def table_columns(conn, schema: str, table: str) -> Set[str]:
+    sql = """
+      SELECT column_name
+      FROM information_schema.columns
+      WHERE table_schema = %s AND table_name = %s
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql, (schema, table))
+        return {r[0] for r in cur.fetchall()}
+
 def get_fk_references(conn, referenced_schema: str, referenced_table: str) -> List[Tuple[str, str, str]]:
     """
     Find all single-column foreign keys that reference referenced_schema.referenced_table.
@@ -121,27 +136,56 @@ def get_fk_references(conn, referenced_schema: str, referenced_table: str) -> Li
         cur.execute(sql, (referenced_schema, referenced_table))
         return [(r[0], r[1], r[2]) for r in cur.fetchall()]
 
-def count_dependents(conn, fk_schema: str, fk_table: str, fk_col: str, ids: List[int]) -> int:
-    sql = f"SELECT COUNT(*) FROM {fk_schema}.{fk_table} WHERE {fk_col} = ANY(%s)"
-    with conn.cursor() as cur:
-        cur.execute(sql, (ids,))
-        return int(cur.fetchone()[0])
-
-def repoint_dependents(conn, fk_schema: str, fk_table: str, fk_col: str, old_ids: List[int], new_id: int) -> int:
-    """Repoint foreign keys from old_ids to new_id"""
-    sql = f"UPDATE {fk_schema}.{fk_table} SET {fk_col} = %s WHERE {fk_col} = ANY(%s)"
+def precount_dependents(conn, fk_refs: List[Tuple[str, str, str]], ids: List[int]) -> Dict[Tuple[str, str, str, int], int]:
+    """
+    Dependent counts for every id in ids, one GROUP BY query per FK column.
+    Returns {(fk_schema, fk_table, fk_col, id): count}; ids with no dependents are absent.
+    """
+    counts: Dict[Tuple[str, str, str, int], int] = {}
+    if not ids:
+        return counts
     with conn.cursor() as cur:
-        cur.execute(sql, (new_id, old_ids))
-        return cur.rowcount
+        for fk_schema, fk_table, fk_col in fk_refs:
+            sql = f"SELECT {fk_col}, COUNT(*) FROM {fk_schema}.{fk_table} WHERE {fk_col} = ANY(%s) GROUP BY {fk_col}"
+            cur.execute(sql, (list(ids),))
+            for ref_id, n in cur.fetchall():
+                counts[(fk_schema, fk_table, fk_col, ref_id)] = int(n)
+    return counts
 
 # ----------------------------
 # Company operations
 # ----------------------------
-def fetch_companies(conn) -> List[Dict[str, Any]]:
+def fetch_companies(conn) -> Iterator[Dict[str, Any]]:
+    """Stream companies through a server-side cursor, FETCH_ITERSIZE rows per round-trip."""
     sql = "SELECT company_id, name, website_url, phone_main, notes FROM public.company ORDER BY company_id"
+    with conn.cursor(name="fetch_companies_cur", cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.itersize = FETCH_ITERSIZE
+        cur.execute(sql)
+        yield from cur
+
+def fetch_duplicate_company_groups(conn) -> List[List[Dict[str, Any]]]:
+    """
+    Duplicate groups straight from Postgres, using the company.name_norm column
+    (normalize_company_name computed on write, db/init/18_facility_company_norm_columns.sql).
+    Only companies whose key occurs 2+ times are returned, sorted by key, so one
+    linear pass splits them into groups.
+    """
+    sql = """
+        WITH dupes AS (
+            SELECT name_norm
+            FROM public.company
+            WHERE name_norm <> ''
+            GROUP BY name_norm
+            HAVING COUNT(*) >= 2
+        )
+        SELECT c.company_id, c.name, c.website_url, c.phone_main, c.notes, c.name_norm
+        FROM public.company c
+        JOIN dupes d USING (name_norm)
+        ORDER BY c.name_norm, c.company_id
+    """
     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
         cur.execute(sql)
-        return list(cur.fetchall())
+        return [list(g) for _, g in groupby(cur, key=itemgetter("name_norm"))]
 
 def company_score(r: Dict[str, Any]) -> int:
     """Score company by data completeness"""
@@ -232,27 +276,6 @@ def create_deactivated_companies_table(conn):
     with conn.cursor() as cur:
         cur.execute(sql)
 
-def move_to_deactivated(conn, old_company_ids: List[int], new_company_id: int, reason_detail: str):
-    """Move old companies to deactivated_companies table"""
-    sql = """
-        INSERT INTO public.deactivated_companies
-            (original_company_id, reason, merged_to_company_id, reason_detail, company_snapshot)
-        SELECT
-            company_id, 'MERGED', %s, %s, to_jsonb(c.*)
-        FROM public.company c
-        WHERE c.company_id = ANY(%s)
-        ON CONFLICT (original_company_id) DO NOTHING
-    """
-    with conn.cursor() as cur:
-        cur.execute(sql, (new_company_id, reason_detail, old_company_ids))
-
-def delete_old_companies(conn, old_company_ids: List[int]):
-    """Delete old company records (after FKs have been repointed)"""
-    sql = "DELETE FROM public.company WHERE company_id = ANY(%s)"
-    with conn.cursor() as cur:
-        cur.execute(sql, (old_company_ids,))
-        return cur.rowcount
-
 # ----------------------------
 # Display and interaction
 # ----------------------------
@@ -298,7 +321,72 @@ def ask_yes_no(prompt: str) -> bool:
 # ----------------------------
 # Main merge logic
 # ----------------------------
-def merge_company_group(conn, rows: List[Dict[str, Any]], apply: bool) -> bool:
+def build_merge_statement(fk_refs: List[Tuple[str, str, str]], canonical_id: int, old_ids: List[int],
+                          merged: Dict[str, Any], reason_detail: str) -> Tuple[str, List[Any]]:
+    """
+    The whole merge of one group as a single statement of data-modifying CTEs:
+    update the canonical company, delete facilities that would collide with one the
+    canonical company already has, repoint every FK, snapshot the old companies into
+    deactivated_companies and delete them. All CTEs run against one snapshot and the
+    FK checks happen at the end of the statement, when the old companies no longer
+    have dependents.
+    Returns (sql, params); the statement yields one row:
+    (conflicting facilities as [id, name, city, state] lists, rows repointed per fk_ref,
+    companies moved, companies deleted).
+    """
+    ctes = ["upd AS (UPDATE public.company SET website_url = %s, phone_main = %s, notes = %s "
+            "WHERE company_id = %s RETURNING company_id)"]
+    params: List[Any] = [merged.get("website_url"), merged.get("phone_main"), merged.get("notes"), canonical_id]
+    # facilities matching one the canonical company already has (unique key
+    # company_id, name, city, state) are duplicates: deleted instead of repointed
+    ctes.append("""conflicts AS (
+            DELETE FROM public.facility f1
+            WHERE f1.company_id = ANY(%s)
+            AND EXISTS (
+                SELECT 1 FROM public.facility f2
+                WHERE f2.company_id = %s
+                AND f2.name = f1.name
+                AND COALESCE(f2.city, '') = COALESCE(f1.city, '')
+                AND COALESCE(f2.state, '') = COALESCE(f1.state, '')
+            )
+            RETURNING f1.facility_id, f1.name, f1.city, f1.state
+        )""")
+    params += [old_ids, canonical_id]
+    for i, (fk_schema, fk_table, fk_col) in enumerate(fk_refs):
+        skip = ""
+        if fk_schema == "public" and fk_table == "facility" and fk_col == "company_id":
+            skip = " AND facility_id NOT IN (SELECT facility_id FROM conflicts)"
+        ctes.append(f"rp_{i} AS (UPDATE {fk_schema}.{fk_table} SET {fk_col} = %s "
+                    f"WHERE {fk_col} = ANY(%s){skip} RETURNING 1)")
+        params += [canonical_id, old_ids]
+    ctes.append("""snap AS (
+            INSERT INTO public.deactivated_companies
+                (original_company_id, reason, merged_to_company_id, reason_detail, company_snapshot)
+            SELECT company_id, 'MERGED', %s, %s, to_jsonb(c.*)
+            FROM public.company c
+            WHERE c.company_id = ANY(%s)
+            ON CONFLICT (original_company_id) DO NOTHING
+            RETURNING original_company_id
+        )""")
+    params += [canonical_id, reason_detail, old_ids]
+    ctes.append("gone AS (DELETE FROM public.company WHERE company_id = ANY(%s) RETURNING company_id)")
+    params.append(old_ids)
+
+    repointed = ", ".join(f"(SELECT COUNT(*) FROM rp_{i})" for i in range(len(fk_refs)))
+    with_list = ",\n        ".join(ctes)
+    sql = f"""
+        WITH {with_list}
+        SELECT
+            (SELECT COALESCE(json_agg(json_build_array(facility_id, name, city, state) ORDER BY facility_id), '[]')
+             FROM conflicts),
+            ARRAY[{repointed}]::bigint[],
+            (SELECT COUNT(*) FROM snap),
+            (SELECT COUNT(*) FROM gone)
+    """
+    return sql, params
+
+def merge_company_group(conn, rows: List[Dict[str, Any]], apply: bool,
+                        fk_refs: Optional[List[Tuple[str, str, str]]] = None) -> bool:
     """
     Merge a group of duplicate companies:
     1. Select canonical company (best completeness)
@@ -306,6 +394,9 @@ def merge_company_group(conn, rows: List[Dict[str, Any]], apply: bool) -> bool:
     3. Repoint all FKs from other companies to canonical
     4. Move old companies to deactivated_companies
     5. Delete old companies
+    Steps 2-5 go to the server as one statement (see build_merge_statement);
+    public.deactivated_companies must exist (main creates it).
+    fk_refs: FKs referencing public.company (looked up here if not given)
     
     Returns True if merged, False if skipped
     """
@@ -335,94 +426,24 @@ def merge_company_group(conn, rows: List[Dict[str, Any]], apply: bool) -> bool:
         return False
     
     try:
-        # Step 1: Update canonical company with merged data
         print(f"    Using company_id={canonical_id} as canonical company")
-        sql = """
-            UPDATE public.company
-            SET website_url = %s,
-                phone_main  = %s,
-                notes       = %s
-            WHERE company_id = %s
-        """
-        with conn.cursor() as cur:
-            cur.execute(sql, (merged.get("website_url"), merged.get("phone_main"), merged.get("notes"), canonical_id))
-        
-        # Step 2: Repoint all foreign keys
-        fk_refs = get_fk_references(conn, "public", "company")
-        for fk_schema, fk_table, fk_col in fk_refs:
-            # Special handling for facility table with unique constraint
-            if fk_table == "facility" and fk_col == "company_id":
-                # Check for conflicts
-                conflict_sql = """
-                    SELECT f1.facility_id, f1.name, f1.city, f1.state
-                    FROM public.facility f1
-                    WHERE f1.company_id = ANY(%s)
-                    AND EXISTS (
-                        SELECT 1 FROM public.facility f2
-                        WHERE f2.company_id = %s
-                        AND f2.name = f1.name
-                        AND COALESCE(f2.city, '') = COALESCE(f1.city, '')
-                        AND COALESCE(f2.state, '') = COALESCE(f1.state, '')
-                    )
-                """
-                with conn.cursor() as cur:
-                    cur.execute(conflict_sql, (old_ids, canonical_id))
-                    conflicts = cur.fetchall()
-                    if conflicts:
-                        conflict_ids = [c[0] for c in conflicts]
-                        print(f"    ⚠️  Warning: {len(conflicts)} facilities would violate unique constraint (duplicate facilities), deleting:")
-                        for c in conflicts:
-                            print(f"        facility_id={c[0]}: '{c[1]}', {c[2]}, {c[3]}")
-                        # Delete conflicting facilities (they're duplicates of facilities already on canonical company)
-                        delete_sql = "DELETE FROM public.facility WHERE facility_id = ANY(%s)"
-                        cur.execute(delete_sql, (conflict_ids,))
-                        deleted_count = cur.rowcount
-                        if deleted_count > 0:
-                            print(f"    🗑️  Deleted {deleted_count} duplicate facility record(s)")
-                        # Update non-conflicting facilities
-                        exclude_sql = """
-                            UPDATE public.facility 
-                            SET company_id = %s 
-                            WHERE company_id = ANY(%s) 
-                            AND facility_id != ALL(%s)
-                        """
-                        cur.execute(exclude_sql, (canonical_id, old_ids, conflict_ids))
-                        updated = cur.rowcount
-                        if updated:
-                            print(f"    ✓ Repointed {updated} facilities to canonical company")
-                    else:
-                        updated = repoint_dependents(conn, fk_schema, fk_table, fk_col, old_ids, canonical_id)
-                        if updated:
-                            print(f"    ✓ Repointed {updated} rows in {fk_schema}.{fk_table}.{fk_col}")
-            else:
-                updated = repoint_dependents(conn, fk_schema, fk_table, fk_col, old_ids, canonical_id)
-                if updated:
-                    print(f"    ✓ Repointed {updated} rows in {fk_schema}.{fk_table}.{fk_col}")
-        
-        # After repoint, check which old company_ids still have facilities (couldn't be repointed)
-        remaining_old_ids = []
-        check_sql = "SELECT DISTINCT company_id FROM public.facility WHERE company_id = ANY(%s)"
+        if fk_refs is None:
+            fk_refs = get_fk_references(conn, "public", "company")
+        reason_detail = f"Merged companies {old_ids} into canonical company_id={canonical_id}"
+        sql, params = build_merge_statement(fk_refs, canonical_id, old_ids, merged, reason_detail)
         with conn.cursor() as cur:
-            cur.execute(check_sql, (old_ids,))
-            remaining = cur.fetchall()
-            remaining_old_ids = [r[0] for r in remaining]
-        
-        # Step 3: Move old companies with no remaining facilities to deactivated_companies, then delete them
-        companies_to_deactivate = [oid for oid in old_ids if oid not in remaining_old_ids]
-        if companies_to_deactivate:
-            print(f"    Moving {len(companies_to_deactivate)} old companies to deactivated_companies...")
-            create_deactivated_companies_table(conn)
-            reason_detail = f"Merged companies {companies_to_deactivate} into canonical company_id={canonical_id}"
-            move_to_deactivated(conn, companies_to_deactivate, canonical_id, reason_detail)
-            print(f"    ✓ Moved {len(companies_to_deactivate)} companies to deactivated_companies")
-            
-            # Step 4: Delete old companies that have been moved to deactivated_companies
-            print(f"    Deleting old company records (no remaining facilities)...")
-            deleted = delete_old_companies(conn, companies_to_deactivate)
-            print(f"    ✓ Deleted {deleted} old company records")
+            cur.execute(sql, params)
+            conflicts, repointed, moved, deleted = cur.fetchone()
         
-        if remaining_old_ids:
-            print(f"    ℹ️  {len(remaining_old_ids)} old company record(s) retained (still have facilities: {remaining_old_ids})")
+        if conflicts:
+            print(f"    ⚠️  Warning: {len(conflicts)} facilities would violate unique constraint (duplicate facilities), deleted:")
+            for fid, name, city, state in conflicts:
+                print(f"        facility_id={fid}: '{name}', {city}, {state}")
+        for (fk_schema, fk_table, fk_col), updated in zip(fk_refs, repointed):
+            if updated:
+                print(f"    ✓ Repointed {updated} rows in {fk_schema}.{fk_table}.{fk_col}")
+        print(f"    ✓ Moved {moved} companies to deactivated_companies")
+        print(f"    ✓ Deleted {deleted} old company records")
         
         conn.commit()
         print(f"    ✅ Successfully merged into company_id={canonical_id}")
@@ -446,16 +467,18 @@ def main():
     conn.autocommit = False
 
     try:
-        # Find duplicate companies
-        companies = fetch_companies(conn)
-        comp_groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-        for c in companies:
-            k = normalize_company_name(c.get("name"))
-            if not k:
-                continue
-            comp_groups[k].append(c)
-
-        company_dupe_groups = [g for g in comp_groups.values() if len(g) >= 2]
+        # Find duplicate companies: grouped by Postgres when the name_norm column is
+        # migrated, otherwise every company is normalized and grouped here
+        if "name_norm" in table_columns(conn, "public", "company"):
+            company_dupe_groups = fetch_duplicate_company_groups(conn)
+        else:
+            comp_groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+            for c in fetch_companies(conn):
+                k = normalize_company_name(c.get("name"))
+                if not k:
+                    continue
+                comp_groups[k].append(c)
+            company_dupe_groups = [g for g in comp_groups.values() if len(g) >= 2]
         company_dupe_groups.sort(key=lambda g: (len(g), g[0]["company_id"]), reverse=True)
 
         if args.limit and args.limit > 0:
@@ -464,6 +487,19 @@ def main():
         print(f"\nFound {len(company_dupe_groups)} duplicate company groups")
         print(f"Mode: {'APPLY' if args.apply else 'DRY RUN'}\n")
 
+        # FK references and dependent counts for every group up front; groups are
+        # disjoint, so counts stay accurate as earlier groups merge
+        fk_refs = get_fk_references(conn, "public", "company")
+        all_old_ids = []
+        for group in company_dupe_groups:
+            canonical_id = max(group, key=company_score)["company_id"]
+            all_old_ids.extend(r["company_id"] for r in group if r["company_id"] != canonical_id)
+        counts = precount_dependents(conn, fk_refs, all_old_ids)
+        if args.apply:
+            # once per run; each group's merge statement inserts into it
+            create_deactivated_companies_table(conn)
+            conn.commit()
+
         for i, group in enumerate(company_dupe_groups, start=1):
             # Select canonical company (best completeness)
             canonical = max(group, key=company_score)
@@ -488,10 +524,9 @@ def main():
             print_company_group(i, len(company_dupe_groups), group, canonical_id, merged_display)
 
             # Show what will be repointed
-            fk_refs = get_fk_references(conn, "public", "company")
             print("\nDependents that will be repointed:")
             for fk_schema, fk_table, fk_col in fk_refs:
-                c = count_dependents(conn, fk_schema, fk_table, fk_col, old_ids)
+                c = sum(counts.get((fk_schema, fk_table, fk_col, oid), 0) for oid in old_ids)
                 if c:
                     print(f"  - {c} rows in {fk_schema}.{fk_table}.{fk_col}")
 
@@ -500,7 +535,7 @@ def main():
                 print("    skipped.\n")
                 continue
 
-            merge_company_group(conn, group, apply=args.apply)
+            merge_company_group(conn, group, apply=args.apply, fk_refs=fk_refs)
             print()
 
         print("\nAll done.")
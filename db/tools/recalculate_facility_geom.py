@@ -7,6 +7,7 @@ Behavior:
 - Updates geom using ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)
 - Skips facilities where geom already matches lat/lon (unless --overwrite)
 - Supports filtering and limiting
+- Applies all updates as one set-based UPDATE and commit (--verbose lists each facility)
 
 DB config:
 - Loaded from .env via python-dotenv using:
@@ -20,7 +21,7 @@ Safety:
 
 import os
 import argparse
-from typing import List, Dict, Any, Optional
+from typing import Iterator, List, Dict, Any, Optional
 
 import psycopg2
 import psycopg2.extras
@@ -32,6 +33,10 @@ load_dotenv()
 # DB helpers
 # ----------------------------
 
+# Rows per round-trip when streaming facilities from a server-side cursor
+FETCH_ITERSIZE = 2000
+
+
 def db_connect():
     """
     Uses .env variables:
@@ -57,13 +62,14 @@ def db_connect():
     )
 
 
-def fetch_facilities(conn, limit: int, where_sql: Optional[str] = None) -> List[Dict[str, Any]]:
+def target_where(where_sql: Optional[str] = None, overwrite: bool = False) -> str:
     """
-    Fetch facilities that need geom recalculation.
+    WHERE predicate for the facilities to recalculate: every facility with lat/lon
+    when overwrite, otherwise only those with missing or mismatched geom.
     """
-    base_where = """
-        latitude IS NOT NULL 
-        AND longitude IS NOT NULL
+    base_where = "latitude IS NOT NULL AND longitude IS NOT NULL"
+    if not overwrite:
+        base_where += """
         AND (
             geom IS NULL 
             OR ABS(ST_X(geom) - longitude::DOUBLE PRECISION) > 0.000001
@@ -72,10 +78,17 @@ def fetch_facilities(conn, limit: int, where_sql: Optional[str] = None) -> List[
     """
     
     if where_sql:
-        where_clause = f"{base_where} AND ({where_sql})"
-    else:
-        where_clause = base_where
-    
+        return f"{base_where} AND ({where_sql})"
+    return base_where
+
+
+def fetch_facilities(conn, limit: Optional[int], where_sql: Optional[str] = None,
+                     overwrite: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Stream facilities that need geom recalculation (limit None = all) through a
+    server-side cursor, FETCH_ITERSIZE rows per round-trip.
+    """
+    issue_type = "'OVERWRITE'" if overwrite else "CASE WHEN geom IS NULL THEN 'MISSING' ELSE 'MISMATCH' END"
     sql = f"""
         SELECT
             facility_id,
@@ -84,35 +97,62 @@ def fetch_facilities(conn, limit: int, where_sql: Optional[str] = None) -> List[
             state,
             latitude,
             longitude,
-            geom,
-            CASE 
-                WHEN geom IS NULL THEN 'MISSING'
-                ELSE 'MISMATCH'
-            END as issue_type
+            {issue_type} as issue_type
         FROM public.facility
-        WHERE {where_clause}
+        WHERE {target_where(where_sql, overwrite)}
         ORDER BY facility_id
         LIMIT %s
     """
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+    with conn.cursor(name="fetch_facilities_cur", cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.itersize = FETCH_ITERSIZE
+        cur.execute(sql, (limit,))
+        yield from cur
+
+
+def count_target_facilities(conn, limit: Optional[int], where_sql: Optional[str] = None,
+                            overwrite: bool = False) -> int:
+    """
+    Number of facilities fetch_facilities would return, counted in the database.
+    """
+    sql = f"""
+        SELECT COUNT(*)
+        FROM (
+            SELECT 1
+            FROM public.facility
+            WHERE {target_where(where_sql, overwrite)}
+            LIMIT %s
+        ) t
+    """
+    with conn.cursor() as cur:
         cur.execute(sql, (limit,))
-        return list(cur.fetchall())
+        return int(cur.fetchone()[0])
 
 
-def update_facility_geom(conn, facility_id: int, latitude: float, longitude: float):
+def update_facility_geoms(conn, limit: Optional[int], where_sql: Optional[str] = None,
+                          overwrite: bool = False) -> int:
     """
-    Update facility geom from lat/lon.
+    Update geom from lat/lon for the same facilities fetch_facilities returns, in one
+    set-based UPDATE (planned once, one commit by the caller). Returns rows updated.
     """
-    sql = """
-        UPDATE public.facility
+    sql = f"""
+        WITH targets AS (
+            SELECT facility_id
+            FROM public.facility
+            WHERE {target_where(where_sql, overwrite)}
+            ORDER BY facility_id
+            LIMIT %s
+        )
+        UPDATE public.facility f
         SET geom = ST_SetSRID(
-            ST_MakePoint(%s::DOUBLE PRECISION, %s::DOUBLE PRECISION),
+            ST_MakePoint(f.longitude::DOUBLE PRECISION, f.latitude::DOUBLE PRECISION),
             4326
         )
-        WHERE facility_id = %s
+        FROM targets t
+        WHERE f.facility_id = t.facility_id
     """
     with conn.cursor() as cur:
-        cur.execute(sql, (longitude, latitude, facility_id))
+        cur.execute(sql, (limit,))
+        return cur.rowcount
 
 
 def count_total_facilities(conn, where_sql: Optional[str] = None) -> Dict[str, int]:
@@ -172,6 +212,11 @@ def main():
         action="store_true",
         help="Overwrite geom even if it matches lat/lon (processes all facilities with lat/lon)"
     )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="List every facility to update (the default only prints counts)"
+    )
     args = parser.parse_args()
 
     conn = db_connect()
@@ -190,82 +235,46 @@ def main():
         
         if args.overwrite:
             print(f"\n⚠️  --overwrite mode: Will update all {stats['total']} facilities with lat/lon")
-            # Adjust WHERE clause to include all facilities with lat/lon
-            overwrite_where = "latitude IS NOT NULL AND longitude IS NOT NULL"
-            if args.where:
-                combined_where = f"{overwrite_where} AND ({args.where})"
-            else:
-                combined_where = overwrite_where
-            
-            # Fetch all facilities with lat/lon (respecting limit and where)
-            sql = f"""
-                SELECT
-                    facility_id,
-                    name,
-                    city,
-                    state,
-                    latitude,
-                    longitude,
-                    geom,
-                    'OVERWRITE' as issue_type
-                FROM public.facility
-                WHERE {combined_where}
-                ORDER BY facility_id
-            """
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                if args.limit > 0:
-                    sql += " LIMIT %s"
-                    cur.execute(sql, (args.limit,))
-                else:
-                    cur.execute(sql)
-                facilities = list(cur.fetchall())
-        else:
-            # Normal mode: only facilities with missing/mismatched geom
-            limit = args.limit if args.limit > 0 else 999999
-            facilities = fetch_facilities(conn, limit, args.where)
         
-        if not facilities:
-            print("\n✅ No facilities need geom recalculation.")
-            return
+        # LIMIT NULL means no limit
+        limit = args.limit if args.limit > 0 else None
         
-        print(f"\nProcessing {len(facilities)} facility/facilities...")
+        # The update itself is one statement; rows are only counted or streamed to list them
+        total = None
+        if args.verbose or not args.apply:
+            total = count_target_facilities(conn, limit, args.where, args.overwrite)
+            
+            if not total:
+                print("\n✅ No facilities need geom recalculation.")
+                return
+            
+            print(f"\nProcessing {total} facility/facilities...")
         
         if not args.apply:
             print("\n🔍 DRY RUN mode - no changes will be made")
             print("Re-run with --apply to execute changes\n")
         
-        updated = 0
-        skipped = 0
-        errors = 0
+        if args.verbose:
+            for i, facility in enumerate(fetch_facilities(conn, limit, args.where, args.overwrite), start=1):
+                city = facility.get("city") or ""
+                state = facility.get("state") or ""
+                
+                print(f"\n[{i}/{total}] facility_id={facility['facility_id']}: {facility['name']}")
+                if city or state:
+                    print(f"  Location: {city}, {state}")
+                print(f"  Coordinates: {float(facility['latitude'])}, {float(facility['longitude'])}")
+                print(f"  Issue: {facility['issue_type']}")
         
-        for i, facility in enumerate(facilities, start=1):
-            fid = facility["facility_id"]
-            name = facility["name"]
-            city = facility.get("city") or ""
-            state = facility.get("state") or ""
-            lat = float(facility["latitude"])
-            lon = float(facility["longitude"])
-            issue = facility["issue_type"]
-            
-            print(f"\n[{i}/{len(facilities)}] facility_id={fid}: {name}")
-            if city or state:
-                print(f"  Location: {city}, {state}")
-            print(f"  Coordinates: {lat}, {lon}")
-            print(f"  Issue: {issue}")
-            
-            if args.apply:
-                try:
-                    update_facility_geom(conn, fid, lat, lon)
-                    conn.commit()
-                    print(f"  ✅ Updated geom successfully")
-                    updated += 1
-                except Exception as e:
-                    conn.rollback()
-                    print(f"  ❌ Error: {e}")
-                    errors += 1
-            else:
-                print(f"  [DRY RUN] Would update geom")
-                updated += 1
+        errors = 0
+        if args.apply:
+            try:
+                updated = update_facility_geoms(conn, limit, args.where, args.overwrite)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"\n❌ Error: {e}")
+                updated = 0
+                errors = 1
         
         # Summary
         print("\n" + "=" * 60)
@@ -275,7 +284,7 @@ def main():
             if errors > 0:
                 print(f"  Errors: {errors}")
         else:
-            print(f"  Would update: {updated}")
+            print(f"  Would update: {total}")
             print("  (Run with --apply to execute)")
         
         if not args.apply:
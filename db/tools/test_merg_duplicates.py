@@ -9,6 +9,7 @@ Run with: python3 test_merg_duplicates.py
 import os
 import sys
 import unittest
+from collections import defaultdict
 from unittest.mock import Mock, patch, MagicMock
 
 # Add parent directory to path to import merg_duplicates
@@ -95,6 +96,8 @@ class TestNormalization(unittest.TestCase):
         self.assertEqual(md.combine_text(None, "b"), "b")
         self.assertEqual(md.combine_text("a", "a"), "a")
         self.assertIsNone(md.combine_text(None, None))
+        self.assertEqual(md.combine_texts(["Grain", "Feed", "grain and feed", "FEED"]), "grain and feed")
+        self.assertEqual(md.combine_texts(["a", "b", "c"]), "a\n\n---\n\nb\n\n---\n\nc")
 
 
 class TestDatabaseHelpers(unittest.TestCase):
@@ -106,6 +109,8 @@ class TestDatabaseHelpers(unittest.TestCase):
         self.mock_cursor = MagicMock()
         self.mock_conn.cursor.return_value.__enter__.return_value = self.mock_cursor
         self.mock_conn.cursor.return_value.__exit__.return_value = None
+        md.clear_meta_cache()
+        md._PROJECTED_CACHE.clear()
 
     def test_table_exists(self):
         """Test table existence check"""
@@ -125,6 +130,18 @@ class TestDatabaseHelpers(unittest.TestCase):
         self.assertIn("name", cols)
         self.assertIn("status", cols)
         self.assertEqual(len(cols), 3)
+        
+        # Columns are looked up once per table for the run
+        md.table_columns(self.mock_conn, "public", "facility")
+        self.assertEqual(self.mock_cursor.execute.call_count, 1)
+
+    def test_prefetch_table_columns(self):
+        """Test one query fills the column and existence caches for several tables"""
+        self.mock_cursor.fetchall.return_value = [("facility", "facility_id"), ("facility", "name")]
+        md.prefetch_table_columns(self.mock_conn, "public", ["facility", "deactivated_facilities"])
+        self.assertEqual(md.table_columns(self.mock_conn, "public", "facility"), {"facility_id", "name"})
+        self.assertTrue(md.table_exists(self.mock_conn, "public", "facility"))
+        self.assertEqual(self.mock_cursor.execute.call_count, 1)
 
     def test_get_fk_references(self):
         """Test foreign key discovery"""
@@ -135,11 +152,258 @@ class TestDatabaseHelpers(unittest.TestCase):
         fks = md.get_fk_references(self.mock_conn, "public", "facility")
         self.assertEqual(len(fks), 2)
         self.assertEqual(fks[0], ("public", "facility_contact", "facility_id"))
+        
+        # Second lookup for the same table is served from the cache
+        self.assertEqual(md.get_fk_references(self.mock_conn, "public", "facility"), fks)
+        self.assertEqual(self.mock_cursor.execute.call_count, 1)
+
+    def test_fetch_facilities_by_company_returns_plain_dicts(self):
+        """Test fetched rows are plain dicts keyed by column name"""
+        md._META_CACHE[("columns", "public", "facility")] = {"facility_id", "company_id", "name"}
+        self.mock_cursor.__iter__.return_value = iter([(1, 7, "A"), (2, 7, "B")])
+        self.mock_cursor.description = [("facility_id",), ("company_id",), ("name",)]
+        rows = md.fetch_facilities_by_company(self.mock_conn, [7])
+        self.assertEqual(rows, [{"facility_id": 1, "company_id": 7, "name": "A"},
+                                {"facility_id": 2, "company_id": 7, "name": "B"}])
+        self.assertIs(type(rows[0]), dict)
+
+    @patch('merg_duplicates.insert_new_facility', return_value=1)
+    def test_apply_facility_merge_updates_only_changed_columns(self, mock_insert):
+        """Test merging into an existing group member updates only the columns that differ"""
+        md._META_CACHE[("columns", "public", "facility")] = {"facility_id", "company_id", "name", "notes", "phone_main"}
+        md._META_CACHE[("fk_refs", "public", "facility")] = []
+        md._META_CACHE[("exists", "public", "deactivated_facilities")] = False
+        rows = [{"facility_id": 1, "company_id": 7, "name": "A", "notes": "n", "phone_main": None},
+                {"facility_id": 2, "company_id": 7, "name": "A", "notes": None, "phone_main": "555"}]
+        proposed = {"company_id": 7, "name": "A", "notes": "n", "phone_main": "555"}
+
+        md.apply_facility_merge(self.mock_conn, rows, proposed, apply=True)
+        update_sql, vals = self.mock_cursor.execute.call_args_list[0][0]
+        self.assertIn("SET phone_main = %s WHERE", update_sql)
+        self.assertEqual(vals, ["555", 1])
+
+        self.mock_cursor.reset_mock()
+        rows[0]["phone_main"] = "555"
+        md.apply_facility_merge(self.mock_conn, rows, proposed, apply=True)
+        self.assertFalse(any("UPDATE public.facility SET" in c[0][0] and "phone_main" in c[0][0]
+                             for c in self.mock_cursor.execute.call_args_list))
+
+    @patch('merg_duplicates.repoint_children')
+    @patch('merg_duplicates.insert_new_facility', return_value=9)
+    def test_apply_facility_merge_repoints_children_in_its_transaction(self, mock_insert, mock_repoint):
+        """Test children move before the group's commit, and a failing repoint rolls back only that group"""
+        fk_refs = [("public", "facility_service", "facility_id")]
+        md._META_CACHE[("fk_refs", "public", "facility")] = fk_refs
+        md._META_CACHE[("exists", "public", "deactivated_facilities")] = False
+        rows = [{"facility_id": 1, "name": "A"}, {"facility_id": 2, "name": "A"}]
+        committed_at_repoint = []
+        mock_repoint.side_effect = lambda conn, refs, old, new: committed_at_repoint.append(conn.commit.called) or []
+
+        md.apply_facility_merge(self.mock_conn, rows, {"name": "A"}, apply=True)
+        mock_repoint.assert_called_once_with(self.mock_conn, fk_refs, [1, 2], 9)
+        self.assertEqual(committed_at_repoint, [False])
+        self.mock_conn.commit.assert_called_once()
+
+        self.mock_conn.reset_mock()
+        mock_repoint.side_effect = Exception("duplicate key value violates unique constraint")
+        with self.assertRaises(Exception):
+            md.apply_facility_merge(self.mock_conn, rows, {"name": "A"}, apply=True)
+        self.mock_conn.commit.assert_not_called()
+        self.mock_conn.rollback.assert_called_once()
+
+    def test_precount_dependents(self):
+        """Test dependent counts come from one grouped query per FK column"""
+        self.mock_cursor.fetchall.return_value = [(1, 3), (4, 2)]
+        fk_refs = [("public", "facility_contact", "facility_id")]
+        counts = md.precount_dependents(self.mock_conn, fk_refs, [1, 2, 4])
+        self.assertEqual(self.mock_cursor.execute.call_count, 1)
+        self.assertEqual(md.dependents_for(self.mock_conn, counts, *fk_refs[0], [1, 2]), 3)
+        self.assertEqual(md.dependents_for(self.mock_conn, counts, *fk_refs[0], [2]), 0)
+        self.assertEqual(self.mock_cursor.execute.call_count, 1)
+
+    def test_count_dependents_single_round_trip(self):
+        """Test uncached dependent counts for every FK column come from one UNION ALL query"""
+        self.mock_cursor.fetchall.return_value = [(0, 3), (1, 0)]
+        fk_refs = [("public", "facility_contact", "facility_id"), ("public", "facility_service", "facility_id")]
+        planned = md.dependents_by_ref(self.mock_conn, None, fk_refs, [1, 2])
+        self.assertEqual(planned, {fk_refs[0]: 3, fk_refs[1]: 0})
+        self.assertEqual(self.mock_cursor.execute.call_count, 1)
+        sql, params = self.mock_cursor.execute.call_args[0]
+        self.assertEqual(sql.count("UNION ALL"), 1)
+        self.assertEqual(params, [[1, 2], [1, 2]])
+
+    def test_repoint_children_one_statement_per_group(self):
+        """Test a group's child repoints for every FK column go out as one statement"""
+        fk_refs = [("public", "facility_contact", "facility_id"), ("public", "facility_service", "facility_id")]
+        self.mock_cursor.fetchone.return_value = (2, 0)
+        results = md.repoint_children(self.mock_conn, fk_refs, [1, 2], 9)
+        self.assertEqual(results, [(fk_refs[0], 2), (fk_refs[1], 0)])
+        self.assertEqual(self.mock_cursor.execute.call_count, 1)
+        sql, params = self.mock_cursor.execute.call_args[0]
+        self.assertEqual(sql.count("UPDATE"), 2)
+        self.assertEqual(params, (9, [1, 2], 9, [1, 2]))
+
+    def test_repoint_facilities_skips_conflicts_in_one_statement(self):
+        """Test company repoint of facilities reports moved count and skipped rows from one query"""
+        self.mock_cursor.fetchall.return_value = [(2, 11, "Elevator", "Salina", "KS")]
+        moved = md.repoint_dependents(self.mock_conn, "public", "facility", "company_id", [3, 4], 7)
+        self.assertEqual(moved, 2)
+        self.assertEqual(self.mock_cursor.execute.call_count, 1)
+        self.assertIn("NOT EXISTS", self.mock_cursor.execute.call_args[0][0])
+
+    @patch('merg_duplicates.get_deactivated_companies_table', return_value=None)
+    @patch('merg_duplicates.get_fk_references')
+    def test_apply_company_merge_batches_statements(self, mock_fk_refs, mock_deact):
+        """Test every non-facility FK is repointed (even with a zero precount) and reported by real count"""
+        mock_fk_refs.return_value = [("public", "facility", "company_id"), ("public", "company_alias", "company_id"),
+                                     ("public", "company_contact", "company_id")]
+        counts = {("public", "facility", "company_id", 2): 1, ("public", "company_alias", "company_id", 2): 3}
+        self.mock_cursor.fetchall.side_effect = [[(1, None, None, None, None)], []]
+        self.mock_cursor.fetchone.side_effect = [(4, 2), (0, 1)]
+        proposed = {"company_id": 1, "website_url": None, "phone_main": None, "notes": None}
+
+        with patch('builtins.print') as mock_print:
+            remaining = md.apply_company_merge(self.mock_conn, proposed, [1, 2], apply=True, counts=counts)
+        self.assertEqual(remaining, [])
+        # facility repoint, other FK repoints, canonical update + leftover check, archive/delete
+        self.assertEqual(self.mock_cursor.execute.call_count, 4)
+        repoint_sql = self.mock_cursor.execute.call_args_list[1][0][0]
+        self.assertIn("UPDATE public.company_alias", repoint_sql)
+        self.assertIn("UPDATE public.company_contact", repoint_sql)
+        batch_sql, batch_params = self.mock_cursor.execute.call_args_list[2][0]
+        self.assertIn("UPDATE public.company", batch_sql)
+        self.assertEqual(batch_params[-1], [2])
+        printed = " ".join(str(c[0][0]) for c in mock_print.call_args_list)
+        self.assertIn("repointed 4 rows in public.company_alias.company_id", printed)
+        self.assertIn("repointed 2 rows in public.company_contact.company_id", printed)
+        self.mock_conn.commit.assert_called_once()
+
+    @patch('merg_duplicates.get_fk_references')
+    def test_apply_company_merge_rolls_back_on_failure(self, mock_fk_refs):
+        """Test a failing repoint rolls back the whole company merge and re-raises"""
+        mock_fk_refs.return_value = [("public", "company_alias", "company_id")]
+        self.mock_cursor.execute.side_effect = Exception("unique violation")
+        proposed = {"company_id": 1}
+
+        with self.assertRaises(Exception):
+            md.apply_company_merge(self.mock_conn, proposed, [1, 2], apply=True,
+                                   counts={("public", "company_alias", "company_id", 2): 1})
+        self.mock_conn.rollback.assert_called_once()
+        self.mock_conn.commit.assert_not_called()
+
+    @patch('merg_duplicates.apply_facility_merge')
+    @patch('merg_duplicates.db_connect')
+    def test_apply_facility_merges_parallel_keeps_company_on_one_worker(self, mock_connect, mock_apply):
+        """Test approved merges are split across worker connections by company"""
+        conns = []
+        def connect():
+            c = MagicMock()
+            conns.append(c)
+            return c
+        mock_connect.side_effect = connect
+        approved = [([{"facility_id": i}], {"company_id": cid}) for i, cid in [(1, 7), (2, 7), (3, 8)]]
+
+        self.assertEqual(md.apply_facility_merges_parallel(approved, workers=4), 3)
+        self.assertEqual(len(conns), 2)
+        per_conn = defaultdict(set)
+        for call in mock_apply.call_args_list:
+            per_conn[id(call[0][0])].add(call[0][2]["company_id"])
+        self.assertEqual(sorted(sorted(v) for v in per_conn.values()), [[7], [8]])
+        for c in conns:
+            c.close.assert_called_once()
+
+    @patch('merg_duplicates.apply_facility_merge')
+    @patch('merg_duplicates.db_connect')
+    def test_apply_facility_merges_parallel_reports_worker_failures(self, mock_connect, mock_apply):
+        """Test failed merges and a worker that cannot connect are reported, not raised"""
+        conn = MagicMock()
+        mock_connect.return_value = conn
+        mock_apply.side_effect = lambda c, group, *a, **k: group[0]["facility_id"] == 2 and 1 / 0
+        approved = [([{"facility_id": i}], {"company_id": cid}) for i, cid in [(1, 7), (2, 7), (3, 8)]]
+
+        self.assertEqual(md.apply_facility_merges_parallel(approved, workers=1), 2)
+        conn.rollback.assert_called_once()
+        conn.close.assert_called_once()
+
+        mock_connect.side_effect = Exception("too many connections")
+        self.assertEqual(md.apply_facility_merges_parallel(approved, workers=2), 0)
+
+    @patch('merg_duplicates.apply_company_merge')
+    @patch('merg_duplicates.db_connect')
+    def test_apply_company_merges_parallel_returns_input_order(self, mock_connect, mock_apply):
+        """Test auto-accepted company merges run on worker connections and report per group"""
+        mock_connect.side_effect = lambda: MagicMock()
+        def merge(conn, proposed, ids, apply, counts=None, leftover_facilities=None):
+            leftover_facilities.add(ids[-1] * 10)
+            return ids[1:]
+        mock_apply.side_effect = merge
+        merges = [({"company_id": a}, [a, b]) for a, b in [(1, 2), (3, 4), (5, 6)]]
+
+        results = md.apply_company_merges_parallel(merges, workers=2)
+        self.assertEqual(mock_connect.call_count, 2)
+        self.assertEqual([(p["company_id"], rem, stuck) for p, _, rem, stuck in results],
+                         [(1, [2], {20}), (3, [4], {40}), (5, [6], {60})])
+
+    @patch('merg_duplicates.apply_company_merge')
+    @patch('merg_duplicates.db_connect')
+    def test_apply_company_merges_parallel_skips_failed_merges(self, mock_connect, mock_apply):
+        """Test a failed company merge is rolled back and dropped while the rest still apply"""
+        conn = MagicMock()
+        mock_connect.return_value = conn
+        def merge(conn, proposed, ids, apply, counts=None, leftover_facilities=None):
+            if ids[0] == 3:
+                raise Exception("deadlock detected")
+            return []
+        mock_apply.side_effect = merge
+        merges = [({"company_id": a}, [a, b]) for a, b in [(1, 2), (3, 4), (5, 6)]]
+
+        results = md.apply_company_merges_parallel(merges, workers=1)
+        self.assertEqual([ids for _, ids, _, _ in results], [[1, 2], [5, 6]])
+        conn.rollback.assert_called_once()
+        conn.close.assert_called_once()
+
+        mock_connect.side_effect = Exception("too many connections")
+        self.assertEqual(md.apply_company_merges_parallel(merges, workers=2), [])
+
+    def test_link_company_groups_unions_similar_names(self):
+        """Test trigram pairs join name-key groups transitively and ignore unknown ids"""
+        comp_groups = {
+            "acme grain": [{"company_id": 1}],
+            "acme grains": [{"company_id": 4}],
+            "acme grain coop": [{"company_id": 2}, {"company_id": 3}],
+            "beta": [{"company_id": 5}],
+        }
+        keys = {1: "acme grain", 2: "acme grain coop", 3: "acme grain coop", 4: "acme grains", 5: "beta"}
+        linked = md.link_company_groups(comp_groups, keys, [(1, 4), (4, 2), (5, 99)])
+        groups = sorted([r["company_id"] for r in g] for g in linked.values())
+        self.assertEqual(groups, [[1, 2, 3, 4], [5]])
+
+    def test_build_facility_groups_splits_by_distance(self):
+        """Test same-address facilities are split by projected distance, with one geom query"""
+        self.mock_cursor.fetchall.return_value = [(1, 0.0, 0.0), (2, 100.0, 0.0), (3, 1000.0, 0.0)]
+        rows = [
+            {"facility_id": i, "company_id": 7, "address_line1": "1 Main St",
+             "city": "Topeka", "state": "KS", "postal_code": "66601", "has_geom": True}
+            for i in (1, 2, 3)
+        ]
+        groups = md.build_facility_groups(self.mock_conn, rows, max_meters=250.0)
+        self.assertEqual([[r["facility_id"] for r in g] for g in groups], [[1, 2]])
+        self.assertEqual(self.mock_cursor.execute.call_count, 1)
+        
+        # Facilities already projected this run aren't queried again
+        md.build_facility_groups(self.mock_conn, rows, max_meters=250.0)
+        self.assertEqual(self.mock_cursor.execute.call_count, 1)
 
 
 class TestProposalFunctions(unittest.TestCase):
     """Test merge proposal functions"""
 
+    def test_combine_facility_groups(self):
+        """Test unique-key groups overlapping an address group are dropped, first group wins"""
+        g = lambda *ids: [{"facility_id": i} for i in ids]
+        combined = md.combine_facility_groups([g(1, 2), g(2, 3), g(4, 5)], [g(2, 6), g(7, 8)])
+        self.assertEqual([[r["facility_id"] for r in grp] for grp in combined], [[1, 2], [4, 5], [7, 8]])
+
     def test_propose_company_canonical(self):
         """Test company merge proposal"""
         companies = [
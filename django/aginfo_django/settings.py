@@ -1,6 +1,7 @@
 """
 Django settings for aginfo_django project.
 """
+import functools
 import os
 from pathlib import Path
 
@@ -104,26 +105,33 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # GeoDjango settings
-# Auto-detect GDAL library path if not set or path doesn't exist
-GDAL_LIBRARY_PATH = os.environ.get('GDAL_LIBRARY_PATH')
-if not GDAL_LIBRARY_PATH or not os.path.exists(GDAL_LIBRARY_PATH):
+@functools.cache
+def _find_lib(env_var, candidates):
+    """Return the library path from env_var if it exists, else the first candidate found.
+
+    The result is exported back into the environment so child processes
+    (runserver reloader, gunicorn workers, management subprocesses) reuse it
+    with a single stat instead of probing every candidate again.
+    """
+    path = os.environ.get(env_var)
+    if path and os.path.exists(path):
+        return path
     # Try common locations
-    for path in ['/usr/lib/x86_64-linux-gnu/libgdal.so', '/usr/lib/libgdal.so']:
+    for path in candidates:
         if os.path.exists(path):
-            GDAL_LIBRARY_PATH = path
-            break
-    else:
-        GDAL_LIBRARY_PATH = None
-
-GEOS_LIBRARY_PATH = os.environ.get('GEOS_LIBRARY_PATH')
-if not GEOS_LIBRARY_PATH or not os.path.exists(GEOS_LIBRARY_PATH):
-    # Try common locations
-    for path in ['/usr/lib/x86_64-linux-gnu/libgeos_c.so', '/usr/lib/libgeos_c.so']:
-        if os.path.exists(path):
-            GEOS_LIBRARY_PATH = path
-            break
-    else:
-        GEOS_LIBRARY_PATH = None
+            os.environ[env_var] = path
+            return path
+    return None
+
+
+GDAL_LIBRARY_PATH = _find_lib(
+    'GDAL_LIBRARY_PATH',
+    ('/usr/lib/x86_64-linux-gnu/libgdal.so', '/usr/lib/libgdal.so'),
+)
+GEOS_LIBRARY_PATH = _find_lib(
+    'GEOS_LIBRARY_PATH',
+    ('/usr/lib/x86_64-linux-gnu/libgeos_c.so', '/usr/lib/libgeos_c.so'),
+)
 
 # Admin site customization
 ADMIN_SITE_HEADER = 'AgInfo Administration'